@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+'''Benchmarks for pyrubberband
+
+To be run with `asv <https://asv.readthedocs.io>`_::
+
+    $ asv run
+    $ asv compare <commit> <commit>
+
+If the `rubberband` utility is not installed, or if the environment variable
+`PYRUBBERBAND_BENCH_FAKE` is set, a deterministic fake (`fake_rubberband.py`)
+is used in its place.  The fake reproduces output lengths but not
+audio quality, so it measures pyrubberband's own overhead rather than the
+cost of the signal processing.
+'''
+
+import asyncio
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+import pyrubberband
+
+
+FAKE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    'fake_rubberband.py')
+
+OPERATIONS = ['time_stretch', 'pitch_shift', 'timemap_stretch']
+
+
+def use_rubberband(tmpdir):
+    '''Point pyrubberband at the real rubberband, or the fake'''
+    if (not os.environ.get('PYRUBBERBAND_BENCH_FAKE') and
+            shutil.which('rubberband') is not None):
+        pyrubberband.set_executable('rubberband')
+        return
+
+    # Run the fake with this interpreter, whatever is first on the PATH
+    wrapper = os.path.join(tmpdir, 'rubberband')
+    with open(wrapper, 'w') as fdesc:
+        fdesc.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(
+            sys.executable, FAKE))
+    os.chmod(wrapper, os.stat(wrapper).st_mode | stat.S_IEXEC)
+    pyrubberband.set_executable(wrapper)
+
+
+def make_signal(duration, channels, sr, dtype):
+    n = int(duration * sr)
+    shape = (n,) if channels is None else (n, channels)
+    y = np.random.RandomState(0).uniform(-0.5, 0.5, size=shape)
+    return y.astype(dtype)
+
+
+def make_call(operation, y, sr):
+    '''A zero-argument function applying `operation` to `y`'''
+    n = len(y)
+    if operation == 'time_stretch':
+        return lambda: pyrubberband.time_stretch(y, sr, 1.5)
+    if operation == 'pitch_shift':
+        return lambda: pyrubberband.pitch_shift(y, sr, 2)
+    time_map = [(0, 0), (n // 4, n // 4), ((3 * n) // 4, n // 2),
+                (n, (3 * n) // 4)]
+    return lambda: pyrubberband.timemap_stretch(y, sr, time_map)
+
+
+class _Rubberband(object):
+    '''Common setup: a scratch directory and the rubberband to use'''
+    timeout = 300
+
+    def _setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        use_rubberband(self.tmpdir)
+
+    def teardown(self, *args):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class Operations(_Rubberband):
+    '''Latency, memory and time breakdown of the single-signal functions'''
+    params = [OPERATIONS, [1, 10], [None, 1, 2, 6], [22050, 44100],
+              ['float32', 'float64']]
+    param_names = ['operation', 'duration', 'channels', 'sr', 'dtype']
+
+    def setup(self, operation, duration, channels, sr, dtype):
+        self._setup()
+        self.y = make_signal(duration, channels, sr, dtype)
+        self.sr = sr
+        self.call = make_call(operation, self.y, sr)
+
+    def time_call(self, *args):
+        self.call()
+
+    def peakmem_call(self, *args):
+        self.call()
+
+    def track_child_peak_rss(self, *args):
+        '''Peak resident set size of the rubberband process, in kilobytes'''
+        events = []
+        with pyrubberband.instrument.hooks(events.append):
+            self.call()
+        # Only the measured call: not setup, probes or earlier calls
+        return max((e.max_rss for e in events if e.max_rss is not None),
+                   default=None)
+
+    track_child_peak_rss.unit = 'kB'
+
+    def _phases(self):
+        histogram = pyrubberband.instrument.PhaseHistogram()
+        with pyrubberband.instrument.hooks(histogram):
+            self.call()
+        return {phase: stats['total']
+                for (_, phase), stats in histogram.summary().items()}
+
+    def track_file_io_seconds(self, *args):
+        '''Time spent encoding and decoding audio in one call'''
+        phases = self._phases()
+        return phases.get('write', 0.0) + phases.get('read', 0.0)
+
+    track_file_io_seconds.unit = 'seconds'
+
+    def track_subprocess_seconds(self, *args):
+        '''Time spent starting and waiting for rubberband in one call'''
+        phases = self._phases()
+        return phases.get('spawn', 0.0) + phases.get('process', 0.0)
+
+    track_subprocess_seconds.unit = 'seconds'
+
+
+class Transport(_Rubberband):
+    '''Temporary files versus pipes'''
+    params = [['tempfile', 'pipe'], [1, 10]]
+    param_names = ['transport', 'duration']
+
+    def setup(self, transport, duration):
+        self._setup()
+        self.y = make_signal(duration, 2, 44100, 'float32')
+        pyrubberband.set_transport(transport)
+
+    def teardown(self, *args):
+        pyrubberband.set_transport('tempfile')
+        super(Transport, self).teardown()
+
+    def time_pitch_shift(self, *args):
+        pyrubberband.pitch_shift(self.y, 44100, 2)
+
+
+class Batch(_Rubberband):
+    '''Throughput of the batch functions'''
+    params = [[1, 2, 4, 8]]
+    param_names = ['n_jobs']
+
+    def setup(self, n_jobs):
+        self._setup()
+        self.ys = [make_signal(1, None, 22050, 'float32')] * 32
+
+    def time_batch_pitch_shift(self, n_jobs):
+        pyrubberband.batch_pitch_shift(self.ys, 22050, 2, n_jobs=n_jobs)
+
+    def time_aio_pitch_shift(self, n_jobs):
+        async def __main():
+            semaphore = asyncio.Semaphore(n_jobs)
+            await asyncio.gather(
+                *[pyrubberband.aio.pitch_shift(y, 22050, 2,
+                                               semaphore=semaphore)
+                  for y in self.ys])
+        asyncio.run(__main())
+
+
+class Stream(_Rubberband):
+    '''Block-wise processing of a long signal'''
+    params = [[2**12, 2**16]]
+    param_names = ['block_size']
+
+    def setup(self, block_size):
+        self._setup()
+        self.y = make_signal(60, 2, 44100, 'float32')
+        self.path = os.path.join(self.tmpdir, 'long.wav')
+        sf.write(self.path, self.y, 44100)
+
+    def time_stream(self, block_size):
+        for _ in pyrubberband.time_stretch_stream(self.path, None, 1.5,
+                                                  block_size=block_size):
+            pass
+
+    def peakmem_stream(self, block_size):
+        for _ in pyrubberband.time_stretch_stream(self.path, None, 1.5,
+                                                  block_size=block_size):
+            pass
+
+    def time_file(self, block_size):
+        pyrubberband.time_stretch_file(self.path,
+                                       os.path.join(self.tmpdir, 'out.wav'),
+                                       1.5)
+
+
+class Backends(_Rubberband):
+    '''The command-line utility, the library, and the fast phase vocoder
+
+    The fast backend trades quality for latency: see
+    `pyrubberband.set_backend`.  With the fake `rubberband`, the `cli`
+    timings only measure process and file overhead, which is the floor
+    of its latency.
+    '''
+    params = [['cli', 'library', 'fast'], OPERATIONS, [0.5, 5], [1, 2]]
+    param_names = ['backend', 'operation', 'duration', 'channels']
+
+    def setup(self, backend, operation, duration, channels):
+        if (backend == 'library' and
+                not pyrubberband._librubberband.available()):
+            raise NotImplementedError('librubberband is not installed')
+
+        self._setup()
+        self.y = make_signal(duration, channels, 44100, 'float32')
+        self.call = make_call(operation, self.y, 44100)
+        pyrubberband.set_backend(backend)
+
+    def teardown(self, *args):
+        pyrubberband.set_backend('cli')
+        super(Backends, self).teardown()
+
+    def time_call(self, *args):
+        self.call()
+
+    def peakmem_call(self, *args):
+        self.call()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+'''A deterministic stand-in for the `rubberband` command-line utility.
+
+This supports the subset of the `rubberband` interface used by pyrubberband,
+so that the benchmarks can run on machines without the real utility.
+Output lengths follow `rubberband`, but the signal processing is a simple
+linear interpolation, so output quality is meaningless.
+
+Usage::
+
+    fake_rubberband.py [options] <infile> <outfile>
+
+`-` may be used for `infile` and `outfile` to read from stdin and
+write to stdout.
+'''
+
+import io
+import sys
+
+import numpy as np
+import soundfile as sf
+
+
+# Options that take a value
+VALUED = frozenset(['-c', '--crisp', '-t', '--time', '-T', '--tempo',
+                    '-p', '--pitch', '-f', '--frequency', '-D', '--duration',
+                    '-M', '--timemap', '--pitchmap', '--freqmap'])
+
+VERSION = '3.3.0'
+
+HELP = '''Rubber Band (fake)
+  -t<X>, --time <X>       Stretch to X times original duration, or
+  -T<X>, --tempo <X>      Change tempo by multiple X
+  -D<X>, --duration <X>   Stretch or squash to make output file X seconds long
+  -p<X>, --pitch <X>      Raise pitch by X semitones, or
+  -f<X>, --frequency <X>  Change frequency by multiple X
+  -M<F>, --timemap <F>    Use file F as the source for key frame map
+  -c<N>, --crisp <N>      Crispness (N = 0,1,2,3,4,5,6); default 5
+  -F,    --formant        Enable formant preservation when pitch shifting
+  -3,    --fine           Use the R3 (finer) engine
+  -2,    --faster         Use the R2 (faster) engine
+         --centre-focus   Preserve focus of centre material in stereo
+         --channels-together  Process channels together
+         --pitch-hq       Use high quality pitch shifting
+  -q,    --quiet          Suppress diagnostic output
+  -V,    --version        Show version number and exit
+  -h,    --help           Show the full help output
+'''
+
+
+def parse(argv):
+    opts, positional = dict(), []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in VALUED:
+            opts[arg] = argv[i + 1]
+            i += 2
+        elif arg.startswith('-') and arg != '-':
+            opts[arg] = True
+            i += 1
+        else:
+            positional.append(arg)
+            i += 1
+    return opts, positional
+
+
+def source_positions(n, n_out, ratio, opts):
+    '''Map each output frame to a (fractional) input frame'''
+    t_out = np.arange(n_out, dtype=np.float64)
+
+    timemap = opts.get('--timemap', opts.get('-M'))
+    if timemap is not None:
+        anchors = np.loadtxt(timemap, ndmin=2)
+        return np.interp(t_out, anchors[:, 1], anchors[:, 0])
+
+    return t_out / ratio
+
+
+def main(argv):
+    opts, positional = parse(argv)
+
+    if '--version' in opts or '-V' in opts:
+        print(VERSION)
+        return 0
+
+    if '--help' in opts or '-h' in opts:
+        print(HELP)
+        return 0
+
+    if len(positional) != 2:
+        sys.stderr.write('expected an input and an output file\n')
+        return 2
+
+    infile, outfile = positional
+    if infile == '-':
+        infile = io.BytesIO(sys.stdin.buffer.read())
+
+    info = sf.info(infile)
+    if isinstance(infile, io.BytesIO):
+        infile.seek(0)
+    y, sr = sf.read(infile, always_2d=True)
+    n = len(y)
+
+    ratio = 1.0
+    if '--time' in opts or '-t' in opts:
+        ratio = float(opts.get('--time', opts.get('-t')))
+    if '--tempo' in opts or '-T' in opts:
+        ratio = 1.0 / float(opts.get('--tempo', opts.get('-T')))
+    if '--duration' in opts or '-D' in opts:
+        ratio = float(opts.get('--duration', opts.get('-D'))) * sr / max(n, 1)
+
+    scale = 1.0
+    if '--pitch' in opts or '-p' in opts:
+        scale = 2.0 ** (float(opts.get('--pitch', opts.get('-p'))) / 12.0)
+    if '--frequency' in opts or '-f' in opts:
+        scale = float(opts.get('--frequency', opts.get('-f')))
+
+    n_out = int(round(n * ratio))
+    positions = source_positions(n, n_out, ratio, opts) * scale
+    if n:
+        positions %= n
+
+    frames = np.arange(n)
+    y_out = np.stack([np.interp(positions, frames, y[:, c])
+                      for c in range(y.shape[1])], axis=1)
+
+    if outfile == '-':
+        buf = io.BytesIO()
+        sf.write(buf, y_out, sr, format='WAV', subtype=info.subtype)
+        sys.stdout.buffer.write(buf.getvalue())
+    else:
+        sf.write(outfile, y_out, sr, subtype=info.subtype)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -5,3 +5,9 @@
 
 from .version import version as __version__
 from .pyrb import *
+from .cache import ResultCache
+from .pool import WorkerPool
+from .options import RubberbandOptions
+from .realtime import RubberbandStream
+from . import aio
+from . import instrument
@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+'''Run the `pyrubberband` command: `python -m pyrubberband`'''
+
+import sys
+
+from .cli import main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+'''ctypes bindings for the Rubber Band library
+
+This module drives `librubberband` directly on NumPy buffers, as an
+alternative to running the `rubberband` command-line utility.
+It is used by the `'library'` backend (see `pyrubberband.set_backend`).
+'''
+
+import ctypes
+import ctypes.util
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# Option flags, from rubberband-c.h
+OPTION_PROCESS_OFFLINE = 0x00000000
+OPTION_PROCESS_REALTIME = 0x00000001
+OPTION_STRETCH_ELASTIC = 0x00000000
+OPTION_STRETCH_PRECISE = 0x00000010
+OPTION_TRANSIENTS_CRISP = 0x00000000
+OPTION_TRANSIENTS_MIXED = 0x00000100
+OPTION_TRANSIENTS_SMOOTH = 0x00000200
+OPTION_DETECTOR_COMPOUND = 0x00000000
+OPTION_DETECTOR_PERCUSSIVE = 0x00000400
+OPTION_DETECTOR_SOFT = 0x00000800
+OPTION_PHASE_LAMINAR = 0x00000000
+OPTION_PHASE_INDEPENDENT = 0x00002000
+OPTION_THREADING_AUTO = 0x00000000
+OPTION_THREADING_NEVER = 0x00010000
+OPTION_THREADING_ALWAYS = 0x00020000
+OPTION_WINDOW_STANDARD = 0x00000000
+OPTION_WINDOW_SHORT = 0x00100000
+OPTION_WINDOW_LONG = 0x00200000
+OPTION_SMOOTHING_OFF = 0x00000000
+OPTION_SMOOTHING_ON = 0x00800000
+OPTION_FORMANT_SHIFTED = 0x00000000
+OPTION_FORMANT_PRESERVED = 0x01000000
+OPTION_PITCH_HIGH_SPEED = 0x00000000
+OPTION_PITCH_HIGH_QUALITY = 0x02000000
+OPTION_PITCH_HIGH_CONSISTENCY = 0x04000000
+OPTION_CHANNELS_APART = 0x00000000
+OPTION_CHANNELS_TOGETHER = 0x10000000
+OPTION_ENGINE_FASTER = 0x00000000
+OPTION_ENGINE_FINER = 0x20000000
+
+# Transient, phase and window settings for each `-c` crispness level,
+# following the rubberband command-line utility
+__CRISPNESS = {
+    0: (OPTION_TRANSIENTS_SMOOTH | OPTION_PHASE_INDEPENDENT |
+        OPTION_WINDOW_LONG),
+    1: (OPTION_DETECTOR_SOFT | OPTION_TRANSIENTS_CRISP |
+        OPTION_PHASE_INDEPENDENT | OPTION_WINDOW_LONG),
+    2: OPTION_TRANSIENTS_SMOOTH | OPTION_PHASE_INDEPENDENT,
+    3: OPTION_TRANSIENTS_SMOOTH,
+    4: OPTION_TRANSIENTS_MIXED,
+    5: OPTION_TRANSIENTS_CRISP,
+    6: (OPTION_TRANSIENTS_CRISP | OPTION_PHASE_INDEPENDENT |
+        OPTION_WINDOW_SHORT),
+}
+
+# Command-line flags without values, and the options they set
+__FLAGS = {
+    '-q': 0,
+    '--quiet': 0,
+    '--precise': 0,
+    '--loose': 0,
+    '-L': 0,
+    '--no-transients': OPTION_TRANSIENTS_SMOOTH,
+    '--bl-transients': OPTION_TRANSIENTS_MIXED,
+    '--no-lamination': OPTION_PHASE_INDEPENDENT,
+    '--window-long': OPTION_WINDOW_LONG,
+    '--window-short': OPTION_WINDOW_SHORT,
+    '--smoothing': OPTION_SMOOTHING_ON,
+    '--detector-perc': OPTION_DETECTOR_PERCUSSIVE,
+    '--detector-soft': OPTION_DETECTOR_SOFT,
+    '--formant': OPTION_FORMANT_PRESERVED,
+    '-F': OPTION_FORMANT_PRESERVED,
+    '--pitch-hq': OPTION_PITCH_HIGH_QUALITY,
+    '--centre-focus': OPTION_CHANNELS_TOGETHER,
+    '--channels-together': OPTION_CHANNELS_TOGETHER,
+    '--threads': OPTION_THREADING_ALWAYS,
+    '--no-threads': OPTION_THREADING_NEVER,
+    '--fine': OPTION_ENGINE_FINER,
+    '-3': OPTION_ENGINE_FINER,
+    '--faster': OPTION_ENGINE_FASTER,
+    '-2': OPTION_ENGINE_FASTER,
+}
+
+# Number of frames passed to the library per call
+BLOCK_SIZE = 2**14
+
+__LIB = None
+__LIB_LOADED = False
+__LIB_LOCK = threading.Lock()
+
+
+def __library_names():
+    '''Candidate names for the shared library, most specific first'''
+    names = []
+    if os.environ.get('PYRUBBERBAND_LIBRARY'):
+        names.append(os.environ['PYRUBBERBAND_LIBRARY'])
+
+    found = ctypes.util.find_library('rubberband')
+    if found:
+        names.append(found)
+
+    names.extend(['librubberband.so.3', 'librubberband.so.2',
+                  'librubberband.so', 'librubberband.dylib',
+                  'rubberband.dll'])
+    return names
+
+
+def __declare(lib):
+    '''Attach argument and return types to the functions we use'''
+    state = ctypes.c_void_p
+    uint = ctypes.c_uint
+    fptrs = ctypes.POINTER(ctypes.POINTER(ctypes.c_float))
+
+    signatures = {
+        'rubberband_new': (state, [uint, uint, ctypes.c_int,
+                                   ctypes.c_double, ctypes.c_double]),
+        'rubberband_delete': (None, [state]),
+        'rubberband_reset': (None, [state]),
+        'rubberband_set_time_ratio': (None, [state, ctypes.c_double]),
+        'rubberband_set_pitch_scale': (None, [state, ctypes.c_double]),
+        'rubberband_get_latency': (uint, [state]),
+        'rubberband_set_expected_input_duration': (None, [state, uint]),
+        'rubberband_get_samples_required': (uint, [state]),
+        'rubberband_set_max_process_size': (None, [state, uint]),
+        'rubberband_set_key_frame_map': (None, [state, uint,
+                                                ctypes.POINTER(uint),
+                                                ctypes.POINTER(uint)]),
+        'rubberband_study': (None, [state, fptrs, uint, ctypes.c_int]),
+        'rubberband_process': (None, [state, fptrs, uint, ctypes.c_int]),
+        'rubberband_available': (ctypes.c_int, [state]),
+        'rubberband_retrieve': (uint, [state, fptrs, uint]),
+    }
+
+    for name, (restype, argtypes) in signatures.items():
+        func = getattr(lib, name)
+        func.restype = restype
+        func.argtypes = argtypes
+
+
+def load():
+    '''Load the Rubber Band library.
+
+    The result is cached after the first call.
+
+    Returns
+    -------
+    lib : ctypes.CDLL or None
+        The library, or `None` if it could not be found.
+    '''
+    global __LIB, __LIB_LOADED
+
+    with __LIB_LOCK:
+        if not __LIB_LOADED:
+            for name in __library_names():
+                try:
+                    lib = ctypes.CDLL(name)
+                    __declare(lib)
+                except (OSError, AttributeError):
+                    continue
+                __LIB = lib
+                break
+            __LIB_LOADED = True
+
+    return __LIB
+
+
+def available():
+    '''Check whether the Rubber Band library can be used'''
+    return load() is not None
+
+
+def parse_args(kwargs, sr, n):
+    '''Translate command-line style rubberband arguments.
+
+    Parameters
+    ----------
+    kwargs : dict
+        Options as they would be passed to the command-line utility
+
+    sr : int > 0
+        Sampling rate of the input
+
+    n : int > 0
+        Number of frames in the input
+
+    Returns
+    -------
+    options : int
+        Library option flags
+
+    time_ratio : float > 0
+        Ratio of output to input duration
+
+    pitch_scale : float > 0
+        Ratio of output to input frequency
+
+    time_map : np.ndarray [shape=(k, 2)] or None
+        Key frame map, if a `--timemap` file was given
+
+    Raises
+    ------
+    NotImplementedError
+        if `kwargs` contains an option that the library backend does not
+        support
+    '''
+    # The command-line utility is precise unless asked otherwise
+    options = OPTION_PROCESS_OFFLINE | OPTION_STRETCH_PRECISE
+    time_ratio = 1.0
+    pitch_scale = 1.0
+    time_map = None
+
+    for key, value in kwargs.items():
+        key = str(key)
+        if key in ('-t', '--time'):
+            time_ratio = float(value)
+        elif key in ('-T', '--tempo'):
+            time_ratio = 1.0 / float(value)
+        elif key in ('-D', '--duration'):
+            # Empty input stays empty, whatever the duration
+            if n > 0:
+                time_ratio = float(value) * sr / n
+        elif key in ('-p', '--pitch'):
+            pitch_scale = 2.0 ** (float(value) / 12.0)
+        elif key in ('-f', '--frequency'):
+            pitch_scale = float(value)
+        elif key in ('-M', '--timemap'):
+            # Fractional frames are allowed, but the library takes whole
+            # frames
+            time_map = np.rint(np.loadtxt(str(value), dtype=np.float64,
+                                          ndmin=2)).astype(np.int64)
+        elif key in ('-c', '--crisp'):
+            level = int(value)
+            if level not in __CRISPNESS:
+                raise NotImplementedError('unsupported crispness: {}'.format(
+                    value))
+            options |= __CRISPNESS[level]
+        elif key in ('--loose', '-L'):
+            options &= ~OPTION_STRETCH_PRECISE
+        elif key in __FLAGS:
+            options |= __FLAGS[key]
+        else:
+            raise NotImplementedError('unsupported rubberband option: '
+                                      '{}'.format(key))
+
+    return options, time_ratio, pitch_scale, time_map
+
+
+def __pointers(buf, offset=0):
+    '''Per-channel float pointers into a Fortran-ordered (n, c) buffer'''
+    fptr = ctypes.POINTER(ctypes.c_float)
+    base = buf.ctypes.data + offset * buf.strides[0]
+    ptrs = (fptr * buf.shape[1])(
+        *[ctypes.cast(base + c * buf.strides[1], fptr)
+          for c in range(buf.shape[1])])
+    return ptrs
+
+
+def process(y, sr, options, time_ratio, pitch_scale, time_map=None,
+            block_size=BLOCK_SIZE):
+    '''Run an offline stretch through the library.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n, c)]
+        Audio time series.  If `y` is a Fortran-ordered float32 array,
+        the library reads it in place; otherwise it is converted once.
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    options : int
+        Library option flags
+
+    time_ratio : float > 0
+        Ratio of output to input duration
+
+    pitch_scale : float > 0
+        Ratio of output to input frequency
+
+    time_map : np.ndarray [shape=(k, 2)] or None
+        Key frame map of input frames to output frames
+
+    block_size : int > 0
+        Number of frames passed to the library per call
+
+    Returns
+    -------
+    y_out : np.ndarray [shape=(m, c), dtype=float32, order='F']
+        Processed audio
+    '''
+    lib = load()
+    if lib is None:
+        raise RuntimeError('The Rubber Band library is not available.')
+
+    # Planar float32: each column is one contiguous channel
+    y = np.asfortranarray(y, dtype=np.float32)
+    n, channels = y.shape
+
+    state = lib.rubberband_new(sr, channels, options, time_ratio, pitch_scale)
+    if not state:
+        raise RuntimeError('Failed to initialize the Rubber Band library.')
+
+    try:
+        lib.rubberband_set_expected_input_duration(state, n)
+        lib.rubberband_set_max_process_size(state, block_size)
+
+        if time_map is not None and len(time_map):
+            time_map = np.asarray(time_map, dtype=np.uint32)
+            k = len(time_map)
+            src = np.ascontiguousarray(time_map[:, 0])
+            dst = np.ascontiguousarray(time_map[:, 1])
+            uint_p = ctypes.POINTER(ctypes.c_uint)
+            lib.rubberband_set_key_frame_map(
+                state, k,
+                src.ctypes.data_as(uint_p), dst.ctypes.data_as(uint_p))
+
+        # An empty input still needs one (empty) final block
+        for start in range(0, max(n, 1), block_size):
+            count = min(block_size, n - start)
+            lib.rubberband_study(state, __pointers(y, start), count,
+                                 int(start + count >= n))
+
+        y_out = np.empty((int(round(n * time_ratio)) + block_size, channels),
+                         dtype=np.float32, order='F')
+        written = 0
+
+        def __drain():
+            nonlocal y_out, written
+            while True:
+                avail = lib.rubberband_available(state)
+                if avail <= 0:
+                    return avail
+                if written + avail > len(y_out):
+                    grown = np.empty((2 * (written + avail), channels),
+                                     dtype=np.float32, order='F')
+                    grown[:written] = y_out[:written]
+                    y_out = grown
+                written += lib.rubberband_retrieve(
+                    state, __pointers(y_out, written), avail)
+
+        for start in range(0, max(n, 1), block_size):
+            count = min(block_size, n - start)
+            lib.rubberband_process(state, __pointers(y, start), count,
+                                   int(start + count >= n))
+            __drain()
+
+        # -1 signals that all output has been retrieved
+        while __drain() != -1:
+            time.sleep(1e-3)
+
+    finally:
+        lib.rubberband_delete(state)
+
+    return y_out[:written]
+
+
+def new_stretcher(sr, channels, options, time_ratio, pitch_scale,
+                  block_size):
+    '''Create a stretcher, to be fed block by block with `process_block`.
+
+    Parameters
+    ----------
+    sr : int > 0
+        Sampling rate
+
+    channels : int > 0
+        Number of channels
+
+    options : int
+        Library option flags
+
+    time_ratio : float > 0
+        Ratio of output to input duration
+
+    pitch_scale : float > 0
+        Ratio of output to input frequency
+
+    block_size : int > 0
+        Largest number of frames passed per call
+
+    Returns
+    -------
+    state : int
+        The stretcher, to be released with `delete_stretcher`
+    '''
+    lib = load()
+    if lib is None:
+        raise RuntimeError('The Rubber Band library is not available.')
+
+    state = lib.rubberband_new(sr, channels, options, time_ratio, pitch_scale)
+    if not state:
+        raise RuntimeError('Failed to initialize the Rubber Band library.')
+
+    lib.rubberband_set_max_process_size(state, block_size)
+    return state
+
+
+def delete_stretcher(state):
+    '''Release a stretcher created by `new_stretcher`'''
+    load().rubberband_delete(state)
+
+
+def __retrieve(lib, state, channels):
+    '''Retrieve all of the output a stretcher has available.
+
+    Returns the output, and whether the stretcher has finished.
+    '''
+    chunks = []
+    while True:
+        avail = lib.rubberband_available(state)
+        if avail <= 0:
+            break
+        buf = np.empty((avail, channels), dtype=np.float32, order='F')
+        chunks.append(buf[:lib.rubberband_retrieve(state, __pointers(buf),
+                                                   avail)])
+
+    if not chunks:
+        return np.empty((0, channels), dtype=np.float32), avail == -1
+
+    return np.concatenate(chunks), avail == -1
+
+
+def process_block(state, y, final=False):
+    '''Feed one block to a stretcher, and collect its output.
+
+    Parameters
+    ----------
+    state : int
+        A stretcher, from `new_stretcher`
+
+    y : np.ndarray [shape=(n, c)]
+        The next block of input, of at most `block_size` frames
+
+    final : bool
+        If `True`, this is the last block: wait for the stretcher to
+        return all of its remaining output.
+
+    Returns
+    -------
+    y_out : np.ndarray [shape=(m, c), dtype=float32]
+        The output that became available
+    '''
+    lib = load()
+    y = np.asfortranarray(y, dtype=np.float32)
+    channels = y.shape[1]
+
+    lib.rubberband_process(state, __pointers(y), len(y), int(final))
+    y_out, finished = __retrieve(lib, state, channels)
+    if not final:
+        return y_out
+
+    chunks = [y_out]
+    while not finished:
+        time.sleep(1e-3)
+        y_out, finished = __retrieve(lib, state, channels)
+        chunks.append(y_out)
+
+    return np.concatenate(chunks)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+'''A phase vocoder in NumPy
+
+This module stretches and shifts audio in-process, as a fast approximation
+of `rubberband` for previews.  It is used by the `'fast'` backend
+(see `pyrubberband.set_backend`).
+
+The input is cut into overlapping frames, which are re-spaced in time and
+resynthesized with phases advanced by each bin's instantaneous frequency,
+and locked to the nearest spectral peak.  Pitch shifting stretches by the
+pitch ratio, then resamples by linear interpolation.  All channels, and
+blocks of frames, are processed together by single FFT calls.
+
+Compared to `rubberband`, expect:
+
+- smeared transients, since there is no transient detection,
+- some "phasiness" on stretches far from 1, and on dense mixtures,
+- some aliasing when shifting up, from the linear resampler,
+- no formant preservation.
+
+In exchange, there is no process to start and no file to write, so short
+signals are processed several times faster than by `rubberband`, in tens
+of milliseconds.  See the `Backends` benchmark in
+`benchmarks/benchmarks.py` for a comparison.
+'''
+
+import numpy as np
+
+
+# Options that only tune rubberband's own algorithm: they have no
+# counterpart here, and are ignored
+__IGNORED = frozenset([
+    '-q', '--quiet', '--precise', '--loose', '-L', '--no-transients',
+    '--bl-transients', '--no-lamination', '--window-long', '--window-short',
+    '--window-standard', '--smoothing', '--detector-perc',
+    '--detector-soft', '--pitch-hq', '--centre-focus',
+    '--channels-together', '--threads', '--no-threads', '--fine', '-3',
+    '--faster', '-2', '-c', '--crisp', '--ignore-clipping',
+])
+
+# Frames per FFT call, to bound memory on long signals
+BLOCK_FRAMES = 256
+
+
+def parse_args(kwargs, sr, n):
+    '''Translate command-line style rubberband arguments.
+
+    Parameters
+    ----------
+    kwargs : dict
+        Options as they would be passed to the command-line utility
+
+    sr : int > 0
+        Sampling rate of the input
+
+    n : int > 0
+        Number of frames in the input
+
+    Returns
+    -------
+    time_ratio : float > 0
+        Ratio of output to input duration
+
+    pitch_scale : float > 0
+        Ratio of output to input frequency
+
+    time_map : np.ndarray [shape=(k, 2)] or None
+        Key frame map, if a `--timemap` file was given
+
+    Raises
+    ------
+    NotImplementedError
+        if `kwargs` contains an option that changes the result in a way
+        the phase vocoder cannot reproduce, such as `--formant`
+    '''
+    time_ratio = 1.0
+    pitch_scale = 1.0
+    time_map = None
+
+    for key, value in kwargs.items():
+        key = str(key)
+        if key in ('-t', '--time'):
+            time_ratio = float(value)
+        elif key in ('-T', '--tempo'):
+            time_ratio = 1.0 / float(value)
+        elif key in ('-D', '--duration'):
+            # Empty input stays empty, whatever the duration
+            if n > 0:
+                time_ratio = float(value) * sr / n
+        elif key in ('-p', '--pitch'):
+            pitch_scale = 2.0 ** (float(value) / 12.0)
+        elif key in ('-f', '--frequency'):
+            pitch_scale = float(value)
+        elif key in ('-M', '--timemap'):
+            time_map = np.loadtxt(str(value), dtype=np.float64, ndmin=2)
+        elif key not in __IGNORED:
+            raise NotImplementedError('unsupported rubberband option: '
+                                      '{}'.format(key))
+
+    return time_ratio, pitch_scale, time_map
+
+
+def __frame_length(sr):
+    '''About 46ms, as a power of two'''
+    return 2048 if sr >= 32000 else 1024
+
+
+def __lock(phases, spec, magnitude):
+    '''Identity phase locking.
+
+    Each bin takes the phase of its nearest spectral peak, offset as in
+    the analysis frame, so that the bins around a peak stay coherent.
+
+    Parameters
+    ----------
+    phases : np.ndarray [shape=(frames, bins, c)]
+        Accumulated phases of every bin
+
+    spec : np.ndarray [shape=(frames, bins, c)]
+        Analysis spectra
+
+    magnitude : np.ndarray [shape=(frames, bins, c)]
+        `np.abs(spec)`
+
+    Returns
+    -------
+    locked : np.ndarray [shape=(frames, bins, c)]
+        Phases for synthesis
+    '''
+    bins = magnitude.shape[1]
+
+    edge = np.full(magnitude[:, :1].shape, -1.0)
+    below = np.concatenate([edge, magnitude[:, :-1]], axis=1)
+    above = np.concatenate([magnitude[:, 1:], edge], axis=1)
+    peak = (magnitude >= below) & (magnitude > above)
+
+    # The nearest peak at or below, and at or above, each bin
+    index = np.arange(bins)[:, np.newaxis] + np.zeros(magnitude.shape,
+                                                      dtype=np.int64)
+    left = np.maximum.accumulate(np.where(peak, index, -1), axis=1)
+    right = np.minimum.accumulate(np.where(peak, index, bins)[:, ::-1],
+                                  axis=1)[:, ::-1]
+
+    nearest = np.where(index - left <= right - index, left, right)
+    nearest = np.where(left < 0, right, nearest)
+    nearest = np.where(nearest >= bins, index, nearest)
+
+    angle = np.angle(spec)
+    return (np.take_along_axis(phases, nearest, axis=1) + angle -
+            np.take_along_axis(angle, nearest, axis=1))
+
+
+def __stretch(y, n_out, sources, targets, n_fft):
+    '''Phase vocoder stretch of `y` to `n_out` samples.
+
+    Output time `targets[i]` is mapped to input time `sources[i]`,
+    with linear interpolation in between.
+    '''
+    n, channels = y.shape
+    hop = n_fft // 4
+
+    # Periodic Hann: with a hop of n_fft / 4, the squared windows overlap
+    # to a constant 1.5
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft))
+    window = window[:, np.newaxis]
+    norm = 1.0 / 1.5
+
+    # Zero padding: frames that fall outside the signal read silence
+    pad = 2 * n_fft
+    padded = np.zeros((n + 2 * pad, channels))
+    padded[pad:pad + n] = y
+
+    # Synthesis frames are centred on multiples of `hop`, starting before
+    # the output so that every output sample is covered by four frames
+    lead = n_fft // (2 * hop)
+    n_frames = -(-n_out // hop) + 2 * lead + 1
+    times = (np.arange(n_frames) - lead) * hop
+
+    # Map output to input times, extrapolating at the global rate
+    clipped = np.clip(times, 0, n_out)
+    scale = n / float(n_out) if n_out else 0.0
+    positions = (np.interp(clipped, targets, sources) +
+                 (times - clipped) * scale)
+    starts = np.clip(np.rint(positions).astype(np.int64) - n_fft // 2 + pad,
+                     0, len(padded) - n_fft - hop)
+
+    # Expected phase advance of each bin over one hop
+    omega = 2 * np.pi * hop * np.arange(n_fft // 2 + 1) / n_fft
+    omega = omega[:, np.newaxis]
+
+    offsets = np.arange(n_fft)
+    out = np.zeros(((n_frames - 1) * hop + n_fft, channels))
+    phase = None
+
+    for block in range(0, n_frames, BLOCK_FRAMES):
+        first = starts[block:block + BLOCK_FRAMES]
+        index = first[:, np.newaxis] + offsets
+
+        # Each frame, and the frame one hop later, which gives the
+        # instantaneous frequency of every bin
+        spec = np.fft.rfft(padded[index] * window, axis=1)
+        spec_next = np.fft.rfft(padded[index + hop] * window, axis=1)
+
+        advance = np.angle(spec_next) - np.angle(spec) - omega
+        advance = omega + (advance + np.pi) % (2 * np.pi) - np.pi
+
+        if phase is None:
+            phase = np.angle(spec[0])
+
+        # Each frame's phase is the previous frame's, advanced by one hop
+        phases = np.empty(spec.shape)
+        phases[0] = phase
+        np.cumsum(advance[:-1], axis=0, out=phases[1:])
+        phases[1:] += phase
+
+        magnitude = np.abs(spec)
+        frames = np.fft.irfft(
+            magnitude * np.exp(1j * __lock(phases, spec, magnitude)),
+            n=n_fft, axis=1) * (window * norm)
+
+        # Overlap-add: within each quarter of the frame, successive frames
+        # write to adjacent, non-overlapping spans of the output
+        count = len(frames)
+        for part in range(n_fft // hop):
+            start = (block + part) * hop
+            out[start:start + count * hop] += frames[
+                :, part * hop:(part + 1) * hop].reshape((count * hop,
+                                                         channels))
+
+        phase = phases[-1] + advance[-1]
+
+    return out[n_fft:n_fft + n_out]
+
+
+def __resample(y, n_out):
+    '''Linear interpolation of `y` to `n_out` samples'''
+    if n_out == len(y) or not len(y):
+        return y[:n_out]
+
+    positions = np.arange(n_out) * (len(y) / float(n_out))
+    left = np.minimum(positions.astype(np.int64), len(y) - 1)
+    right = np.minimum(left + 1, len(y) - 1)
+    frac = (positions - left)[:, np.newaxis]
+    return y[left] * (1 - frac) + y[right] * frac
+
+
+def process(y, sr, time_ratio, pitch_scale, time_map=None):
+    '''Stretch and shift audio with the phase vocoder.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n, c)]
+        Audio time series
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    time_ratio : float > 0
+        Ratio of output to input duration
+
+    pitch_scale : float > 0
+        Ratio of output to input frequency
+
+    time_map : np.ndarray [shape=(k, 2)] or None
+        Key frame map of input frames to output frames
+
+    Returns
+    -------
+    y_out : np.ndarray [shape=(m, c), dtype=float64]
+        Processed audio, with `m = round(n * time_ratio)`
+    '''
+    n = len(y)
+    n_out = int(np.rint(n * time_ratio))
+
+    if time_ratio == 1.0 and pitch_scale == 1.0 and time_map is None:
+        return np.array(y, dtype=np.float64)
+
+    # Shifting pitch by p: stretch by p as well, then play back p times
+    # faster
+    n_stretch = int(np.rint(n_out * pitch_scale))
+
+    if time_map is None or not len(time_map):
+        sources = np.array([0.0, n])
+        targets = np.array([0.0, n_stretch])
+    else:
+        # Anchor the key frames at both ends of the signal
+        time_map = np.asarray(time_map, dtype=np.float64)
+        sources = np.concatenate([[0.0], time_map[:, 0], [n]])
+        targets = np.concatenate([[0.0], time_map[:, 1] * pitch_scale,
+                                  [n_stretch]])
+
+    y_out = __stretch(np.asarray(y, dtype=np.float64), n_stretch, sources,
+                      targets, __frame_length(sr))
+
+    return __resample(y_out, n_out)
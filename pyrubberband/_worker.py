@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+'''Helper process for `pyrubberband.pool.WorkerPool`
+
+This script is run directly by path, not imported as part of the package,
+so that each worker only loads the standard library.  A small process is
+cheap to fork, no matter how large the parent Python process has grown.
+
+Jobs arrive as one JSON object per line on stdin, and each is answered
+with one JSON object per line on stdout:
+
+- `{"ping": true}` is answered with `{"pong": true}`
+- `{"args": [...], "timeout": t, "cpu_time": c, "memory": m, "nice": n}`
+  runs a command with stdin and stdout closed, and is answered with
+  `{"returncode": r, "max_rss": m, "stderr": "..."}`,
+  `{"timeout": true, "stderr": "..."}` if it ran for more than `t`
+  seconds, or `{"errno": e, "error": "..."}` if it could not be started.
+  `"stderr"` holds the end of the command's error output.
+'''
+
+import functools
+import json
+import math
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+# Bytes of error output to report
+STDERR_TAIL = 2**12
+
+
+def limit(cpu_time, memory, nice):
+    '''Apply resource limits, between fork and exec.
+
+    This mirrors `pyrubberband.pyrb.__limit_child`.
+    '''
+    if nice:
+        os.nice(nice)
+
+    if cpu_time is not None:
+        # SIGXCPU at the soft limit, SIGKILL if that is ignored
+        cpu_time = int(math.ceil(cpu_time))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+
+    if memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+def tail(fdesc):
+    '''Read the end of a file'''
+    size = fdesc.seek(0, os.SEEK_END)
+    fdesc.seek(max(0, size - STDERR_TAIL))
+    return fdesc.read().decode('utf-8', 'replace')
+
+
+def run(args, timeout=None, cpu_time=None, memory=None, nice=None):
+    '''Run a command to completion, and describe the outcome'''
+    with tempfile.TemporaryFile() as errors:
+        reply = wait(args, errors, timeout, cpu_time, memory, nice)
+        if 'errno' not in reply:
+            reply['stderr'] = tail(errors)
+
+    return reply
+
+
+def wait(args, errors, timeout, cpu_time, memory, nice):
+    '''Run a command with its error output sent to `errors`'''
+    preexec_fn = None
+    if (cpu_time, memory, nice) != (None, None, None):
+        preexec_fn = functools.partial(limit, cpu_time, memory, nice)
+
+    try:
+        proc = subprocess.Popen(args, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL,
+                                stderr=errors, preexec_fn=preexec_fn)
+    except OSError as exc:
+        return dict(errno=exc.errno, error=str(exc))
+
+    killed = []
+
+    def kill():
+        # Not proc.kill(), which may reap the process before we do
+        killed.append(True)
+        os.kill(proc.pid, signal.SIGKILL)
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+
+    try:
+        if not hasattr(os, 'waitid'):
+            # proc.wait() reaps the process, so there is nothing left for
+            # wait4 to report
+            proc.wait()
+        else:
+            # Wait without reaping, so that the timer can never signal
+            # a recycled pid
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    finally:
+        if timer is not None:
+            timer.cancel()
+            timer.join()
+
+    max_rss = None
+    if proc.returncode is None:
+        _, status, rusage = os.wait4(proc.pid, 0)
+
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+
+        max_rss = rusage.ru_maxrss
+        if sys.platform == 'darwin':
+            # Reported in bytes rather than kilobytes
+            max_rss //= 1024
+
+    if killed:
+        return dict(timeout=True)
+
+    return dict(returncode=proc.returncode, max_rss=max_rss)
+
+
+def main():
+    for line in sys.stdin:
+        job = json.loads(line)
+
+        if job.get('ping'):
+            reply = dict(pong=True)
+        else:
+            reply = run(job.pop('args'), **job)
+
+        sys.stdout.write(json.dumps(reply) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
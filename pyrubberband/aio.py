@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+'''Asynchronous interface
+
+These functions mirror `time_stretch`, `pitch_shift`, and `timemap_stretch`,
+but run `rubberband` through `asyncio` subprocesses so that the event loop
+is never blocked while audio is being processed.
+
+If the calling task is cancelled, the `rubberband` process is killed and
+its temporary files are removed.
+
+The backend (`pyrubberband.set_backend`), worker pool
+(`pyrubberband.set_pool`), and limits (`pyrubberband.set_limits`) apply as
+they do to the blocking functions.  Calls served by the `'library'` or
+`'fast'` backend, or by a worker pool, run in the event loop's default
+executor instead: if the task is cancelled, such a call still runs to
+completion, or until its time limit, before the cancellation takes
+effect.
+
+.. autosummary::
+    :toctree: generated/
+
+    pitch_shift
+    time_stretch
+    timemap_stretch
+'''
+
+import asyncio
+import functools
+import io
+import os
+import subprocess
+
+import numpy as np
+
+from . import instrument
+from . import pyrb
+
+
+__all__ = ['time_stretch', 'pitch_shift', 'timemap_stretch']
+
+
+async def __exec(arguments, operation, data=None, timeout=None):
+    '''Run a command to completion, and return its stdout.
+
+    If `data` is provided, it is sent to the process on stdin, and stdout
+    is captured.  Otherwise, stdout is discarded.
+
+    The limits set by `pyrubberband.set_limits` apply, except that
+    `timeout`, if given, replaces its time limit.
+    '''
+    if data is None:
+        stdin = stdout = subprocess.DEVNULL
+    else:
+        stdin = stdout = subprocess.PIPE
+
+    command = tuple(arguments)
+    limits = dict(pyrb.__LIMITS)
+    if timeout is not None:
+        limits['timeout'] = timeout
+
+    with instrument.timed(operation, 'spawn', command=command):
+        proc = await asyncio.create_subprocess_exec(
+            *arguments, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE,
+            preexec_fn=pyrb.__preexec(**limits))
+
+    with instrument.timed(operation, 'process', command=command) as event:
+        try:
+            output, stderr = await asyncio.wait_for(proc.communicate(data),
+                                                    limits['timeout'])
+        except BaseException as exc:
+            # Cancelled, timed out, or otherwise interrupted: don't leave
+            # the child behind
+            if proc.returncode is None:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+
+            if isinstance(exc, asyncio.TimeoutError):
+                raise pyrb.RubberbandTimeout(arguments,
+                                             limits['timeout']) from None
+            raise
+        event['returncode'] = proc.returncode
+
+    if proc.returncode != 0:
+        raise pyrb.RubberbandError(proc.returncode, arguments,
+                                   stderr=stderr[-pyrb.__STDERR_TAIL:])
+
+    return output
+
+
+async def __in_thread(func, *args):
+    '''Run a blocking function in the default executor.
+
+    If the caller is cancelled, this still waits for `func` to finish, so
+    that it cannot touch files after they have been cleaned up.
+    '''
+    future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+async def __run_tempfile(y, sr, arguments, operation, timeout=None,
+                         nbytes=0):
+    '''Run rubberband with the input and output on disk.
+
+    As `pyrubberband.pyrb.__run_tempfile`, the call is run again on disk
+    if the in-memory scratch directory fills up.
+    '''
+    tempdir = pyrb.__tempdir(nbytes)
+    retry = tempdir != pyrb.__tempdir(None)
+
+    with pyrb.__scratch('in.wav', tempdir) as infile, \
+            pyrb.__scratch('out.wav', tempdir) as outfile:
+        try:
+            with instrument.timed(operation, 'write',
+                                  tempdir=tempdir) as event:
+                await __in_thread(pyrb.__write_audio, infile, y, sr)
+                event['nbytes'] = os.path.getsize(infile)
+
+            await __exec(arguments + [infile, outfile], operation,
+                         timeout=timeout)
+        except (OSError, pyrb.RubberbandError) as exc:
+            if not (retry and pyrb.__full(tempdir, exc)):
+                raise
+        else:
+            if not (retry and pyrb.__full(tempdir)):
+                with instrument.timed(operation, 'read',
+                                      tempdir=tempdir) as event:
+                    y_out = await __in_thread(pyrb.__read_audio, outfile,
+                                              y.dtype)
+                    event['nbytes'] = os.path.getsize(outfile)
+
+                return y_out
+
+    return await __run_tempfile(y, sr, arguments, operation, timeout,
+                                nbytes=None)
+
+
+def __encode(y, sr):
+    '''Encode audio as WAV bytes in the wire format'''
+    buf = io.BytesIO()
+    pyrb.__write_audio(buf, y, sr)
+    return buf.getvalue()
+
+
+async def __run_pipe(y, sr, arguments, operation, timeout=None):
+    '''Run rubberband with the input on stdin and the output on stdout'''
+    with instrument.timed(operation, 'write') as event:
+        data = await __in_thread(__encode, y, sr)
+        event['nbytes'] = len(data)
+
+    output = await __exec(arguments + ['-', '-'], operation, data=data,
+                          timeout=timeout)
+
+    with instrument.timed(operation, 'read', nbytes=len(output)):
+        y_out = await __in_thread(pyrb.__read_audio, io.BytesIO(output),
+                                  y.dtype)
+
+    return y_out
+
+
+def __in_process(y, sr, kwargs):
+    '''Whether a call is served by the library or fast backend'''
+    backend = pyrb.__BACKEND
+    if backend == 'library':
+        return pyrb.__library_args(y, sr, kwargs) is not None
+    if backend == 'fast':
+        return pyrb.__vocoder_args(y, sr, kwargs) is not None
+    return False
+
+
+async def __rubberband(y, sr, semaphore=None, operation=None, timeout=None,
+                       **kwargs):
+    '''Execute rubberband without blocking the event loop
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)]
+        Audio time series, either single or multichannel
+
+    sr : int > 0
+        sampling rate of y
+
+    semaphore : asyncio.Semaphore or None
+        If provided, `rubberband` only runs while holding `semaphore`.
+
+    operation : str or None
+        Name of the calling function, for instrumentation events
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.
+        If `None`, the limit set by `set_limits` applies.
+
+    **kwargs
+        keyword arguments to rubberband
+
+    Returns
+    -------
+    y_mod : np.ndarray [shape=(n,) or (n, c)]
+        `y` after rubberband transformation
+    '''
+
+    assert sr > 0
+
+    if semaphore is not None:
+        async with semaphore:
+            return await __rubberband(y, sr, operation=operation,
+                                      timeout=timeout, **kwargs)
+
+    if pyrb.__POOL is not None or __in_process(y, sr, kwargs):
+        # Nothing to start from here: run the blocking call in a thread
+        return await __in_thread(functools.partial(
+            pyrb.__rubberband, y, sr, operation=operation, timeout=timeout,
+            **kwargs))
+
+    with instrument.timed(operation, 'total'):
+        return await __run(y, sr, operation, kwargs, timeout)
+
+
+async def __run(y, sr, operation, kwargs, timeout=None):
+    '''Process audio with rubberband, or fetch it from the cache'''
+    cache = pyrb.__CACHE
+    if cache is not None:
+        key = pyrb.__cache_key(cache, y, sr, kwargs)
+        y_out = cache.get(key)
+        if y_out is not None:
+            return y_out
+
+    util = pyrb.__RUBBERBAND_UTIL
+    arguments = [pyrb.__executable(), '-q'] + pyrb.__rubberband_args(kwargs)
+    nbytes = pyrb.__scratch_bytes(y, sr, kwargs)
+
+    try:
+        y_out = None
+
+        if (pyrb.__TRANSPORT == 'pipe' and
+                await __in_thread(pyrb.__pipes_supported)):
+            try:
+                y_out = await __run_pipe(y, sr, arguments, operation,
+                                         timeout)
+                pyrb.__PIPE_SUPPORT[util] = True
+            except (subprocess.CalledProcessError, RuntimeError):
+                y_out = await __run_tempfile(y, sr, arguments, operation,
+                                             timeout, nbytes)
+                pyrb.__PIPE_SUPPORT[util] = False
+
+        if y_out is None:
+            y_out = await __run_tempfile(y, sr, arguments, operation,
+                                         timeout, nbytes)
+
+    except OSError as exc:
+        raise RuntimeError('Failed to execute rubberband. '
+                           'Please verify that rubberband-cli '
+                           'is installed.') from exc
+
+    # make sure that output dimensions matches input
+    if y.ndim == 1:
+        y_out = np.squeeze(y_out, axis=1)
+
+    if cache is not None:
+        cache.put(key, y_out)
+
+    return y_out
+
+
+async def time_stretch(y, sr, rate, rbargs=None, semaphore=None,
+                       timeout=None):
+    '''Apply a time stretch of `rate` to an audio time series.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)]
+        Audio time series, either single or multichannel
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    rate : float > 0
+        Desired playback rate.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband.
+        See `pyrubberband.time_stretch` for details.
+
+    semaphore : asyncio.Semaphore or None
+        If provided, limits the number of concurrent `rubberband` processes
+        to those sharing this semaphore.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.  If it is exceeded,
+        `rubberband` is killed and `RubberbandTimeout` is raised.
+        If `None`, the limit set by `set_limits` applies.
+
+    Returns
+    -------
+    y_stretch : np.ndarray
+        Time-stretched audio
+
+    Raises
+    ------
+    ValueError
+        if `rate <= 0`
+
+    See Also
+    --------
+    pyrubberband.time_stretch
+    '''
+
+    if rate <= 0:
+        raise ValueError('rate must be strictly positive')
+
+    if rate == 1.0:
+        return y
+
+    # Validating RubberbandOptions may probe the executable
+    rbargs = await __in_thread(pyrb.__rbargs, rbargs)
+    rbargs.setdefault('--tempo', rate)
+
+    return await __rubberband(y, sr, semaphore=semaphore,
+                              operation='time_stretch', timeout=timeout,
+                              **rbargs)
+
+
+async def timemap_stretch(y, sr, time_map, rbargs=None, semaphore=None,
+                          timeout=None):
+    '''Apply a timemap stretch to an audio time series.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)]
+        Audio time series, either single or multichannel
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    time_map : list or np.ndarray [shape=(k, 2)]
+        Each element is a tuple `t` of length 2 which corresponds to the
+        source sample position and target sample position.
+        See `pyrubberband.timemap_stretch` for details.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband.
+        See `pyrubberband.timemap_stretch` for details.
+
+    semaphore : asyncio.Semaphore or None
+        If provided, limits the number of concurrent `rubberband` processes
+        to those sharing this semaphore.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.  If it is exceeded,
+        `rubberband` is killed and `RubberbandTimeout` is raised.
+        If `None`, the limit set by `set_limits` applies.
+
+    Returns
+    -------
+    y_stretch : np.ndarray
+        Time-stretched audio
+
+    Raises
+    ------
+    ValueError
+        if `time_map` does not have shape `(k, 2)`
+        if `time_map` is not monotonic
+        if `time_map` is not non-negative
+        if `time_map[-1][0]` is not the input audio length
+
+    See Also
+    --------
+    pyrubberband.timemap_stretch
+    '''
+
+    # Validating RubberbandOptions may probe the executable
+    rbargs = await __in_thread(pyrb.__rbargs, rbargs)
+
+    time_map = pyrb.__check_time_map(time_map, len(y))
+
+    rbargs.setdefault('--time', time_map[-1][1] * 1.0 / time_map[-1][0])
+
+    with pyrb.__time_map_file(time_map) as stretch_file:
+        rbargs.setdefault('--timemap', stretch_file)
+        y_stretch = await __rubberband(y, sr, semaphore=semaphore,
+                                       operation='timemap_stretch',
+                                       timeout=timeout, **rbargs)
+
+    return y_stretch
+
+
+async def pitch_shift(y, sr, n_steps, rbargs=None, semaphore=None,
+                      timeout=None):
+    '''Apply a pitch shift to an audio time series.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)]
+        Audio time series, either single or multichannel
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    n_steps : float
+        Shift by `n_steps` semitones.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband.
+        See `pyrubberband.pitch_shift` for details.
+
+    semaphore : asyncio.Semaphore or None
+        If provided, limits the number of concurrent `rubberband` processes
+        to those sharing this semaphore.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.  If it is exceeded,
+        `rubberband` is killed and `RubberbandTimeout` is raised.
+        If `None`, the limit set by `set_limits` applies.
+
+    Returns
+    -------
+    y_shift : np.ndarray
+        Pitch-shifted audio
+
+    See Also
+    --------
+    pyrubberband.pitch_shift
+    '''
+
+    if n_steps == 0:
+        return y
+
+    # Validating RubberbandOptions may probe the executable
+    rbargs = await __in_thread(pyrb.__rbargs, rbargs)
+    rbargs.setdefault('--pitch', n_steps)
+
+    return await __rubberband(y, sr, semaphore=semaphore,
+                              operation='pitch_shift', timeout=timeout,
+                              **rbargs)
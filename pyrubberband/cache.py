@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+'''Result caching
+
+A `ResultCache` stores the outputs of `rubberband` keyed on the content of
+the input signal and the options used to process it.  Once installed with
+`pyrubberband.set_cache`, repeated transformations of the same audio are
+served from the cache without running `rubberband` at all.
+
+.. autosummary::
+    :toctree: generated/
+
+    ResultCache
+'''
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+__all__ = ['ResultCache']
+
+# Options whose values name files: the cache key depends on their contents
+_FILE_OPTIONS = frozenset(['--timemap', '-M', '--pitchmap', '--freqmap'])
+
+# Age, in seconds, after which a partial write is taken to be abandoned
+_STALE_SECONDS = 3600
+
+
+class ResultCache(object):
+    '''A two-tier cache of processed audio.
+
+    The memory tier holds recently used results, up to `max_bytes` in total.
+    If `directory` is given, results are also written there as `.npy` files,
+    up to `max_disk_bytes` in total.  Both tiers evict the least recently
+    used entries first.
+
+    Parameters
+    ----------
+    max_bytes : int >= 0
+        Memory budget for cached arrays.
+
+    directory : str or None
+        Directory for the on-disk tier.  If `None`, only the memory tier
+        is used.  Entries already present in the directory are reused.
+
+    max_disk_bytes : int >= 0 or None
+        Disk budget for cached arrays.  If `None`, the disk tier is unbounded.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from either tier
+
+    misses : int
+        Number of lookups that were not in the cache
+
+    evictions : int
+        Number of entries removed from either tier to stay within budget
+
+    Examples
+    --------
+    >>> cache = pyrb.ResultCache(max_bytes=2**28, directory='/tmp/pyrb-cache')
+    >>> pyrb.set_cache(cache)
+    >>> y_shift = pyrb.pitch_shift(y, sr, 2)  # runs rubberband
+    >>> y_shift = pyrb.pitch_shift(y, sr, 2)  # served from the cache
+    >>> cache.stats()
+    {'hits': 1, 'misses': 1, 'evictions': 0, ...}
+    '''
+
+    def __init__(self, max_bytes=2**28, directory=None, max_disk_bytes=None):
+        if max_bytes < 0:
+            raise ValueError('max_bytes must be non-negative')
+
+        if max_disk_bytes is not None and max_disk_bytes < 0:
+            raise ValueError('max_disk_bytes must be non-negative or None')
+
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    def _scan(self):
+        '''Index the entries already on disk, oldest first'''
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+
+            if name.endswith('.tmp'):
+                # Left by a writer that crashed, unless it is recent
+                try:
+                    if time.time() - os.stat(path).st_mtime > _STALE_SECONDS:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                continue
+
+            if not name.endswith('.npy'):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+        self._evict_disk()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    @staticmethod
+    def key(y, sr, options):
+        '''Compute the cache key for a transformation.
+
+        Parameters
+        ----------
+        y : np.ndarray
+            Input audio
+
+        sr : int > 0
+            Sampling rate of `y`
+
+        options : iterable of (str, object)
+            The `rubberband` options, including the executable used.
+            Options that name a file (e.g. `--timemap`) contribute the
+            file's contents rather than its name.
+
+        Returns
+        -------
+        key : str
+            A hexadecimal digest identifying the transformation
+        '''
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update('{}|{}|{}|'.format(sr, y.dtype.str,
+                                         y.shape).encode('utf-8'))
+
+        for flag, value in sorted((str(k), str(v)) for k, v in options):
+            if flag in _FILE_OPTIONS:
+                with open(value, 'rb') as fdesc:
+                    value = hashlib.blake2b(fdesc.read()).hexdigest()
+            digest.update('{}={}|'.format(flag, value.strip()).encode('utf-8'))
+
+        digest.update(memoryview(np.ascontiguousarray(y)).cast('B'))
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        '''Look up a cached result.
+
+        Parameters
+        ----------
+        key : str
+            A key produced by `ResultCache.key`
+
+        Returns
+        -------
+        y_out : np.ndarray or None
+            A copy of the cached result, or `None` if `key` is not cached.
+        '''
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key].copy()
+
+            if key in self._disk:
+                try:
+                    y_out = np.array(np.load(self._path(key), mmap_mode='r'))
+                except (OSError, ValueError):
+                    # Removed or damaged behind our back
+                    self._drop_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    try:
+                        os.utime(self._path(key))
+                    except OSError:
+                        # Evicted by another process since it was read
+                        pass
+                    self.hits += 1
+                    self._put_memory(key, y_out)
+                    return y_out.copy()
+
+            self.misses += 1
+            return None
+
+    def put(self, key, y_out):
+        '''Store a result in the cache.
+
+        Parameters
+        ----------
+        key : str
+            A key produced by `ResultCache.key`
+
+        y_out : np.ndarray
+            The result to store.  The cache keeps its own copy.
+        '''
+        y_out = np.array(y_out)
+
+        with self._lock:
+            self._put_memory(key, y_out)
+
+            if self.directory is not None and key not in self._disk:
+                self._put_disk(key, y_out)
+
+    def _put_memory(self, key, y_out):
+        if key in self._memory or y_out.nbytes > self.max_bytes:
+            return
+
+        self._memory[key] = y_out
+        self._memory_bytes += y_out.nbytes
+
+        while self._memory_bytes > self.max_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= old.nbytes
+            self.evictions += 1
+
+    def _put_disk(self, key, y_out):
+        # Write to a temporary name first so that readers never see
+        # a partial file
+        fd, tmpfile = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as fdesc:
+                np.save(fdesc, y_out)
+            os.replace(tmpfile, self._path(key))
+        except BaseException:
+            os.unlink(tmpfile)
+            raise
+
+        size = os.path.getsize(self._path(key))
+        self._disk[key] = size
+        self._disk_bytes += size
+        self._evict_disk()
+
+    def _drop_disk(self, key):
+        self._disk_bytes -= self._disk.pop(key)
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        if self.max_disk_bytes is None:
+            return
+
+        while self._disk and self._disk_bytes > self.max_disk_bytes:
+            self._drop_disk(next(iter(self._disk)))
+            self.evictions += 1
+
+    def clear(self):
+        '''Remove all entries from both tiers, and reset the counters.'''
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+            for key in list(self._disk):
+                self._drop_disk(key)
+
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        '''Report cache usage.
+
+        Returns
+        -------
+        stats : dict
+            The `hits`, `misses`, and `evictions` counters, the number of
+            entries in each tier (`memory_entries`, `disk_entries`), and the
+            bytes used by each tier (`memory_bytes`, `disk_bytes`).
+        '''
+        with self._lock:
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions,
+                        memory_entries=len(self._memory),
+                        memory_bytes=self._memory_bytes,
+                        disk_entries=len(self._disk),
+                        disk_bytes=self._disk_bytes)
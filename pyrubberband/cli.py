@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+'''Command-line interface
+
+The `pyrubberband` command processes a manifest of audio files in bulk,
+with a pool of worker processes::
+
+    $ pyrubberband manifest.csv --workers 8
+
+The manifest is a CSV file with a header row, or a JSON lines file
+(`.jsonl`) with one object per line.  Each job has the fields:
+
+- `input`: path to the input audio
+- `operation`: `time_stretch` or `pitch_shift`
+- `params`: the rate or the number of semitones, or a JSON object of
+  parameters, e.g. `{"rate": 1.5, "rbargs": {"--crisp": "6"}}`
+- `output`: path to the output audio, whose format is set by its extension
+
+Relative paths are relative to the directory of the manifest.
+
+Finished jobs are recorded in a SQLite database, by default next to the
+manifest (`<manifest>.done.sqlite`).  Running the same manifest again
+skips them, so an interrupted run picks up where it stopped.  Each output
+is written under a temporary name, and only renamed once it is complete.
+
+Progress, throughput and the estimated time remaining are reported on
+standard error.  The exit status is 1 if any job failed.
+
+.. autosummary::
+    :toctree: generated/
+
+    main
+'''
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import pyrb
+
+
+__all__ = ['main']
+
+# The parameter of each operation, and the function that runs it
+_OPERATIONS = {'time_stretch': ('rate', pyrb.time_stretch_file),
+               'pitch_shift': ('n_steps', pyrb.pitch_shift_file)}
+
+_FIELDS = ('input', 'operation', 'params', 'output')
+
+
+def _read_manifest(path):
+    '''Yield the rows of a manifest, with their line numbers'''
+    with open(path, newline='') as fdesc:
+        if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson'):
+            for line, text in enumerate(fdesc, 1):
+                if not text.strip():
+                    continue
+                try:
+                    yield line, json.loads(text)
+                except ValueError as exc:
+                    raise ValueError('{}:{}: {}'.format(path, line, exc))
+        else:
+            # Line 1 is the header
+            for line, row in enumerate(csv.DictReader(fdesc), 2):
+                yield line, row
+
+
+def _parse_params(operation, params):
+    '''Normalize the parameters of a job to a dictionary'''
+    name = _OPERATIONS[operation][0]
+
+    if isinstance(params, str):
+        try:
+            params = json.loads(params)
+        except ValueError:
+            raise ValueError('params must be a number or a JSON object, '
+                             'not {!r}'.format(params))
+
+    if isinstance(params, (int, float)) and not isinstance(params, bool):
+        params = {name: params}
+
+    if not isinstance(params, dict) or name not in params:
+        raise ValueError('{} requires {}'.format(operation, name))
+
+    unknown = set(params) - {name, 'rbargs'}
+    if unknown:
+        raise ValueError('unknown params for {}: {}'.format(
+            operation, ', '.join(sorted(unknown))))
+
+    return params
+
+
+def _parse_job(row, base, where):
+    '''Validate a manifest row, and resolve its paths'''
+    if not isinstance(row, dict):
+        raise ValueError('{}: expected an object, not {!r}'.format(where, row))
+
+    missing = [field for field in _FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError('{}: missing {}'.format(where, ', '.join(missing)))
+
+    if row['operation'] not in _OPERATIONS:
+        raise ValueError('{}: operation must be one of {}, not {!r}'.format(
+            where, sorted(_OPERATIONS), row['operation']))
+
+    try:
+        params = _parse_params(row['operation'], row['params'])
+    except ValueError as exc:
+        raise ValueError('{}: {}'.format(where, exc))
+
+    job = dict(input=os.path.join(base, row['input']),
+               operation=row['operation'], params=params,
+               output=os.path.join(base, row['output']))
+
+    # Jobs are identified by everything that determines their output
+    job['key'] = json.dumps([job[field] for field in _FIELDS],
+                            sort_keys=True)
+    return job
+
+
+def _run_job(job, timeout=None):
+    '''Run one job in a worker process.
+
+    Returns
+    -------
+    key : str
+        The key of the job
+
+    seconds : float
+        Time taken
+
+    error : str or None
+        The error, if the job failed
+    '''
+    start = time.perf_counter()
+    directory, name = os.path.split(job['output'])
+
+    # Keep the extension, which sets the output format
+    partial = os.path.join(directory,
+                           '.partial-{}-{}'.format(os.getpid(), name))
+
+    try:
+        param, function = _OPERATIONS[job['operation']]
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        function(job['input'], partial, job['params'][param],
+                 rbargs=job['params'].get('rbargs'), timeout=timeout)
+        os.replace(partial, job['output'])
+    except Exception as exc:
+        if os.path.exists(partial):
+            os.remove(partial)
+        return (job['key'], time.perf_counter() - start,
+                '{}: {}'.format(type(exc).__name__, exc))
+
+    return job['key'], time.perf_counter() - start, None
+
+
+class _Log(object):
+    '''The record of finished and failed jobs'''
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS done (key TEXT PRIMARY '
+                        'KEY, seconds REAL, finished REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS failed (key TEXT '
+                        'PRIMARY KEY, error TEXT, finished REAL)')
+        self.db.commit()
+
+    def finished(self):
+        return {key for key, in self.db.execute('SELECT key FROM done')}
+
+    def record(self, key, seconds, error=None):
+        with self.db:
+            if error is None:
+                self.db.execute('INSERT OR REPLACE INTO done VALUES '
+                                '(?, ?, ?)', (key, seconds, time.time()))
+                self.db.execute('DELETE FROM failed WHERE key = ?', (key,))
+            else:
+                self.db.execute('INSERT OR REPLACE INTO failed VALUES '
+                                '(?, ?, ?)', (key, error, time.time()))
+
+    def close(self):
+        self.db.close()
+
+
+def _clock(seconds):
+    seconds = int(round(seconds))
+    return '{:d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60,
+                                       seconds % 60)
+
+
+class _Progress(object):
+    '''Throughput and time remaining, reported at most every `interval`'''
+
+    def __init__(self, total, interval, stream=None):
+        self.total = total
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self.done = 0
+        self.failed = 0
+        self.start = self.last = time.perf_counter()
+
+    def update(self, error=None):
+        self.done += 1
+        if error is not None:
+            self.failed += 1
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        if not force and (not self.interval or
+                          now - self.last < self.interval):
+            return
+        self.last = now
+
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = ((self.total - self.done) / rate if rate > 0
+                     else float('nan'))
+
+        self.stream.write('{}/{} jobs, {} failed, {:.2f} jobs/s, '
+                          'elapsed {}, ETA {}\n'.format(
+                              self.done, self.total, self.failed, rate,
+                              _clock(elapsed),
+                              _clock(remaining) if remaining == remaining
+                              else '?'))
+        self.stream.flush()
+
+
+def main(argv=None):
+    '''Run the `pyrubberband` command.
+
+    Parameters
+    ----------
+    argv : list of str or None
+        The command-line arguments.  If `None`, `sys.argv[1:]` is used.
+
+    Returns
+    -------
+    status : int
+        0 if every job succeeded, 1 otherwise
+    '''
+    parser = argparse.ArgumentParser(
+        prog='pyrubberband',
+        description='Time stretch and pitch shift audio files in bulk, '
+                    'from a CSV or JSON lines manifest.  Finished jobs '
+                    'are recorded, and skipped when the manifest is run '
+                    'again.')
+    parser.add_argument('manifest', help='CSV or JSON lines (.jsonl) file '
+                        'with the fields input, operation, params, output')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes '
+                             '(default: the number of CPUs)')
+    parser.add_argument('--log', default=None,
+                        help='SQLite database of finished jobs '
+                             '(default: <manifest>.done.sqlite)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='time limit for each job, in seconds')
+    parser.add_argument('--progress', type=float, default=10.0,
+                        metavar='SECONDS',
+                        help='interval between progress reports, '
+                             'or 0 for a final report only (default: 10)')
+    args = parser.parse_args(argv)
+
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be a positive integer')
+
+    if args.timeout is not None and args.timeout <= 0:
+        parser.error('--timeout must be positive')
+
+    workers = args.workers or os.cpu_count() or 1
+    base = os.path.dirname(os.path.abspath(args.manifest))
+
+    try:
+        jobs = [_parse_job(row, base, '{}:{}'.format(args.manifest, line))
+                for line, row in _read_manifest(args.manifest)]
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+
+    log = _Log(args.log or args.manifest + '.done.sqlite')
+    try:
+        finished = log.finished()
+
+        pending = []
+        for job in jobs:
+            if job['key'] not in finished:
+                pending.append(job)
+                finished.add(job['key'])
+
+        sys.stderr.write('{} jobs, {} already finished\n'.format(
+            len(jobs), len(jobs) - len(pending)))
+
+        progress = _Progress(len(pending), args.progress)
+        queued = iter(pending)
+        running = set()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # Keep the workers busy, without submitting every job
+                # up front
+                for job in queued:
+                    running.add(executor.submit(_run_job, job,
+                                                args.timeout))
+                    if len(running) >= 2 * workers:
+                        break
+
+                if not running:
+                    break
+
+                done, running = wait(running, timeout=args.progress or None,
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, seconds, error = future.result()
+                    log.record(key, seconds, error)
+                    progress.update(error)
+                    if error is not None:
+                        sys.stderr.write('failed: {}: {}\n'.format(
+                            json.loads(key)[0], error))
+
+                progress.report()
+
+        progress.report(force=True)
+    finally:
+        log.close()
+
+    return 1 if progress.failed else 0
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+'''Instrumentation
+
+Every call into `rubberband` is broken into phases, and each phase is
+reported as an `Event` to the registered hooks.  A hook is any callable
+that accepts a single `Event`.
+
+Phases are:
+
+- `'write'`: encoding the input audio (to a file or a pipe)
+- `'spawn'`: starting the `rubberband` process
+- `'process'`: waiting for `rubberband` to finish
+- `'read'`: decoding the output audio
+- `'library'`: processing with the library backend
+- `'fast'`: processing with the fast (phase vocoder) backend
+- `'total'`: the entire call, including all of the above
+
+.. autosummary::
+    :toctree: generated/
+
+    Event
+    add_hook
+    remove_hook
+    hooks
+    PhaseHistogram
+
+Examples
+--------
+>>> histogram = pyrb.instrument.PhaseHistogram()
+>>> with pyrb.instrument.hooks(histogram):
+...     y_shift = pyrb.pitch_shift(y, sr, 2)
+>>> histogram.summary()[('pitch_shift', 'process')]['mean']
+0.071...
+'''
+
+import bisect
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+
+__all__ = ['Event', 'add_hook', 'remove_hook', 'hooks', 'PhaseHistogram']
+
+
+Event = namedtuple('Event', ['operation', 'phase', 'duration', 'nbytes',
+                             'command', 'returncode', 'max_rss', 'tempdir'])
+Event.__new__.__defaults__ = (None,) * 5
+Event.__doc__ = '''A timed phase of a pyrubberband call.
+
+Attributes
+----------
+operation : str
+    The public function being executed, e.g. `'pitch_shift'`
+
+phase : str
+    The phase of the call (see `pyrubberband.instrument`)
+
+duration : float
+    Wall-clock duration of the phase, in seconds
+
+nbytes : int or None
+    Bytes of audio written (`'write'`) or read (`'read'`)
+
+command : tuple of str or None
+    The `rubberband` command line
+
+returncode : int or None
+    Exit status of `rubberband` (`'process'` phase)
+
+max_rss : int or None
+    Peak resident set size of the `rubberband` process, in kilobytes,
+    where the platform reports it (`'process'` phase)
+
+tempdir : str or None
+    The directory of the temporary files holding the audio
+    (`'write'` and `'read'` phases), or `None` if no files were used.
+    See `pyrubberband.set_tempdir`.
+'''
+
+# Replaced (never mutated) so that emitters can iterate without a lock
+__HOOKS = ()
+__LOCK = threading.Lock()
+
+
+def add_hook(hook):
+    '''Register a hook to receive instrumentation events.
+
+    Parameters
+    ----------
+    hook : callable
+        Called as `hook(event)` for each `Event`.
+        Hooks may be called concurrently from multiple threads.
+    '''
+    global __HOOKS
+
+    with __LOCK:
+        __HOOKS = __HOOKS + (hook,)
+
+
+def remove_hook(hook):
+    '''Unregister a hook.
+
+    Parameters
+    ----------
+    hook : callable
+        A hook previously passed to `add_hook`
+
+    Raises
+    ------
+    ValueError
+        if `hook` is not registered
+    '''
+    global __HOOKS
+
+    with __LOCK:
+        registered = list(__HOOKS)
+        registered.remove(hook)
+        __HOOKS = tuple(registered)
+
+
+@contextmanager
+def hooks(*callbacks):
+    '''Register hooks for the duration of a `with` block.
+
+    Parameters
+    ----------
+    *callbacks : callable
+        Hooks to register
+    '''
+    for hook in callbacks:
+        add_hook(hook)
+    try:
+        yield
+    finally:
+        for hook in callbacks:
+            remove_hook(hook)
+
+
+def active():
+    '''Check whether any hooks are registered'''
+    return bool(__HOOKS)
+
+
+def emit(operation, phase, duration, **kwargs):
+    '''Send an event to all registered hooks'''
+    registered = __HOOKS
+    if not registered:
+        return
+
+    event = Event(operation, phase, duration, **kwargs)
+    for hook in registered:
+        hook(event)
+
+
+@contextmanager
+def timed(operation, phase, **kwargs):
+    '''Time a `with` block, and emit it as an event.
+
+    The yielded dictionary may be updated with additional event fields
+    (e.g. `nbytes`) before the block exits.
+    '''
+    fields = dict(kwargs)
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        emit(operation, phase, time.perf_counter() - start, **fields)
+
+
+class PhaseHistogram(object):
+    '''A hook that aggregates event durations by operation and phase.
+
+    Durations are counted in logarithmically spaced buckets, suitable for
+    export to a metrics system.
+
+    Parameters
+    ----------
+    bounds : iterable of float
+        Upper bounds of the histogram buckets, in seconds.
+        Durations above the last bound are counted in an overflow bucket.
+        By default, 1ms to about 100s in half-decade steps.
+    '''
+
+    def __init__(self, bounds=None):
+        if bounds is None:
+            bounds = np.logspace(-3, 2, num=11)
+
+        self.bounds = tuple(float(b) for b in bounds)
+        self._lock = threading.Lock()
+        self._data = dict()
+
+    def __call__(self, event):
+        key = (event.operation, event.phase)
+        bucket = bisect.bisect_left(self.bounds, event.duration)
+
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = dict(count=0, total=0.0,
+                                       buckets=[0] * (len(self.bounds) + 1))
+            data = self._data[key]
+            data['count'] += 1
+            data['total'] += event.duration
+            data['buckets'][bucket] += 1
+
+    def summary(self):
+        '''Summarize the recorded events.
+
+        Returns
+        -------
+        summary : dict
+            Maps `(operation, phase)` to a dictionary with the event `count`,
+            `total` and `mean` duration, and the `buckets` counts
+            (one per bound, plus overflow).
+        '''
+        with self._lock:
+            return {key: dict(count=data['count'],
+                              total=data['total'],
+                              mean=data['total'] / data['count'],
+                              buckets=list(data['buckets']))
+                    for key, data in self._data.items()}
+
+    def reset(self):
+        '''Discard all recorded events'''
+        with self._lock:
+            self._data.clear()
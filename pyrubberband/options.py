@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+'''Rubberband options
+
+A `RubberbandOptions` describes the processing options for `rubberband`
+as a validated, immutable value.  It can be passed anywhere `rbargs` is
+accepted, and shared freely between threads.  Since it is hashable, it can
+also be used as a dictionary key, for example to index presets.
+
+.. autosummary::
+    :toctree: generated/
+
+    RubberbandOptions
+'''
+
+from dataclasses import dataclass, field
+
+
+__all__ = ['RubberbandOptions']
+
+_ENGINES = {'R2': '--faster', 'R3': '--fine'}
+_WINDOWS = {'standard': (), 'long': ('--window-long',),
+            'short': ('--window-short',)}
+_TRANSIENTS = {'crisp': (), 'mixed': ('--bl-transients',),
+               'smooth': ('--no-transients',)}
+_DETECTORS = {'compound': (), 'percussive': ('--detector-perc',),
+              'soft': ('--detector-soft',)}
+_SWITCHES = (('formant', '--formant'),
+             ('pitch_hq', '--pitch-hq'),
+             ('smoothing', '--smoothing'),
+             ('centre_focus', '--centre-focus'),
+             ('channels_together', '--channels-together'))
+
+
+def _choice(name, value, choices):
+    if value is not None and value not in choices:
+        raise ValueError('{} must be one of {}, not {!r}'.format(
+            name, sorted(choices), value))
+
+
+@dataclass(frozen=True)
+class RubberbandOptions(object):
+    '''Processing options for `rubberband`.
+
+    Options left at their defaults are not passed to `rubberband`, which
+    then uses its own defaults.  See `rubberband -h` for the full
+    description of each option.
+
+    Parameters
+    ----------
+    engine : None, `'R2'`, or `'R3'`
+        The processing engine: `'R2'` (`--faster`) or `'R3'`
+        (`--fine`).
+        `'R3'` requires `rubberband` 3.0 or later.
+
+    formant : bool
+        Preserve formants when pitch shifting (`--formant`)
+
+    crispness : int in [0, 6] or None
+        Transient sharpness (`--crisp`)
+
+    window : None, `'standard'`, `'long'`, or `'short'`
+        Analysis window size (`--window-long`, `--window-short`)
+
+    transients : None, `'crisp'`, `'mixed'`, or `'smooth'`
+        Phase reset at transients (`--bl-transients`, `--no-transients`)
+
+    detector : None, `'compound'`, `'percussive'`, or `'soft'`
+        Transient detector (`--detector-perc`, `--detector-soft`)
+
+    threads : bool or None
+        Force (`--threads`) or prevent (`--no-threads`) multithreaded
+        processing.  If `None`, `rubberband` decides.
+
+    pitch_hq : bool
+        Highest quality pitch shifting (`--pitch-hq`)
+
+    smoothing : bool
+        Spectral smoothing (`--smoothing`)
+
+    centre_focus : bool
+        Preserve focus of centre-panned audio in stereo (`--centre-focus`)
+
+    channels_together : bool
+        Process all channels together (`--channels-together`)
+
+    extra : tuple of (str, str)
+        Additional options, as `(key, value)` pairs in the form of `rbargs`
+
+    Attributes
+    ----------
+    argv : tuple of str
+        The options as `rubberband` arguments
+
+    Raises
+    ------
+    ValueError
+        if an option has an invalid value
+
+    Examples
+    --------
+    >>> vocal = pyrb.RubberbandOptions(engine='R3', formant=True)
+    >>> vocal.argv
+    ('--fine', '--formant')
+    >>> y_shift = pyrb.pitch_shift(y, sr, 3, rbargs=vocal)
+    '''
+
+    engine: object = None
+    formant: bool = False
+    crispness: object = None
+    window: object = None
+    transients: object = None
+    detector: object = None
+    threads: object = None
+    pitch_hq: bool = False
+    smoothing: bool = False
+    centre_focus: bool = False
+    channels_together: bool = False
+    extra: tuple = ()
+    argv: tuple = field(init=False, repr=False, compare=False)
+    _items: tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        _choice('engine', self.engine, _ENGINES)
+        _choice('window', self.window, _WINDOWS)
+        _choice('transients', self.transients, _TRANSIENTS)
+        _choice('detector', self.detector, _DETECTORS)
+        _choice('threads', self.threads, (True, False))
+
+        if self.crispness is not None and (
+                not isinstance(self.crispness, int) or
+                isinstance(self.crispness, bool) or
+                self.crispness not in range(7)):
+            raise ValueError('crispness must be an integer in [0, 6], '
+                             'not {!r}'.format(self.crispness))
+
+        # Normalize, so that equal options compare and hash equal
+        extra = tuple((str(key), str(value)) for key, value in
+                      (self.extra.items() if isinstance(self.extra, dict)
+                       else self.extra))
+        object.__setattr__(self, 'extra', extra)
+
+        items = self._render()
+        object.__setattr__(self, '_items', items)
+
+        argv = []
+        for key, value in items:
+            argv.append(key)
+            if value.strip():
+                argv.append(value)
+        object.__setattr__(self, 'argv', tuple(argv))
+
+    def items(self):
+        '''The options as `(key, value)` pairs, in the form of `rbargs`'''
+        return self._items
+
+    def _render(self):
+        pairs = []
+
+        if self.engine is not None:
+            pairs.append((_ENGINES[self.engine], ''))
+
+        if self.crispness is not None:
+            pairs.append(('--crisp', str(self.crispness)))
+
+        for flags, table in [(self.window, _WINDOWS),
+                             (self.transients, _TRANSIENTS),
+                             (self.detector, _DETECTORS)]:
+            if flags is not None:
+                pairs.extend((flag, '') for flag in table[flags])
+
+        if self.threads is not None:
+            pairs.append(('--threads' if self.threads else '--no-threads',
+                          ''))
+
+        for name, flag in _SWITCHES:
+            if getattr(self, name):
+                pairs.append((flag, ''))
+
+        pairs.extend(self.extra)
+        return tuple(pairs)
+
+    def validate(self, info):
+        '''Check that a `rubberband` executable supports these options.
+
+        Parameters
+        ----------
+        info : pyrubberband.BackendInfo
+            The capabilities of the executable,
+            from `pyrubberband.get_backend_info`
+
+        Raises
+        ------
+        ValueError
+            if the engine or any option is not supported
+        '''
+        if self.engine is not None and self.engine not in info.engines:
+            raise ValueError('rubberband {} does not support the {} '
+                             'engine'.format(info.version_string,
+                                             self.engine))
+
+        # Nothing to check against if the usage could not be parsed
+        if not info.flags:
+            return
+
+        unsupported = [key for key, _ in self.items()
+                       if key not in info.flags]
+        if unsupported:
+            raise ValueError('rubberband {} does not support {}'.format(
+                info.version_string, ', '.join(unsupported)))
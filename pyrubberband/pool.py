@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+'''Worker pool
+
+Every call into `rubberband` starts a new process, and starting a process
+means forking the caller first.  The cost of a fork grows with the memory
+of the process being forked, so in a large Python process it can dominate
+the time spent on short signals.
+
+A `WorkerPool` keeps a set of small helper processes alive, which start
+`rubberband` on behalf of the caller.  Once installed with
+`pyrubberband.set_pool`, `time_stretch`, `pitch_shift`, and the other
+functions that exchange audio through files run their `rubberband`
+processes through the pool.  Calls made with `set_transport('pipe')`
+still start `rubberband` directly.
+
+The pool is only available on POSIX platforms.
+
+.. autosummary::
+    :toctree: generated/
+
+    WorkerPool
+'''
+
+import json
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import threading
+
+
+__all__ = ['WorkerPool']
+
+# Run by path, so that workers do not import the package (or numpy)
+_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       '_worker.py')
+
+
+class _Worker(object):
+    '''A helper process that runs one command at a time'''
+
+    def __init__(self):
+        self.proc = None
+
+    def start(self):
+        # In a session of its own, so that the worker and the command it
+        # runs can be killed together
+        self.proc = subprocess.Popen([sys.executable, '-I', _WORKER],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL,
+                                     bufsize=0, start_new_session=True)
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def request(self, job, timeout=None):
+        '''Send a job and wait for the reply.
+
+        Returns `None` if the worker exited.
+
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            if there is no reply within `timeout` seconds
+        '''
+        try:
+            self.proc.stdin.write((json.dumps(job) + '\n').encode('utf-8'))
+        except OSError:
+            return None
+
+        if timeout is not None:
+            ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+            if not ready:
+                raise subprocess.TimeoutExpired(job.get('args'), timeout)
+
+        line = self.proc.stdout.readline()
+        if not line:
+            return None
+
+        return json.loads(line.decode('utf-8'))
+
+    def kill(self):
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.proc.wait()
+
+    def stop(self):
+        if self.proc is None:
+            return
+
+        self.kill()
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+
+class WorkerPool(object):
+    '''A pool of long-lived helper processes for running `rubberband`.
+
+    Each worker runs one `rubberband` process at a time.  Jobs wait for an
+    idle worker in the order they arrive.  Workers that exit, or that stop
+    answering, are replaced automatically.
+
+    Parameters
+    ----------
+    size : int > 0 or None
+        Number of workers.  If `None`, use the number of available CPUs.
+
+    max_pending : int >= 0 or None
+        Number of jobs that may wait for a worker, in addition to the
+        `size` running jobs.  Further jobs block until there is room,
+        or raise `queue.Full` if they are submitted with `block=False`.
+        If `None`, any number of jobs may wait.
+
+    timeout : float > 0 or None
+        Default time limit for each job, in seconds.
+        If `None`, jobs may run indefinitely.
+
+    health_timeout : float > 0
+        Time a worker has to answer a health check, or to report on a job
+        after its time limit, in seconds.
+
+    Attributes
+    ----------
+    restarts : int
+        Number of workers that have been replaced
+
+    Examples
+    --------
+    >>> with pyrb.WorkerPool(size=4, timeout=60) as pool:
+    ...     pyrb.set_pool(pool)
+    ...     y_shift = pyrb.batch_pitch_shift(ys, sr, 2, n_jobs=4)
+    ...     pyrb.set_pool(None)
+    '''
+
+    def __init__(self, size=None, max_pending=None, timeout=None,
+                 health_timeout=5.0):
+        if size is None:
+            size = os.cpu_count() or 1
+
+        if size < 1:
+            raise ValueError('size must be a positive integer or None')
+
+        if max_pending is not None and max_pending < 0:
+            raise ValueError('max_pending must be non-negative or None')
+
+        if timeout is not None and timeout <= 0:
+            raise ValueError('timeout must be positive or None')
+
+        if health_timeout <= 0:
+            raise ValueError('health_timeout must be positive')
+
+        self.size = size
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.health_timeout = health_timeout
+
+        self.restarts = 0
+        self.closed = False
+
+        self._lock = threading.Lock()
+        self._slots = None
+        if max_pending is not None:
+            self._slots = threading.BoundedSemaphore(size + max_pending)
+
+        # Most recently used first, so that busy periods reuse warm workers
+        self._idle = queue.LifoQueue()
+        self._workers = [_Worker() for _ in range(size)]
+
+        try:
+            for worker in self._workers:
+                worker.start()
+                self._idle.put(worker)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _restart(self, worker):
+        if self.closed:
+            worker.stop()
+            return
+
+        with self._lock:
+            self.restarts += 1
+        worker.restart()
+
+    def _acquire(self):
+        '''Wait for an idle worker, restarting it if it has exited'''
+        if self.closed:
+            raise RuntimeError('WorkerPool is closed')
+
+        worker = self._idle.get()
+        if not worker.alive():
+            try:
+                self._restart(worker)
+            except BaseException:
+                self._idle.put(worker)
+                raise
+
+            # Closed while waiting: the worker was stopped, not restarted
+            if worker.proc is None:
+                self._idle.put(worker)
+                raise RuntimeError('WorkerPool is closed')
+
+        return worker
+
+    def run(self, arguments, timeout=None, block=True, cpu_time=None,
+            memory=None, nice=None):
+        '''Run a command on a worker, and wait for it to exit.
+
+        Parameters
+        ----------
+        arguments : list of str
+            The command line to run.  The process's stdin and stdout
+            are closed.
+
+        timeout : float > 0 or None
+            Time limit for this job, in seconds.
+            If `None`, the pool's default `timeout` is used.
+
+        block : bool
+            If `False`, raise `queue.Full` instead of waiting when the pool
+            already has `max_pending` jobs waiting.
+
+        cpu_time, memory, nice : number or None
+            Resource limits for the command.
+            See `pyrubberband.set_limits`.
+
+        Returns
+        -------
+        returncode : int
+            The exit status of the command
+
+        max_rss : int or None
+            Peak resident set size of the command, in kilobytes
+
+        stderr : bytes
+            The end of the command's error output
+
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            if the command ran for longer than `timeout`.
+            The command is killed, and the exception's `stderr` holds the
+            end of its error output.
+
+        OSError
+            if the command could not be started
+
+        queue.Full
+            if `block=False` and there is no room for another job
+
+        RuntimeError
+            if the pool is closed, or the job could not be completed
+            because its worker failed twice
+        '''
+        if timeout is None:
+            timeout = self.timeout
+
+        if self._slots is not None and not self._slots.acquire(block):
+            raise queue.Full('WorkerPool has {} jobs pending'.format(
+                self.max_pending))
+
+        try:
+            return self._run(dict(args=list(arguments), timeout=timeout,
+                                  cpu_time=cpu_time, memory=memory,
+                                  nice=nice))
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def _run(self, job):
+        arguments, timeout = job['args'], job['timeout']
+
+        # The worker enforces the time limit itself: allow it a little
+        # longer to report back before giving up on it
+        wait = None if timeout is None else timeout + self.health_timeout
+
+        # A worker that dies mid-job is replaced, and the job retried once
+        for _ in range(2):
+            worker = self._acquire()
+            try:
+                reply = worker.request(job, wait)
+                if reply is None:
+                    self._restart(worker)
+            except subprocess.TimeoutExpired:
+                self._restart(worker)
+                raise subprocess.TimeoutExpired(arguments, timeout)
+            finally:
+                self._idle.put(worker)
+
+            if reply is not None:
+                break
+        else:
+            raise RuntimeError('rubberband worker exited unexpectedly')
+
+        if 'errno' in reply:
+            raise OSError(reply['errno'], reply['error'])
+
+        stderr = reply['stderr'].encode('utf-8')
+
+        if reply.get('timeout'):
+            raise subprocess.TimeoutExpired(arguments, timeout, stderr=stderr)
+
+        return reply['returncode'], reply['max_rss'], stderr
+
+    def check(self):
+        '''Check the health of the idle workers.
+
+        Each idle worker must answer within `health_timeout`, or it is
+        restarted.  Busy workers are not checked.
+
+        Returns
+        -------
+        restarted : int
+            The number of workers that were restarted
+        '''
+        workers = []
+        while True:
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+        restarted = 0
+        try:
+            for worker in workers:
+                try:
+                    healthy = (worker.alive() and
+                               worker.request(dict(ping=True),
+                                              self.health_timeout) ==
+                               dict(pong=True))
+                except subprocess.TimeoutExpired:
+                    healthy = False
+
+                if not healthy:
+                    self._restart(worker)
+                    restarted += 1
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+
+        return restarted
+
+    def stats(self):
+        '''Report pool usage.
+
+        Returns
+        -------
+        stats : dict
+            The number of workers (`size`), the number currently `idle`,
+            and the number of `restarts`.
+        '''
+        with self._lock:
+            return dict(size=self.size,
+                        idle=self._idle.qsize(),
+                        restarts=self.restarts)
+
+    def close(self):
+        '''Stop all workers.
+
+        Jobs that are still running are killed.
+        '''
+        self.closed = True
+
+        # Only kill the workers here: a busy worker's pipes belong to the
+        # thread waiting on it, which will find it dead and stop it.
+        for worker in self._workers:
+            worker.kill()
+
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
@@ -8,24 +8,2603 @@
     pitch_shift
     time_stretch
     timemap_stretch
+    transform
+    predict_length
+    batch_time_stretch
+    batch_pitch_shift
+    batch_timemap_stretch
+    time_stretch_many
+    pitch_shift_many
+    time_stretch_parallel
+    time_stretch_stream
+    pitch_shift_stream
+    time_stretch_file
+    pitch_shift_file
+    get_backend_info
+    set_executable
+    set_backend
+    set_transport
+    set_wire_format
+    set_tempdir
+    set_cache
+    set_pool
+    set_limits
+    RubberbandError
+    RubberbandTimeout
+    BackendInfo
 '''
 
 
+import errno
+import functools
+import hashlib
+import io
+import math
+import mmap
 import os
+import re
+import shutil
+import signal
+import socket
+import struct
 import subprocess
+import sys
 import tempfile
+import threading
+import weakref
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import soundfile as sf
 
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # Not available on Windows
+    resource = None
+
+from . import _librubberband
+from . import _vocoder
+from . import instrument
+from .options import RubberbandOptions
+
+
+__all__ = ['time_stretch', 'pitch_shift', 'timemap_stretch', 'transform',
+           'predict_length',
+           'batch_time_stretch', 'batch_pitch_shift', 'batch_timemap_stretch',
+           'time_stretch_many', 'pitch_shift_many', 'time_stretch_parallel',
+           'time_stretch_stream', 'pitch_shift_stream',
+           'time_stretch_file', 'pitch_shift_file',
+           'get_backend_info', 'set_executable', 'set_backend',
+           'set_transport', 'set_wire_format', 'set_tempdir', 'set_cache',
+           'set_pool', 'set_limits', 'RubberbandError', 'RubberbandTimeout',
+           'BackendInfo']
+
+__RUBBERBAND_UTIL = os.environ.get('PYRUBBERBAND_CLI', 'rubberband')
+# RubberbandOptions already validated, by executable
+__VALIDATED = set()
+# Key under which __rbargs passes RubberbandOptions through, unrendered
+__OPTIONS = 'options'
+# Absolute paths and probed BackendInfo, by executable
+__EXECUTABLES = dict()
+__BACKEND_INFO = dict()
+__BACKEND_INFO_LOCK = threading.Lock()
+__TRANSPORTS = ('tempfile', 'pipe')
+__TRANSPORT = 'tempfile'
+# Whether a given rubberband executable can read and write pipes
+__PIPE_SUPPORT = dict()
+__CACHE = None
+__POOL = None
+__LIMITS = dict(timeout=None, cpu_time=None, memory=None, nice=None)
+# Bytes of rubberband's error output to keep for exceptions
+__STDERR_TAIL = 2**12
+__BACKENDS = ('cli', 'library', 'fast')
+__BACKEND = 'cli'
+__WIRE_FORMATS = ('FLOAT', 'DOUBLE', 'PCM_16', 'PCM_24', 'PCM_32')
+__WIRE_FORMAT = 'FLOAT'
+# Bytes per sample of each wire format
+__WIRE_BYTES = {'FLOAT': 4, 'DOUBLE': 8, 'PCM_16': 2, 'PCM_24': 3, 'PCM_32': 4}
+# Most channels to pack into one rubberband process, for batch inputs
+__BATCH_CHANNELS = 64
+# Scratch directory selected by set_tempdir, or None for the default
+__TEMPDIR = None
+# In-memory scratch directory, used by default for files of known size
+__MEMORY_TEMPDIR = '/dev/shm'
+# Free bytes to leave in the in-memory directory: less counts as full
+__FULL_BYTES = 2**20
+# Scratch directories already swept for files of exited processes
+__SWEPT = set()
+# Reusable scratch files of each thread
+__SCRATCH = threading.local()
+__SCRATCH_NAME = re.compile(r'pyrb-([0-9a-f]{8})-(\d+)-')
+# Sample types of WAV files, by (format tag, bits per sample)
+__WAV_DTYPES = {(1, 16): '<i2', (1, 32): '<i4', (3, 32): '<f4', (3, 64): '<f8'}
+DEVNULL = subprocess.DEVNULL
+
+# Default number of frames per block for streaming
+BLOCK_SIZE = 2**16
+
+
+BackendInfo = namedtuple('BackendInfo', ['path', 'version', 'version_string',
+                                         'flags', 'engines', 'pipes'])
+BackendInfo.__doc__ = '''Capabilities of the `rubberband` command-line utility.
+
+Attributes
+----------
+path : str
+    Absolute path of the executable
+
+version : tuple of int or None
+    The version number, e.g. `(3, 3, 0)`, or `None` if it could not be
+    determined
+
+version_string : str
+    The output of `rubberband --version`
+
+flags : frozenset of str
+    The options listed by `rubberband -h`, e.g. `'--formant'`
+
+engines : tuple of str
+    The supported processing engines: `'R2'` (faster), and `'R3'`
+    (finer, but slower) for `rubberband` 3.0 and later
+
+pipes : bool
+    Whether `rubberband` can read from stdin and write to stdout
+    (version 3.3 and later), which is required for `set_transport('pipe')`
+'''
+
+
+def __probe():
+    '''Run `rubberband --version` and `rubberband -h`, and parse them'''
+    path = __executable()
+    if not os.path.isabs(path):
+        raise RuntimeError('Failed to execute rubberband. '
+                           'Please verify that rubberband-cli '
+                           'is installed.')
+
+    def __run(*arguments):
+        # Some versions print to stderr, or exit with an error
+        return subprocess.run([path] + list(arguments),
+                              stdin=DEVNULL, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, timeout=10,
+                              universal_newlines=True).stdout
+
+    try:
+        version_string = __run('--version').strip()
+        usage = __run('-h')
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        raise RuntimeError('Failed to execute rubberband. '
+                           'Please verify that rubberband-cli '
+                           'is installed.') from exc
+
+    match = re.search(r'(\d+)\.(\d+)(?:\.(\d+))?', version_string)
+    version = None
+    if match is not None:
+        version = tuple(int(v) for v in match.groups() if v is not None)
+
+    flags = frozenset(re.findall(r'(?<![\w-])(--?[A-Za-z0-9][\w-]*)', usage))
+
+    engines = ('R2',)
+    if {'--fine', '-3'} & flags or (version is not None and version >= (3,)):
+        engines = ('R2', 'R3')
+
+    pipes = version is not None and version >= (3, 3)
+
+    return BackendInfo(path=path, version=version,
+                       version_string=version_string, flags=flags,
+                       engines=engines, pipes=pipes)
+
+
+def get_backend_info(refresh=False):
+    '''Describe the installed `rubberband` command-line utility.
+
+    The executable is located and probed once, with `rubberband --version`
+    and `rubberband -h`, and the result is cached.
+
+    Parameters
+    ----------
+    refresh : bool
+        If `True`, locate and probe the executable again, for example
+        after upgrading `rubberband`
+
+    Returns
+    -------
+    info : BackendInfo
+        The location, version and capabilities of `rubberband`
+
+    Raises
+    ------
+    RuntimeError
+        if `rubberband` cannot be found or executed
+
+    See Also
+    --------
+    set_executable
+
+    Examples
+    --------
+    >>> info = pyrb.get_backend_info()
+    >>> info.version
+    (3, 3, 0)
+    >>> 'R3' in info.engines
+    True
+    '''
+    util = __RUBBERBAND_UTIL
+
+    with __BACKEND_INFO_LOCK:
+        if refresh:
+            __EXECUTABLES.pop(util, None)
+            __PIPE_SUPPORT.pop(util, None)
+
+        if refresh or util not in __BACKEND_INFO:
+            __BACKEND_INFO[util] = __probe()
+        return __BACKEND_INFO[util]
+
+
+def set_executable(path):
+    '''Select the `rubberband` command-line utility.
+
+    By default, this is the `PYRUBBERBAND_CLI` environment variable if it
+    is set, or else `rubberband` found on the `PATH`.
+
+    Anything known about `path` from earlier calls is discarded: it is
+    located and probed again on first use.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        The name of the executable on the `PATH`, or its path
+
+    See Also
+    --------
+    get_backend_info
+    '''
+    global __RUBBERBAND_UTIL
+
+    util = os.fspath(path)
+    with __BACKEND_INFO_LOCK:
+        __EXECUTABLES.pop(util, None)
+        __PIPE_SUPPORT.pop(util, None)
+        __BACKEND_INFO.pop(util, None)
+        __RUBBERBAND_UTIL = util
+
+
+def __executable():
+    '''Resolve the rubberband executable on the PATH, once'''
+    util = __RUBBERBAND_UTIL
+    path = __EXECUTABLES.get(util)
+
+    if path is None:
+        path = shutil.which(util)
+        if path is None:
+            # Leave the failure to exec, and its error handling
+            return util
+        __EXECUTABLES[util] = path
+
+    return path
+
+
+def __pipes_supported():
+    '''Check whether the current executable can use pipes'''
+    util = __RUBBERBAND_UTIL
+    if util not in __PIPE_SUPPORT:
+        try:
+            __PIPE_SUPPORT[util] = get_backend_info().pipes
+        except RuntimeError:
+            # Let the call itself report the error
+            return True
+
+    return __PIPE_SUPPORT[util]
+
+
+def set_backend(backend):
+    '''Select the implementation used to process audio.
+
+    Parameters
+    ----------
+    backend : str
+        One of:
+
+        - `'cli'` (default): run the `rubberband` command-line utility.
+        - `'library'`: call the Rubber Band library (`librubberband`)
+          directly on the audio buffers, with no subprocess or files.
+          Calls that the library backend cannot serve, either because
+          the library is not installed or because `rbargs` contains an
+          option it does not support, fall back to `'cli'`.
+        - `'fast'`: an approximate phase vocoder in NumPy, for previews.
+          It runs in-process, on all channels at once, and is typically
+          several times faster than `'cli'` on short signals, at the
+          cost of quality: transients are smeared, stretches far from 1
+          sound "phasy", upward shifts alias slightly, and formants are
+          not preserved.  Options that only tune `rubberband`'s
+          algorithm (such as `--crisp` or `--fine`) are ignored; calls
+          with other options, such as `--formant`, fall back to `'cli'`.
+
+        The library is located with `ctypes.util.find_library`, or from
+        the `PYRUBBERBAND_LIBRARY` environment variable if it is set.
+
+        Audio files (see `time_stretch`) are always processed by `'cli'`.
+
+    Raises
+    ------
+    ValueError
+        if `backend` is not a supported backend
+
+    Examples
+    --------
+    >>> # Preview quickly, then render with rubberband
+    >>> pyrb.set_backend('fast')
+    >>> y_preview = pyrb.time_stretch(y, sr, 1.25)
+    >>> pyrb.set_backend('cli')
+    >>> y_final = pyrb.time_stretch(y, sr, 1.25)
+    '''
+    global __BACKEND
+
+    if backend not in __BACKENDS:
+        raise ValueError('backend must be one of {}, not {!r}'.format(
+            __BACKENDS, backend))
+
+    __BACKEND = backend
+
+
+def set_transport(transport):
+    '''Select how audio is exchanged with the `rubberband` process.
+
+    Parameters
+    ----------
+    transport : str
+        One of:
+
+        - `'tempfile'` (default): the input and output are written to
+          temporary WAV files on disk.
+        - `'pipe'`: the input is streamed to `rubberband` over stdin, and
+          the output is read back from stdout, so no files are created.
+          If the installed `rubberband` cannot read from pipes, this
+          falls back to `'tempfile'`.
+
+    Raises
+    ------
+    ValueError
+        if `transport` is not a supported mode
+    '''
+    global __TRANSPORT
+
+    if transport not in __TRANSPORTS:
+        raise ValueError('transport must be one of {}, not {!r}'.format(
+            __TRANSPORTS, transport))
+
+    __TRANSPORT = transport
+
+
+def set_wire_format(subtype):
+    '''Select the sample format used to exchange audio with `rubberband`.
+
+    Audio is always encoded as WAV, independently of the dtype of the input.
+    Results are decoded directly to the dtype of the input (or of `out`,
+    where supported), so the wire format only determines the precision and
+    size of the intermediate data.
+
+    Parameters
+    ----------
+    subtype : str
+        One of:
+
+        - `'FLOAT'` (default): 32-bit floating point.
+          This is lossless for `float32` input, and does not clip.
+        - `'DOUBLE'`: 64-bit floating point, for lossless `float64`
+          round trips at twice the I/O cost.
+        - `'PCM_16'`, `'PCM_24'`, `'PCM_32'`: fixed point.
+          `'PCM_16'` halves the I/O cost of `'FLOAT'`, but quantizes the
+          signal to 16 bits and clips it to `[-1, 1]`.  This was the
+          behavior of pyrubberband 0.4 and earlier.
+
+    Raises
+    ------
+    ValueError
+        if `subtype` is not a supported format
+    '''
+    global __WIRE_FORMAT
+
+    if subtype not in __WIRE_FORMATS:
+        raise ValueError('subtype must be one of {}, not {!r}'.format(
+            __WIRE_FORMATS, subtype))
+
+    __WIRE_FORMAT = subtype
+
+
+def set_tempdir(path=None):
+    '''Select the directory for temporary files.
+
+    The audio and time map files exchanged with `rubberband` are written
+    here.  Each thread keeps its own set of files, which are reused from
+    one call to the next and removed when the thread exits.
+
+    Files are named `pyrb-<host>-<pid>-*`, where `<host>` identifies the
+    machine, boot, and PID namespace of the process.  The first time a
+    directory is used, files left there by processes of the same `<host>`
+    that no longer exist, for example after a crash, are removed.
+
+    Parameters
+    ----------
+    path : str, os.PathLike, or None
+        The directory to use.  If `None`, files of in-memory signals go to
+        `/dev/shm` where it exists and has room for them, and everything
+        else to the default `tempfile` directory.  If `/dev/shm` fills up
+        during a call, the call is run again on disk.
+
+        Memory-mapped results of processing audio files, and the files of
+        streaming functions, are always kept on disk by default, since
+        they can be larger than memory.
+
+    Raises
+    ------
+    ValueError
+        if `path` is not a directory
+    '''
+    global __TEMPDIR
+
+    if path is not None:
+        path = os.path.abspath(os.fspath(path))
+        if not os.path.isdir(path):
+            raise ValueError('{} is not a directory'.format(path))
+
+    __TEMPDIR = path
+
+
+def __free(directory):
+    '''Free bytes in the file system of `directory`'''
+    try:
+        stat = os.statvfs(directory)
+    except (OSError, AttributeError):
+        return 0
+    return stat.f_bavail * stat.f_frsize
+
+
+def __tempdir(nbytes=0):
+    '''The scratch directory for files of `nbytes` in all, swept for
+    leftover files on first use.
+
+    Unless set by `set_tempdir`, this is the in-memory directory if it has
+    room for `nbytes`, or the default `tempfile` directory.  Files that
+    may grow without bound (`nbytes=None`) always go to the latter.
+    '''
+    directory = __TEMPDIR
+    if directory is None:
+        directory = tempfile.gettempdir()
+        memory = __MEMORY_TEMPDIR
+        if (nbytes is not None and os.path.isdir(memory) and
+                os.access(memory, os.W_OK | os.X_OK) and
+                (not nbytes or __free(memory) >= nbytes + __FULL_BYTES)):
+            directory = memory
+
+    if directory not in __SWEPT:
+        __SWEPT.add(directory)
+        __sweep(directory)
+
+    return directory
+
+
+@functools.lru_cache(maxsize=None)
+def __host():
+    '''Identify the machine, boot, and PID namespace of this process.
+
+    Process ids only have a meaning within all three, so scratch files
+    are only swept by processes that share them.
+    '''
+    parts = [socket.gethostname()]
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as fdesc:
+            parts.append(fdesc.read().strip())
+    except OSError:
+        pass
+    try:
+        parts.append(os.readlink('/proc/self/ns/pid'))
+    except (OSError, AttributeError):
+        pass
+
+    digest = hashlib.blake2b('\n'.join(parts).encode('utf-8'), digest_size=4)
+    return digest.hexdigest()
+
+
+def __alive(pid):
+    '''Check whether a process exists'''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but belongs to someone else
+        pass
+    return True
+
+
+def __sweep(directory):
+    '''Remove scratch files left by exited processes of this host'''
+    if os.name != 'posix':
+        # Signal 0 is not a harmless probe on Windows
+        return
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+
+    for name in names:
+        match = __SCRATCH_NAME.match(name)
+        if match is None or match.group(1) != __host():
+            continue
+
+        pid = int(match.group(2))
+        if pid != os.getpid() and not __alive(pid):
+            __remove(os.path.join(directory, name))
+
+
+def set_cache(cache):
+    '''Install a cache for the results of `rubberband`.
+
+    While a cache is installed, transformations are looked up by the content
+    of the input signal and the rubberband options (including the contents of
+    any time map) before running `rubberband`, and new results are stored
+    in the cache.
+
+    Parameters
+    ----------
+    cache : pyrubberband.ResultCache or None
+        The cache to use.  If `None`, caching is disabled.
+
+    Returns
+    -------
+    previous : pyrubberband.ResultCache or None
+        The previously installed cache
+
+    See Also
+    --------
+    pyrubberband.cache.ResultCache
+    '''
+    global __CACHE
+
+    previous, __CACHE = __CACHE, cache
+    return previous
+
+
+def set_pool(pool):
+    '''Run `rubberband` through a pool of worker processes.
+
+    While a pool is installed, `rubberband` processes that exchange audio
+    through files are started by the pool's workers, rather than forked
+    from this process.  This includes the default `'tempfile'` transport,
+    and the streaming and file-to-file functions.
+
+    Parameters
+    ----------
+    pool : pyrubberband.WorkerPool or None
+        The pool to use.  If `None`, processes are started directly.
+
+    Returns
+    -------
+    previous : pyrubberband.WorkerPool or None
+        The previously installed pool
+
+    See Also
+    --------
+    pyrubberband.pool.WorkerPool
+    '''
+    global __POOL
+
+    previous, __POOL = __POOL, pool
+    return previous
+
+
+def set_limits(timeout=None, cpu_time=None, memory=None, nice=None):
+    '''Set limits on the `rubberband` processes started from now on.
+
+    Each limit is disabled if it is `None`.
+
+    Resource limits and niceness are applied to the child process between
+    fork and exec.  This is only supported on POSIX platforms, and should
+    be avoided in multithreaded programs unless a `WorkerPool` is
+    installed: the pool's workers apply them instead.
+
+    None of the limits apply to the `'library'` or `'fast'` backends.
+
+    Parameters
+    ----------
+    timeout : float > 0 or None
+        Wall-clock time limit, in seconds.  If it is exceeded, `rubberband`
+        is killed and `RubberbandTimeout` is raised.  Functions that accept
+        a `timeout` parameter may override this limit per call.
+
+    cpu_time : float > 0 or None
+        CPU time limit (`RLIMIT_CPU`), in seconds.  If it is exceeded,
+        `rubberband` is killed by `SIGXCPU`, and `RubberbandError` is raised.
+
+    memory : int > 0 or None
+        Address space limit (`RLIMIT_AS`), in bytes
+
+    nice : int or None
+        Increment to the niceness (scheduling priority) of `rubberband`
+
+    Raises
+    ------
+    ValueError
+        if a limit is not positive,
+        or if resource limits are not supported on this platform
+
+    Examples
+    --------
+    >>> # Give up on any call that takes more than a minute, and keep
+    >>> # rubberband from competing with the rest of the application
+    >>> pyrb.set_limits(timeout=60, nice=10)
+    '''
+    global __LIMITS
+
+    for name, value in [('timeout', timeout), ('cpu_time', cpu_time),
+                        ('memory', memory)]:
+        if value is not None and value <= 0:
+            raise ValueError('{} must be positive or None'.format(name))
+
+    if resource is None and (cpu_time, memory, nice) != (None, None, None):
+        raise ValueError('Resource limits are not supported on this platform')
+
+    __LIMITS = dict(timeout=timeout, cpu_time=cpu_time, memory=memory,
+                    nice=nice)
+
+
+class RubberbandError(subprocess.CalledProcessError):
+    '''Raised when `rubberband` exits with an error.
+
+    Attributes
+    ----------
+    returncode : int
+        Exit status of `rubberband`.
+        Negative values are the number of the signal that killed it.
+
+    cmd : list of str
+        The `rubberband` command line
+
+    stderr : bytes
+        The end of the error output of `rubberband`
+    '''
+
+    def __str__(self):
+        message = super().__str__()
+        if self.stderr:
+            message += '\n' + self.stderr.decode('utf-8', 'replace').strip()
+        return message
+
+
+class RubberbandTimeout(subprocess.TimeoutExpired):
+    '''Raised when `rubberband` is killed for exceeding its time limit.
+
+    Attributes
+    ----------
+    timeout : float
+        The time limit, in seconds
+
+    cmd : list of str
+        The `rubberband` command line
+
+    stderr : bytes or None
+        The end of the error output of `rubberband`
+    '''
+
+    def __str__(self):
+        message = super().__str__()
+        if self.stderr:
+            message += '\n' + self.stderr.decode('utf-8', 'replace').strip()
+        return message
+
+
+def __cache_key(cache, y, sr, kwargs, backend='cli'):
+    '''Compute the cache key for processing `y` with the current executable'''
+    options = [('rubberband', __RUBBERBAND_UTIL),
+               ('backend', backend),
+               ('wire', __WIRE_FORMAT)] + list(__expand(kwargs).items())
+    return cache.key(y, sr, options)
+
+
+def __rbargs(rbargs):
+    '''Copy `rbargs` into a new dictionary.
+
+    `RubberbandOptions` are validated against the current executable,
+    once per executable, and passed through as a single entry, so that
+    their pre-rendered `argv` reaches the command line as it is.
+    '''
+    if rbargs is None:
+        return dict()
+
+    if isinstance(rbargs, RubberbandOptions):
+        key = (rbargs, __RUBBERBAND_UTIL)
+        if key not in __VALIDATED:
+            try:
+                info = get_backend_info()
+            except RuntimeError:
+                # Nothing to validate against: leave the failure, if any,
+                # to the call itself
+                return {__OPTIONS: rbargs}
+
+            rbargs.validate(info)
+            __VALIDATED.add(key)
+
+        return {__OPTIONS: rbargs}
+
+    return dict(rbargs)
+
+
+def __expand(kwargs):
+    '''Replace the `RubberbandOptions` in `kwargs`, if any, by its options.
+
+    As with a dictionary, the options take precedence over the defaults
+    set by the caller.
+    '''
+    if __OPTIONS not in kwargs:
+        return kwargs
+
+    expanded = {key: value for key, value in kwargs.items()
+                if key != __OPTIONS}
+    expanded.update(kwargs[__OPTIONS].items())
+    return expanded
+
+
+def __rubberband_args(kwargs):
+    '''Convert a dictionary of rubberband options to a list of arguments'''
+    arguments = []
+
+    for key, value in kwargs.items():
+        if key == __OPTIONS:
+            continue
+        arguments.append(str(key))
+        if len(str(value).strip()):
+            arguments.append(str(value))
+
+    # Last, so that they take precedence
+    if __OPTIONS in kwargs:
+        arguments.extend(kwargs[__OPTIONS].argv)
+
+    return arguments
+
+
+def __feed(stream, data):
+    '''Write `data` to a pipe and close it'''
+    try:
+        stream.write(data)
+    except BrokenPipeError:
+        # The process exited early; its return code tells us why
+        pass
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+
+
+def __limit_child(cpu_time, memory, nice):
+    '''Apply resource limits in a child process, between fork and exec'''
+    if nice:
+        os.nice(nice)
+
+    if cpu_time is not None:
+        # SIGXCPU at the soft limit, SIGKILL if that is ignored
+        limit = int(math.ceil(cpu_time))
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 1))
+
+    if memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+def __preexec(cpu_time=None, memory=None, nice=None, **_):
+    '''Build a `preexec_fn` for `subprocess.Popen`, if any limits are set'''
+    if (cpu_time, memory, nice) == (None, None, None):
+        return None
+
+    return functools.partial(__limit_child, cpu_time, memory, nice)
+
+
+def __kill_after(proc, timeout):
+    '''Kill a process if it is still running after `timeout` seconds.
+
+    Returns the timer (or `None` if there is no timeout), and a list that
+    is non-empty once the process has been killed.
+    '''
+    killed = []
+    if timeout is None:
+        return None, killed
+
+    def __kill():
+        # Not proc.kill(), which may reap the process before __wait does
+        killed.append(True)
+        try:
+            os.kill(proc.pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        except ProcessLookupError:
+            pass
+
+    timer = threading.Timer(timeout, __kill)
+    timer.daemon = True
+    timer.start()
+    return timer, killed
+
+
+def __wait(proc, timer=None):
+    '''Wait for a process to exit, and cancel its `__kill_after` timer.
+
+    Returns the exit code, and the peak RSS of the process in kilobytes
+    (or `None` if the platform does not report it).
+    '''
+    if timer is not None:
+        if not hasattr(os, 'waitid'):
+            # proc.wait() reaps the process, so there is nothing left for
+            # wait4 to report
+            returncode = proc.wait()
+            timer.cancel()
+            timer.join()
+            return returncode, None
+
+        # Wait without reaping, so that the timer can never signal
+        # a recycled pid
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        timer.cancel()
+        timer.join()
+
+    if not hasattr(os, 'wait4'):
+        return proc.wait(), None
+
+    _, status, rusage = os.wait4(proc.pid, 0)
+
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+
+    max_rss = rusage.ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes rather than kilobytes
+        max_rss //= 1024
+
+    return proc.returncode, max_rss
+
+
+def __tail(fdesc):
+    '''Read the last `__STDERR_TAIL` bytes of a file'''
+    size = fdesc.seek(0, os.SEEK_END)
+    fdesc.seek(max(0, size - __STDERR_TAIL))
+    return fdesc.read()
+
+
+def __spawn(arguments, operation, data, limits):
+    '''Start rubberband in a new process, and wait for it to exit.
+
+    Returns the exit code, the peak RSS, the output (if `data` is not
+    `None`), the end of the error output, and whether the process was
+    killed for exceeding its time limit.
+    '''
+    command = tuple(arguments)
+    pipe = DEVNULL if data is None else subprocess.PIPE
+
+    # A file, rather than a pipe, cannot fill up while nobody reads it
+    with tempfile.TemporaryFile() as errors:
+        with instrument.timed(operation, 'spawn', command=command):
+            proc = subprocess.Popen(arguments, stdin=pipe, stdout=pipe,
+                                    stderr=errors,
+                                    preexec_fn=__preexec(**limits))
+
+        output = None
+        with instrument.timed(operation, 'process', command=command) as event:
+            timer, killed = __kill_after(proc, limits['timeout'])
+
+            if data is not None:
+                # Feed stdin from another thread, so that neither pipe can
+                # fill up and deadlock
+                feeder = threading.Thread(target=__feed,
+                                          args=(proc.stdin, data),
+                                          daemon=True)
+                feeder.start()
+                output = proc.stdout.read()
+                proc.stdout.close()
+                feeder.join()
+
+            returncode, max_rss = __wait(proc, timer)
+            event.update(returncode=returncode, max_rss=max_rss)
+
+        stderr = __tail(errors)
+
+    return returncode, max_rss, output, stderr, bool(killed)
+
+
+def __exec(arguments, operation, data=None, timeout=None):
+    '''Run rubberband to completion.
+
+    If `data` is provided, it is written to the process's stdin, and its
+    stdout is returned.  Otherwise, the process is started by the installed
+    `WorkerPool`, if there is one.
+
+    If `timeout` is `None`, the limit set by `set_limits` applies.
+
+    Raises
+    ------
+    RubberbandError
+        if rubberband exits with an error
+
+    RubberbandTimeout
+        if rubberband runs for longer than the time limit
+    '''
+    limits = dict(__LIMITS)
+    if timeout is not None:
+        limits['timeout'] = timeout
+
+    pool = __POOL
+
+    if data is None and pool is not None:
+        # Started by a worker, so there is no spawn phase here
+        with instrument.timed(operation, 'process',
+                              command=tuple(arguments)) as event:
+            try:
+                returncode, max_rss, stderr = pool.run(arguments, **limits)
+            except subprocess.TimeoutExpired as exc:
+                raise RubberbandTimeout(arguments, exc.timeout,
+                                        stderr=exc.stderr) from None
+            event.update(returncode=returncode, max_rss=max_rss)
+
+        output, killed = None, False
+    else:
+        returncode, max_rss, output, stderr, killed = __spawn(
+            arguments, operation, data, limits)
+
+    if killed:
+        raise RubberbandTimeout(arguments, limits['timeout'], stderr=stderr)
+
+    if returncode:
+        raise RubberbandError(returncode, arguments, stderr=stderr)
+
+    return output
+
+
+def __write_audio(file, y, sr):
+    '''Encode audio as WAV in the wire format.
+
+    C-contiguous arrays are handed to libsndfile without copying;
+    other layouts are written in blocks, so that only one block at a
+    time is copied.
+    '''
+    channels = 1 if y.ndim == 1 else y.shape[1]
+
+    with sf.SoundFile(file, mode='w', samplerate=sr, channels=channels,
+                      format='WAV', subtype=__WIRE_FORMAT) as sfo:
+        if y.flags.c_contiguous:
+            sfo.write(y)
+        else:
+            for start in range(0, len(y), BLOCK_SIZE):
+                sfo.write(y[start:start + BLOCK_SIZE])
+
+
+def __read_audio(file, dtype, out=None):
+    '''Decode WAV audio to a 2-dimensional array.
+
+    If `out` is given, the audio is decoded directly into it.
+    '''
+    with sf.SoundFile(file) as sfi:
+        if out is None:
+            return sfi.read(dtype=dtype, always_2d=True)
+
+        out = out.reshape((len(out), -1))
+        if out.shape != (sfi.frames, sfi.channels):
+            raise ValueError('out has shape {}, but the output has shape '
+                             '{}'.format(out.shape,
+                                         (sfi.frames, sfi.channels)))
+        return sfi.read(out=out)
+
+
+def __check_out(y, out):
+    '''Validate an output buffer for processing `y`'''
+    if out is None:
+        return
+
+    if not isinstance(out, np.ndarray) or out.dtype.kind != 'f':
+        raise ValueError('out must be a floating point np.ndarray')
+
+    if not out.flags.c_contiguous or not out.flags.writeable:
+        raise ValueError('out must be C-contiguous and writeable')
+
+    if out.shape[1:] != y.shape[1:]:
+        raise ValueError('out has shape {}, which does not match the '
+                         'channels of y {}'.format(out.shape, y.shape))
+
+
+def __copy_out(y, out):
+    '''Return `y`, copied into `out` if it is given'''
+    y = __as_array(y)
+    if out is None:
+        return y
+
+    __check_out(y, out)
+    if out.shape != y.shape:
+        raise ValueError('out has shape {}, but the output has shape '
+                         '{}'.format(out.shape, y.shape))
+
+    out[...] = y
+    return out
+
+
+class _AudioFile(object):
+    '''Audio on disk, to be read by `rubberband` directly'''
+
+    def __init__(self, path, frames, channels, ndim):
+        self.path = path
+        self.channels = channels
+        self.ndim = ndim
+        self.shape = (frames,) if ndim == 1 else (frames, channels)
+
+    def __len__(self):
+        return self.shape[0]
+
+
+def __wav_layout(path):
+    '''Locate the samples of a WAV file.
+
+    Returns `(offset, dtype, frames, channels)`, or `None` if the file is
+    not a WAV file whose samples NumPy can use directly.
+    '''
+    try:
+        with open(path, 'rb') as fdesc:
+            header = fdesc.read(12)
+            if header[:4] not in (b'RIFF', b'RF64') or header[8:] != b'WAVE':
+                return None
+
+            fmt, size64 = None, None
+            while True:
+                chunk = fdesc.read(8)
+                if len(chunk) < 8:
+                    return None
+
+                name, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+                if name == b'data':
+                    break
+
+                body = fdesc.read(size + size % 2)
+                if name == b'fmt ':
+                    fmt = body[:size]
+                elif name == b'ds64':
+                    # RF64: the real data size
+                    size64 = struct.unpack('<Q', body[8:16])[0]
+
+            offset = fdesc.tell()
+    except OSError:
+        return None
+
+    if fmt is None or len(fmt) < 16:
+        return None
+
+    tag, channels, _, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if tag == 0xFFFE and len(fmt) >= 26:
+        # WAVE_FORMAT_EXTENSIBLE: the sub-format carries the tag
+        tag = struct.unpack('<H', fmt[24:26])[0]
+
+    dtype = __WAV_DTYPES.get((tag, bits))
+    if dtype is None or not channels:
+        return None
+
+    if size == 0xFFFFFFFF and size64 is not None:
+        size = size64
+
+    dtype = np.dtype(dtype)
+    return offset, dtype, size // (channels * dtype.itemsize), channels
+
+
+def __remove(path):
+    '''Remove a file, if it still exists'''
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def __remove_all(paths, pid):
+    '''Remove files, unless called from a forked child of their owner'''
+    if os.getpid() == pid:
+        for path in list(paths):
+            __remove(path)
+
+
+def __scratch_file(suffix, directory=None):
+    '''Create a new scratch file, by default on disk.
+
+    The caller is responsible for removing it.
+    '''
+    if directory is None:
+        directory = __tempdir(None)
+
+    fd, path = tempfile.mkstemp(prefix='pyrb-{}-{}-'.format(__host(),
+                                                            os.getpid()),
+                                suffix=suffix, dir=directory)
+    os.close(fd)
+    return path
+
+
+class _Scratch(object):
+    '''The reusable scratch files of one thread, by directory and name'''
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.free = dict()
+
+
+def __thread_scratch():
+    '''The scratch files of the calling thread'''
+    scratch = getattr(__SCRATCH, 'files', None)
+
+    # A forked child starts over, leaving its parent's files alone
+    if scratch is None or scratch.pid != os.getpid():
+        scratch = _Scratch()
+        weakref.finalize(scratch, __remove_all, scratch.free.values(),
+                         scratch.pid)
+        __SCRATCH.files = scratch
+
+    return scratch
+
+
+@contextmanager
+def __scratch(name, directory=None):
+    '''A scratch file for the calling thread, in `directory`
+    (by default, `__tempdir()`).
+
+    The file is kept for the next call from the same thread, rather than
+    created and removed each time, and removed when the thread exits.
+    Nested or interleaved uses of the same `name` get separate files.
+    '''
+    if directory is None:
+        directory = __tempdir()
+
+    key = (directory, name)
+    path = __thread_scratch().free.pop(key, None)
+    if path is None:
+        path = __scratch_file('-' + name, directory)
+
+    try:
+        yield path
+    finally:
+        scratch = __thread_scratch()
+
+        # Drop the files of directories no longer in use
+        current = (__tempdir(), __tempdir(None))
+        for stale in [other for other in scratch.free
+                      if other[0] not in current]:
+            __remove(scratch.free.pop(stale))
+
+        keep = key not in scratch.free and directory in current
+
+        if keep:
+            try:
+                # Keep the file, but release its space
+                os.truncate(path, 0)
+            except OSError:
+                keep = False
+
+        if keep:
+            scratch.free[key] = path
+        else:
+            __remove(path)
+
+
+def __transcode(path):
+    '''Convert audio to a temporary float WAV file, block by block'''
+    outfile = __scratch_file('.wav')
+
+    try:
+        with sf.SoundFile(path) as sfi:
+            # WAV files are limited to 4GB
+            big = sfi.frames * sfi.channels * 4 >= 2**32 - 2**16
+            with sf.SoundFile(outfile, mode='w', samplerate=sfi.samplerate,
+                              channels=sfi.channels,
+                              format='RF64' if big else 'WAV',
+                              subtype='FLOAT') as sfo:
+                for block in sfi.blocks(BLOCK_SIZE, dtype='float32'):
+                    sfo.write(block)
+    except BaseException:
+        __remove(outfile)
+        raise
+
+    return outfile
+
+
+def __map_audio(path, ndim, owned=False):
+    '''Map the samples of an audio file into memory.
+
+    Files that are not floating point WAV are converted to a temporary
+    one first.  Files that are `owned` are removed once the array is no
+    longer referenced; others are mapped read-only.
+    '''
+    layout = __wav_layout(path)
+    if layout is None or layout[1].kind != 'f':
+        converted = __transcode(path)
+        if owned:
+            __remove(path)
+        path, owned = converted, True
+        layout = __wav_layout(path)
+
+    offset, dtype, frames, channels = layout
+    shape = (frames,) if ndim == 1 else (frames, channels)
+
+    if not frames:
+        # Empty files cannot be mapped
+        if owned:
+            __remove(path)
+        return np.zeros(shape, dtype=dtype)
+
+    y = np.memmap(path, dtype=dtype, mode='r+' if owned else 'r',
+                  offset=offset, shape=shape)
+    if owned:
+        weakref.finalize(y, __remove_all, [path], os.getpid())
+
+    return y
+
+
+def __memmap_file(y):
+    '''The WAV file whose samples `y` maps exactly, if any'''
+    if (not isinstance(y.base, mmap.mmap) or not y.filename or
+            y.mode == 'c' or not y.flags.c_contiguous):
+        return None
+
+    layout = __wav_layout(y.filename)
+    if layout is None:
+        return None
+
+    offset, dtype, frames, channels = layout
+    shapes = [(frames, channels)] + ([(frames,)] if channels == 1 else [])
+    if y.offset != offset or y.dtype != dtype or y.shape not in shapes:
+        return None
+
+    return y.filename
+
+
+def __audio_input(y, sr):
+    '''Recognize audio that is already on disk.
+
+    Paths, `soundfile.SoundFile` objects, and `np.memmap` arrays over the
+    samples of a WAV file are returned as `_AudioFile`.  Anything else is
+    returned unchanged.
+    '''
+    ndim = None
+    if isinstance(y, (str, bytes, os.PathLike)):
+        path = os.fsdecode(y)
+    elif isinstance(y, sf.SoundFile):
+        if not isinstance(y.name, str):
+            raise ValueError('SoundFile inputs must be opened from a path')
+        path = y.name
+    elif isinstance(y, np.memmap):
+        path = __memmap_file(y)
+        if path is None:
+            return y
+        ndim = y.ndim
+    else:
+        return y
+
+    info = sf.info(path)
+    if info.samplerate != sr:
+        raise ValueError('{} has a sampling rate of {}, not {}'.format(
+            path, info.samplerate, sr))
+
+    if ndim is None:
+        ndim = 1 if info.channels == 1 else 2
+
+    return _AudioFile(os.path.abspath(path), info.frames, info.channels,
+                      ndim)
+
+
+def __as_array(y):
+    '''Map audio on disk into memory, leaving arrays unchanged'''
+    if isinstance(y, _AudioFile):
+        return __map_audio(y.path, y.ndim)
+    return y
+
+
+def __run_file(y, sr, operation, kwargs, out=None, timeout=None):
+    '''Run rubberband on audio on disk.
+
+    The output is mapped from its file, or read into `out` if it is given.
+    '''
+    outfile = __scratch_file('.wav')
+
+    arguments = [__executable(), '-q'] + __rubberband_args(kwargs)
+
+    try:
+        try:
+            __exec(arguments + [y.path, outfile], operation, timeout=timeout)
+        except OSError as exc:
+            raise RuntimeError('Failed to execute rubberband. '
+                               'Please verify that rubberband-cli '
+                               'is installed.') from exc
+
+        with instrument.timed(operation, 'read',
+                              tempdir=os.path.dirname(outfile)) as event:
+            event['nbytes'] = os.path.getsize(outfile)
+            if out is None:
+                return __map_audio(outfile, y.ndim, owned=True)
+            __read_audio(outfile, out.dtype, out)
+    except BaseException:
+        __remove(outfile)
+        raise
+
+    __remove(outfile)
+    return out
+
+
+def __scratch_bytes(y, sr, kwargs):
+    '''Estimate the size of the input and output files of a call'''
+    ratio = 1.0
+    for key, value in __expand(kwargs).items():
+        if key in ('-t', '--time'):
+            ratio = max(ratio, float(value))
+        elif key in ('-T', '--tempo'):
+            ratio = max(ratio, 1.0 / float(value))
+        elif key in ('-D', '--duration') and len(y):
+            ratio = max(ratio, float(value) * sr / len(y))
+
+    nbytes = y.size * __WIRE_BYTES[__WIRE_FORMAT]
+    return int(nbytes * (1 + ratio))
+
+
+def __full(directory, exc=None):
+    '''Whether `directory` ran out of space, as the likely cause of `exc`'''
+    if isinstance(exc, OSError) and exc.errno == errno.ENOSPC:
+        return True
+    return __free(directory) < __FULL_BYTES
+
+
+def __run_tempfile(y, sr, arguments, operation, out=None, timeout=None,
+                   nbytes=0):
+    '''Run rubberband with the input and output on disk.
+
+    The files are expected to take `nbytes` in all.  If they fill up the
+    in-memory scratch directory, the call is run again on disk.
+    '''
+    tempdir = __tempdir(nbytes)
+    retry = tempdir != __tempdir(None)
+
+    with __scratch('in.wav', tempdir) as infile, \
+            __scratch('out.wav', tempdir) as outfile:
+        try:
+            # dump the audio
+            with instrument.timed(operation, 'write',
+                                  tempdir=tempdir) as event:
+                __write_audio(infile, y, sr)
+                event['nbytes'] = os.path.getsize(infile)
+
+            __exec(arguments + [infile, outfile], operation, timeout=timeout)
+        except (OSError, RubberbandError) as exc:
+            if not (retry and __full(tempdir, exc)):
+                raise
+        else:
+            # rubberband may not notice a truncated output
+            if not (retry and __full(tempdir)):
+                # Load the processed audio.
+                with instrument.timed(operation, 'read',
+                                      tempdir=tempdir) as event:
+                    y_out = __read_audio(outfile, y.dtype, out)
+                    event['nbytes'] = os.path.getsize(outfile)
+
+                return y_out
+
+    return __run_tempfile(y, sr, arguments, operation, out, timeout,
+                          nbytes=None)
+
+
+def __run_pipe(y, sr, arguments, operation, out=None, timeout=None):
+    '''Run rubberband with the input on stdin and the output on stdout'''
+
+    with instrument.timed(operation, 'write') as event:
+        buf = io.BytesIO()
+        __write_audio(buf, y, sr)
+        data = buf.getvalue()
+        event['nbytes'] = len(data)
+
+    output = __exec(arguments + ['-', '-'], operation, data=data,
+                    timeout=timeout)
+
+    with instrument.timed(operation, 'read', nbytes=len(output)):
+        y_out = __read_audio(io.BytesIO(output), y.dtype, out)
+
+    return y_out
+
+
+def __run_cli(y, sr, transport, operation, kwargs, out=None, timeout=None):
+    '''Process audio with the rubberband command-line utility'''
+
+    # Execute rubberband
+    arguments = [__executable(), '-q'] + __rubberband_args(kwargs)
+    nbytes = __scratch_bytes(y, sr, kwargs)
+
+    try:
+        if transport == 'pipe' and __pipes_supported():
+            try:
+                y_out = __run_pipe(y, sr, arguments, operation, out, timeout)
+                __PIPE_SUPPORT[__RUBBERBAND_UTIL] = True
+            except (subprocess.CalledProcessError, RuntimeError):
+                # Either rubberband can't use pipes, or the call itself
+                # is bad.  Retry on disk to find out which.
+                y_out = __run_tempfile(y, sr, arguments, operation, out,
+                                       timeout, nbytes)
+                __PIPE_SUPPORT[__RUBBERBAND_UTIL] = False
+
+        else:
+            y_out = __run_tempfile(y, sr, arguments, operation, out, timeout,
+                                   nbytes)
+
+    except OSError as exc:
+        raise RuntimeError('Failed to execute rubberband. '
+                           'Please verify that rubberband-cli '
+                           'is installed.') from exc
+
+    return y_out
+
+
+def __library_args(y, sr, kwargs):
+    '''Translate rubberband options for the library backend.
+
+    Returns `None` if the library cannot serve this call.
+    '''
+    if not _librubberband.available():
+        return None
+
+    try:
+        return _librubberband.parse_args(__expand(kwargs), sr, len(y))
+    except NotImplementedError:
+        return None
+
+
+def __run_library(y, sr, lib_args, operation):
+    '''Process audio with the Rubber Band library'''
+    # Not reshape((len(y), -1)), which fails on empty input
+    channels = 1 if y.ndim == 1 else y.shape[1]
+    with instrument.timed(operation, 'library'):
+        y_out = _librubberband.process(y.reshape((len(y), channels)), sr,
+                                       *lib_args)
+
+    return y_out.astype(y.dtype, copy=False)
+
+
+def __vocoder_args(y, sr, kwargs):
+    '''Translate rubberband options for the fast backend.
+
+    Returns `None` if the phase vocoder cannot serve this call.
+    '''
+    try:
+        return _vocoder.parse_args(__expand(kwargs), sr, len(y))
+    except NotImplementedError:
+        return None
+
+
+def __run_vocoder(y, sr, vocoder_args, operation):
+    '''Process audio with the phase vocoder'''
+    # Not reshape((len(y), -1)), which fails on empty input
+    channels = 1 if y.ndim == 1 else y.shape[1]
+    with instrument.timed(operation, 'fast'):
+        y_out = _vocoder.process(y.reshape((len(y), channels)), sr,
+                                 *vocoder_args)
+
+    return y_out.astype(y.dtype, copy=False)
+
+
+def __rubberband(y, sr, transport=None, backend=None, operation=None,
+                 out=None, timeout=None, **kwargs):
+    '''Execute rubberband
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)]
+        Audio time series, either single or multichannel
+
+    sr : int > 0
+        sampling rate of y
+
+    transport : str or None
+        How to exchange audio with `rubberband`.
+        If `None`, the mode selected by `set_transport` is used.
+
+    backend : str or None
+        Which implementation to use.
+        If `None`, the backend selected by `set_backend` is used.
+
+    operation : str or None
+        Name of the calling function, for instrumentation events
+
+    out : np.ndarray or None
+        Buffer to receive the output.  It must be C-contiguous, and have
+        exactly the shape of the output.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.
+        If `None`, the limit set by `set_limits` applies.
+
+    **kwargs
+        keyword arguments to rubberband
+
+    Returns
+    -------
+    y_mod : np.ndarray [shape=(n,) or (n, c)]
+        `y` after rubberband transformation, or `out` if it is given
+
+    '''
+
+    assert sr > 0
+
+    __check_out(y, out)
+
+    if transport is None:
+        transport = __TRANSPORT
+
+    if transport not in __TRANSPORTS:
+        raise ValueError('transport must be one of {}, not {!r}'.format(
+            __TRANSPORTS, transport))
+
+    if backend is None:
+        backend = __BACKEND
+
+    if backend not in __BACKENDS:
+        raise ValueError('backend must be one of {}, not {!r}'.format(
+            __BACKENDS, backend))
+
+    if isinstance(y, _AudioFile):
+        # Always on disk: nothing to cache, and no library call
+        with instrument.timed(operation, 'total'):
+            return __run_file(y, sr, operation, kwargs, out, timeout)
+
+    lib_args = None
+    if backend == 'library':
+        lib_args = __library_args(y, sr, kwargs)
+    elif backend == 'fast':
+        lib_args = __vocoder_args(y, sr, kwargs)
+    if lib_args is None:
+        backend = 'cli'
+
+    with instrument.timed(operation, 'total'):
+        cache = __CACHE
+        if cache is not None:
+            key = __cache_key(cache, y, sr, kwargs, backend)
+            y_out = cache.get(key)
+            if y_out is not None:
+                return __copy_out(y_out, out)
+
+        if backend == 'library':
+            y_out = __run_library(y, sr, lib_args, operation)
+        elif backend == 'fast':
+            y_out = __run_vocoder(y, sr, lib_args, operation)
+        else:
+            y_out = __run_cli(y, sr, transport, operation, kwargs, out,
+                              timeout)
+
+        # make sure that output dimensions matches input
+        if y.ndim == 1:
+            y_out = np.squeeze(y_out, axis=1)
+
+        if cache is not None:
+            # `out` may have set the dtype of the result: cache it in the
+            # dtype of an uncached call
+            cache.put(key, y_out.astype(y.dtype, copy=False))
+
+    if out is not None:
+        # The command-line backend decodes directly into `out`
+        if not np.may_share_memory(y_out, out):
+            __copy_out(y_out, out)
+        return out
+
+    return y_out
+
+
+def __channel_groups(channel_groups, channels):
+    '''Resolve `channel_groups` to a list of channel index arrays'''
+    if np.isscalar(channel_groups):
+        size = int(channel_groups)
+        if size != channel_groups or size < 1:
+            raise ValueError('channel_groups must be a positive integer or '
+                             'a sequence of channel indices, not '
+                             '{!r}'.format(channel_groups))
+
+        return [np.arange(start, min(start + size, channels))
+                for start in range(0, channels, size)]
+
+    groups = [np.atleast_1d(np.asarray(group, dtype=int))
+              for group in channel_groups]
+
+    if not groups or not np.array_equal(np.sort(np.concatenate(groups)),
+                                        np.arange(channels)):
+        raise ValueError('channel_groups must include each of the {} '
+                         'channels exactly once'.format(channels))
+
+    return groups
+
+
+def __link_flag():
+    '''The option that processes a group of channels coherently'''
+    try:
+        flags = get_backend_info().flags
+    except RuntimeError:
+        flags = frozenset()
+
+    # --channels-together (rubberband 3) also covers more than two channels
+    if '--channels-together' in flags:
+        return '--channels-together'
+
+    return '--centre-focus'
+
+
+def __rubberband_channels(y, sr, channel_groups=None, linked=False,
+                          operation=None, out=None, timeout=None, **kwargs):
+    '''Execute rubberband on groups of channels in parallel.
+
+    Each group of channels is processed by its own `rubberband` process,
+    and the results are reassembled in the layout of `y`.  Groups can come
+    out a sample or so apart, so all are trimmed to the shortest.
+
+    Parameters
+    ----------
+    channel_groups : int > 0, sequence of sequences of int, or None
+        Channels to process together: either a group size, or the channel
+        indices of each group.  If `None`, all channels are processed
+        together by a single `rubberband`.
+
+    linked : bool
+        Process the channels within each group coherently
+
+    See `__rubberband` for the other parameters.
+    '''
+    link = __link_flag() if linked else None
+
+    if y.ndim == 1 or channel_groups is None:
+        if link is not None and y.ndim > 1 and y.shape[1] > 1:
+            kwargs.setdefault(link, '')
+        return __rubberband(y, sr, operation=operation, out=out,
+                            timeout=timeout, **kwargs)
+
+    groups = __channel_groups(channel_groups, y.shape[1])
+    __check_out(y, out)
+    y = __as_array(y)
+
+    def __job(group):
+        group_kwargs = dict(kwargs)
+        if link is not None and len(group) > 1:
+            group_kwargs.setdefault(link, '')
+        return __rubberband(np.ascontiguousarray(y[:, group]), sr,
+                            operation=operation, timeout=timeout,
+                            **group_kwargs)
+
+    workers = min(len(groups), __n_jobs(None))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        y_groups = list(pool.map(__job, groups))
+
+    n_out = min(len(y_group) for y_group in y_groups)
+
+    if out is None:
+        out = np.empty((n_out, y.shape[1]), dtype=y_groups[0].dtype)
+    elif len(out) != n_out:
+        raise ValueError('out has shape {}, but the output has shape '
+                         '{}'.format(out.shape, (n_out, y.shape[1])))
+
+    for group, y_group in zip(groups, y_groups):
+        out[:, group] = y_group[:n_out]
+
+    return out
+
+
+def __check_batch(y, channel_groups=None, linked=False):
+    '''Validate a batch of signals'''
+    if (not isinstance(y, np.ndarray) or y.ndim not in (2, 3) or
+            not len(y)):
+        raise ValueError('batch input must be a non-empty np.ndarray of '
+                         'shape (batch, n) or (batch, n, c), not '
+                         '{!r}'.format(getattr(y, 'shape', y)))
+
+    if channel_groups is not None or linked:
+        raise ValueError('channel_groups and linked cannot be used with '
+                         'batch input')
+
+
+def __rubberband_batch(y, sr, operation=None, out=None, timeout=None,
+                       **kwargs):
+    '''Execute rubberband on a batch of signals, packed as channels.
+
+    The signals are interleaved as the channels of as few `rubberband`
+    processes as `__BATCH_CHANNELS` allows.  `rubberband` processes
+    channels independently unless asked otherwise, so this is equivalent
+    to processing each signal separately.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(batch, n) or (batch, n, c)]
+        Signals of equal length
+
+    See `__rubberband` for the other parameters.
+    '''
+    clips, n = y.shape[:2]
+    channels = 1 if y.ndim == 2 else y.shape[2]
+
+    # (batch, n, c) -> (n, batch * c)
+    packed = np.ascontiguousarray(np.moveaxis(y, 0, 1)).reshape(
+        (n, clips * channels))
+
+    # Never split a signal's channels between processes
+    per_run = max(1, __BATCH_CHANNELS // channels)
+    groups = [np.arange(start * channels,
+                        min(start + per_run, clips) * channels)
+              for start in range(0, clips, per_run)]
+
+    y_out = __rubberband_channels(packed, sr, channel_groups=groups,
+                                  operation=operation, timeout=timeout,
+                                  **kwargs)
+
+    # (n_out, batch * c) -> (batch, n_out, c)
+    y_out = np.ascontiguousarray(np.moveaxis(
+        y_out.reshape((len(y_out), clips, channels)), 1, 0))
+    if y.ndim == 2:
+        y_out = y_out.reshape((clips, -1))
+
+    return __copy_out(y_out, out)
+
+
+def __check_time_map(time_map, n):
+    '''Validate a time map for a signal of `n` samples.
+
+    Returns the time map as an array of shape `(k, 2)`.
+    '''
+    time_map = np.asarray(time_map)
+
+    if time_map.ndim != 2 or time_map.shape[1] != 2 or not len(time_map):
+        raise ValueError('time_map should have shape (k, 2), '
+                         'not {}'.format(time_map.shape))
+
+    negative = np.flatnonzero((time_map < 0).any(axis=1))
+    if negative.size:
+        raise ValueError('time_map should be non-negative: time_map[{}] = '
+                         '{}'.format(negative[0], time_map[negative[0]]))
+
+    decreasing = np.flatnonzero((np.diff(time_map, axis=0) < 0).any(axis=1))
+    if decreasing.size:
+        raise ValueError('time_map is not monotonic: time_map[{}] = {} '
+                         'precedes time_map[{}] = {}'.format(
+                             decreasing[0], time_map[decreasing[0]],
+                             decreasing[0] + 1, time_map[decreasing[0] + 1]))
+
+    if time_map[-1, 0] != n:
+        raise ValueError('time_map[-1] should correspond to the last sample')
+
+    return time_map
+
+
+@contextmanager
+def __time_map_file(time_map):
+    '''Write a time map to a scratch file, and yield its path'''
+    time_map = np.asarray(time_map)
+
+    if np.issubdtype(time_map.dtype, np.integer):
+        fmt = '%d %d\n'
+    else:
+        fmt = '%.17g %.17g\n'
+
+    # One formatting pass over the whole map is much faster than
+    # writing it line by line
+    text = (fmt * len(time_map)) % tuple(time_map.ravel().tolist())
+
+    with __scratch('map.txt') as stretch_file:
+        with open(stretch_file, 'w') as fdesc:
+            fdesc.write(text)
+        yield stretch_file
+
+
+def __check_target_length(target_length):
+    '''Validate a requested output length'''
+    if target_length is None:
+        return
+
+    if (not isinstance(target_length, (int, np.integer)) or
+            isinstance(target_length, bool) or target_length < 1):
+        raise ValueError('target_length must be a positive integer, '
+                         'not {!r}'.format(target_length))
+
+
+def __target_time_map(time_map, target_length):
+    '''Rescale the targets of a time map to end at `target_length`.
+
+    `rubberband` reads time maps as whole sample frames, so the targets
+    are rounded, which keeps them monotonic.
+    '''
+    if time_map[-1, 1] <= 0:
+        raise ValueError('time_map[-1] maps to 0 samples, so it cannot be '
+                         'rescaled to target_length={}'.format(target_length))
+
+    scaled = np.empty(time_map.shape, dtype=np.int64)
+    scaled[:, 0] = np.rint(time_map[:, 0])
+    scaled[:, 1] = np.rint(time_map[:, 1] * (target_length /
+                                             float(time_map[-1, 1])))
+    scaled[-1, 1] = target_length
+    return scaled
+
+
+def __fit_length(y, n, axis=0):
+    '''Trim or zero-pad `y` to `n` samples along `axis`'''
+    if y.shape[axis] == n:
+        return y
+
+    if y.shape[axis] > n:
+        index = [slice(None)] * y.ndim
+        index[axis] = slice(0, n)
+        return y[tuple(index)]
+
+    padding = [(0, 0)] * y.ndim
+    padding[axis] = (0, n - y.shape[axis])
+    return np.pad(y, padding, mode='constant')
+
+
+def time_stretch(y, sr, rate=None, rbargs=None, out=None, timeout=None,
+                 channel_groups=None, linked=False, batch=False,
+                 target_length=None):
+    '''Apply a time stretch of `rate` to an audio time series.
+
+    This uses the `tempo` form for rubberband, so the
+    higher the rate, the faster the playback.
+
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)], str, or soundfile.SoundFile
+        Audio time series, either single or multichannel, or the path of
+        an audio file at sampling rate `sr`.  Files, and `np.memmap` arrays
+        over the samples of a WAV file, are read by `rubberband` directly.
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    rate : float > 0 or None
+        Desired playback rate.
+        May only be `None` if `target_length` is given.
+
+    rbargs : {key:value, key:value} or RubberbandOptions
+        Additional keyword parameters for rubberband
+        Accepts a dictionary of key:value pairs supported by `rubberband`.
+        type(key and value) == str()
+        For single valued `rbargs`, pass empty string for `value`.
+        See `rubberband -h` for details.
+        `rbargs` is not modified.
+
+    out : np.ndarray or None
+        If provided, the output is decoded directly into this buffer, which
+        is then returned.  It must be C-contiguous and have exactly the shape
+        of the output.  Its dtype sets the dtype of the result, so a
+        `float64` buffer upcasts `float32` input.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.  If it is exceeded,
+        `rubberband` is killed and `RubberbandTimeout` is raised.
+        If `None`, the limit set by `set_limits` applies.
+
+    channel_groups : int > 0, sequence of sequences of int, or None
+        Process groups of channels as separate `rubberband` jobs, in
+        parallel.  Either the number of channels per group (`1` processes
+        each channel separately), or the channel indices of each group,
+        e.g. `[[0, 1], [2], [3], [4, 5]]`.  The output has the channel
+        layout of `y`, and all channels have the same length.
+        If `None`, all channels are processed by a single `rubberband`.
+
+        Channels in different groups are processed independently, so
+        their phases may drift apart: keep channels that must stay
+        coherent, such as stereo pairs, in the same group.
+
+    linked : bool
+        If `True`, process the channels within each group coherently, with
+        `--channels-together` where `rubberband` supports it, or
+        `--centre-focus` otherwise.
+
+    batch : bool
+        If `True`, `y` holds a batch of signals of equal length, with shape
+        `(batch, n)` or `(batch, n, c)`, which are all processed the same
+        way.  The signals are packed as the channels of one `rubberband`
+        process (or a few, for large batches), rather than processed one
+        by one, and the output has shape `(batch, n_out)` or
+        `(batch, n_out, c)`.  Options that link channels, such as
+        `--channels-together`, would mix the signals.
+
+    target_length : int > 0 or None
+        If provided, stretch `y` to exactly `target_length` samples,
+        instead of by `rate`.  `rubberband` is asked for this duration
+        (`--duration`), and its output is trimmed or zero-padded to the
+        exact length.  See `predict_length` for the length produced by
+        a given `rate`.
+
+    Returns
+    -------
+    y_stretch : np.ndarray
+        Time-stretched audio.
+        If `y` is on disk, this is an `np.memmap` over a temporary WAV
+        file, which is removed once the array is no longer referenced.
+
+    Raises
+    ------
+    ValueError
+        if `rate <= 0`, or `channel_groups` does not cover each channel
+        exactly once
+        if neither or both of `rate` and `target_length` are provided,
+        or `target_length` is not a positive integer
+
+    See Also
+    --------
+    predict_length
+    '''
+
+    if (rate is None) == (target_length is None):
+        raise ValueError('exactly one of rate and target_length '
+                         'must be provided')
+
+    if rate is not None and rate <= 0:
+        raise ValueError('rate must be strictly positive')
+
+    __check_target_length(target_length)
+
+    y = __audio_input(y, sr)
+
+    if batch:
+        __check_batch(y, channel_groups, linked)
+
+    n = y.shape[1] if batch else len(y)
+
+    if rate == 1.0 or target_length == n:
+        return __copy_out(y, out)
+
+    rbargs = __rbargs(rbargs)
+
+    if target_length is None:
+        rbargs.setdefault('--tempo', rate)
+    else:
+        rbargs.setdefault('--duration', target_length / float(sr))
+
+    if batch:
+        y_stretch = __rubberband_batch(
+            y, sr, operation='time_stretch',
+            out=None if target_length else out, timeout=timeout, **rbargs)
+    else:
+        y_stretch = __rubberband_channels(
+            y, sr, channel_groups=channel_groups, linked=linked,
+            operation='time_stretch', out=None if target_length else out,
+            timeout=timeout, **rbargs)
+
+    if target_length is None:
+        return y_stretch
+
+    return __copy_out(__fit_length(y_stretch, target_length,
+                                   axis=1 if batch else 0), out)
+
+
+def timemap_stretch(y, sr, time_map, rbargs=None, out=None,
+                    timeout=None, batch=False, target_length=None):
+    '''Apply a timemap stretch to an audio time series.
+
+    A timemap stretch allows non-linear time-stretching by mapping source to
+    target sample frame numbers for fixed time points within the audio data.
+
+    This uses the `time` and `timemap` form for rubberband.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)], str, or soundfile.SoundFile
+        Audio time series, either single or multichannel, or the path of
+        an audio file at sampling rate `sr`.  Files, and `np.memmap` arrays
+        over the samples of a WAV file, are read by `rubberband` directly.
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    time_map : list or np.ndarray [shape=(k, 2)]
+        Each element is a tuple `t` of length 2 which corresponds to the
+        source sample position and target sample position.
+
+        If `t[1] < t[0]` the track will be sped up in this area.
+
+        `time_map[-1]` must correspond to the lengths of the source audio and
+        target audio.
+
+    rbargs : {key:value, key:value} or RubberbandOptions
+        Additional keyword parameters for rubberband
+        Accepts a dictionary of key:value pairs supported by `rubberband`.
+        type(key and value) == str()
+        For single valued `rbargs`, pass empty string for `value`.
+        See `rubberband -h` for details.
+        `rbargs` is not modified.
+
+    out : np.ndarray or None
+        If provided, the output is decoded directly into this buffer, which
+        is then returned.  It must be C-contiguous and have exactly the shape
+        of the output.  Its dtype sets the dtype of the result, so a
+        `float64` buffer upcasts `float32` input.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.  If it is exceeded,
+        `rubberband` is killed and `RubberbandTimeout` is raised.
+        If `None`, the limit set by `set_limits` applies.
+
+    batch : bool
+        If `True`, `y` holds a batch of signals of equal length, with shape
+        `(batch, n)` or `(batch, n, c)`, which are all processed the same
+        way.  The signals are packed as the channels of one `rubberband`
+        process (or a few, for large batches), rather than processed one
+        by one, and the output has shape `(batch, n_out)` or
+        `(batch, n_out, c)`.  Options that link channels, such as
+        `--channels-together`, would mix the signals.
+
+    target_length : int > 0 or None
+        If provided, the targets of `time_map` are scaled so that the
+        output has exactly `target_length` samples, and the output of
+        `rubberband` is trimmed or zero-padded to that length.
+
+    Returns
+    -------
+    y_stretch : np.ndarray
+        Time-stretched audio.
+        If `y` is on disk, this is an `np.memmap` over a temporary WAV
+        file, which is removed once the array is no longer referenced.
+
+    Raises
+    ------
+    ValueError
+        if `time_map` does not have shape `(k, 2)`
+        if `time_map` is not monotonic
+        if `time_map` is not non-negative
+        if `time_map[-1][0]` is not the input audio length
+        if `target_length` is not a positive integer, or `time_map[-1]`
+        maps to 0 samples
+
+        The error message identifies the first offending entry.
+
+    See Also
+    --------
+    predict_length
+    '''
+
+    __check_target_length(target_length)
+
+    y = __audio_input(y, sr)
+
+    if batch:
+        __check_batch(y)
+
+    rbargs = __rbargs(rbargs)
+
+    time_map = __check_time_map(time_map, y.shape[1] if batch else len(y))
+
+    if target_length is not None:
+        time_map = __target_time_map(time_map, target_length)
+
+    time_stretch = time_map[-1][1] * 1.0 / time_map[-1][0]
+    rbargs.setdefault('--time', time_stretch)
+
+    run = __rubberband_batch if batch else __rubberband
+
+    with __time_map_file(time_map) as stretch_file:
+        rbargs.setdefault('--timemap', stretch_file)
+        y_stretch = run(y, sr, operation='timemap_stretch',
+                        out=None if target_length else out,
+                        timeout=timeout, **rbargs)
+
+    if target_length is None:
+        return y_stretch
+
+    return __copy_out(__fit_length(y_stretch, target_length,
+                                   axis=1 if batch else 0), out)
+
+
+def pitch_shift(y, sr, n_steps, rbargs=None, out=None, timeout=None,
+                channel_groups=None, linked=False, batch=False):
+    '''Apply a pitch shift to an audio time series.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)], str, or soundfile.SoundFile
+        Audio time series, either single or multichannel, or the path of
+        an audio file at sampling rate `sr`.  Files, and `np.memmap` arrays
+        over the samples of a WAV file, are read by `rubberband` directly.
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    n_steps : float
+        Shift by `n_steps` semitones.
+
+    rbargs : {key:value, key:value} or RubberbandOptions
+        Additional keyword parameters for rubberband
+        Accepts a dictionary of key:value pairs supported by `rubberband`.
+        type(key and value) == str()
+        For single valued `rbargs`, pass empty string for `value`.
+        See `rubberband -h` for details.
+        `rbargs` is not modified.
+
+    out : np.ndarray or None
+        If provided, the output is decoded directly into this buffer, which
+        is then returned.  It must be C-contiguous and have exactly the shape
+        of the output.  Its dtype sets the dtype of the result, so a
+        `float64` buffer upcasts `float32` input.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.  If it is exceeded,
+        `rubberband` is killed and `RubberbandTimeout` is raised.
+        If `None`, the limit set by `set_limits` applies.
+
+    channel_groups : int > 0, sequence of sequences of int, or None
+        Process groups of channels as separate `rubberband` jobs, in
+        parallel.  Either the number of channels per group (`1` processes
+        each channel separately), or the channel indices of each group,
+        e.g. `[[0, 1], [2], [3], [4, 5]]`.  The output has the channel
+        layout of `y`, and all channels have the same length.
+        If `None`, all channels are processed by a single `rubberband`.
+
+        Channels in different groups are processed independently, so
+        their phases may drift apart: keep channels that must stay
+        coherent, such as stereo pairs, in the same group.
+
+    linked : bool
+        If `True`, process the channels within each group coherently, with
+        `--channels-together` where `rubberband` supports it, or
+        `--centre-focus` otherwise.
+
+    batch : bool
+        If `True`, `y` holds a batch of signals of equal length, with shape
+        `(batch, n)` or `(batch, n, c)`, which are all processed the same
+        way.  The signals are packed as the channels of one `rubberband`
+        process (or a few, for large batches), rather than processed one
+        by one, and the output has shape `(batch, n_out)` or
+        `(batch, n_out, c)`.  Options that link channels, such as
+        `--channels-together`, would mix the signals.
+
+    Returns
+    -------
+    y_shift : np.ndarray
+        Pitch-shifted audio.
+        If `y` is on disk, this is an `np.memmap` over a temporary WAV
+        file, which is removed once the array is no longer referenced.
+    '''
+
+    y = __audio_input(y, sr)
+
+    if batch:
+        __check_batch(y, channel_groups, linked)
+
+    if n_steps == 0:
+        return __copy_out(y, out)
+
+    rbargs = __rbargs(rbargs)
+
+    rbargs.setdefault('--pitch', n_steps)
+
+    if batch:
+        return __rubberband_batch(y, sr, operation='pitch_shift', out=out,
+                                  timeout=timeout, **rbargs)
+
+    return __rubberband_channels(y, sr, channel_groups=channel_groups,
+                                 linked=linked, operation='pitch_shift',
+                                 out=out, timeout=timeout, **rbargs)
+
+
+def transform(y, sr, rate=None, n_steps=None, time_map=None, rbargs=None,
+              out=None, timeout=None, batch=False, target_length=None):
+    '''Apply a combined time stretch and pitch shift in a single pass.
+
+    This is equivalent to chaining `time_stretch` (or `timemap_stretch`)
+    and `pitch_shift`, but runs `rubberband` only once, so the audio is
+    only resynthesized once.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)], str, or soundfile.SoundFile
+        Audio time series, either single or multichannel, or the path of
+        an audio file at sampling rate `sr`.  Files, and `np.memmap` arrays
+        over the samples of a WAV file, are read by `rubberband` directly.
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    rate : float > 0 or None
+        Desired playback rate.  See `time_stretch`.
+
+    n_steps : float or None
+        Shift by `n_steps` semitones.  See `pitch_shift`.
+
+    time_map : list, np.ndarray [shape=(k, 2)], or None
+        A time map for non-linear stretching.  See `timemap_stretch`.
+        This cannot be combined with `rate`.
+
+    rbargs : {key:value, key:value} or RubberbandOptions
+        Additional keyword parameters for rubberband
+        Accepts a dictionary of key:value pairs supported by `rubberband`.
+        type(key and value) == str()
+        For single valued `rbargs`, pass empty string for `value`.
+        See `rubberband -h` for details.
+        `rbargs` is not modified.
+
+    out : np.ndarray or None
+        If provided, the output is decoded directly into this buffer, which
+        is then returned.  It must be C-contiguous and have exactly the shape
+        of the output.  Its dtype sets the dtype of the result, so a
+        `float64` buffer upcasts `float32` input.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.  If it is exceeded,
+        `rubberband` is killed and `RubberbandTimeout` is raised.
+        If `None`, the limit set by `set_limits` applies.
+
+    batch : bool
+        If `True`, `y` holds a batch of signals of equal length, with shape
+        `(batch, n)` or `(batch, n, c)`, which are all processed the same
+        way.  The signals are packed as the channels of one `rubberband`
+        process (or a few, for large batches), rather than processed one
+        by one, and the output has shape `(batch, n_out)` or
+        `(batch, n_out, c)`.  Options that link channels, such as
+        `--channels-together`, would mix the signals.
+
+    target_length : int > 0 or None
+        If provided, the output has exactly `target_length` samples.
+        With `time_map`, its targets are scaled to end at `target_length`
+        (see `timemap_stretch`); otherwise the stretch is set by
+        `--duration`, and `rate` must be `None`.
+
+    Returns
+    -------
+    y_mod : np.ndarray
+        Transformed audio.
+        If `y` is on disk, this is an `np.memmap` over a temporary WAV
+        file, which is removed once the array is no longer referenced.
+
+    Raises
+    ------
+    ValueError
+        if `rate <= 0`
+        if both `rate` and `time_map` are provided
+        if both `rate` and `target_length` are provided
+        if `time_map` is invalid (see `timemap_stretch`)
+        if `target_length` is not a positive integer
+
+    See Also
+    --------
+    time_stretch
+    timemap_stretch
+    pitch_shift
+    predict_length
+
+    Examples
+    --------
+    >>> # Play back at 1.25x speed, two semitones lower
+    >>> y_mod = pyrb.transform(y, sr, rate=1.25, n_steps=-2)
+    '''
+
+    if rate is not None and rate <= 0:
+        raise ValueError('rate must be strictly positive')
+
+    if rate is not None and time_map is not None:
+        raise ValueError('rate and time_map cannot be used together')
+
+    if rate is not None and target_length is not None:
+        raise ValueError('rate and target_length cannot be used together')
+
+    __check_target_length(target_length)
+
+    y = __audio_input(y, sr)
+
+    if batch:
+        __check_batch(y)
+
+    n = y.shape[1] if batch else len(y)
+
+    if time_map is not None:
+        time_map = __check_time_map(time_map, n)
+        if target_length is not None:
+            time_map = __target_time_map(time_map, target_length)
+
+    rbargs = __rbargs(rbargs)
+
+    if rate is not None and rate != 1.0:
+        rbargs.setdefault('--tempo', rate)
+
+    if time_map is None and target_length not in (None, n):
+        rbargs.setdefault('--duration', target_length / float(sr))
+
+    if n_steps is not None and n_steps != 0:
+        rbargs.setdefault('--pitch', n_steps)
+
+    run = __rubberband_batch if batch else __rubberband
+    run_out = None if target_length else out
+
+    if time_map is None:
+        if not rbargs:
+            return __copy_out(y, out)
+        y_mod = run(y, sr, operation='transform', out=run_out,
+                    timeout=timeout, **rbargs)
+    else:
+        rbargs.setdefault('--time',
+                          time_map[-1][1] * 1.0 / time_map[-1][0])
+
+        with __time_map_file(time_map) as stretch_file:
+            rbargs.setdefault('--timemap', stretch_file)
+            y_mod = run(y, sr, operation='transform', out=run_out,
+                        timeout=timeout, **rbargs)
+
+    if target_length is None:
+        return y_mod
+
+    return __copy_out(__fit_length(y_mod, target_length,
+                                   axis=1 if batch else 0), out)
+
+
+def predict_length(n, sr, rate=None, time_map=None, target_length=None):
+    '''Predict the number of output samples, without running `rubberband`.
+
+    `rubberband` stretches by a ratio of output to input duration, and
+    produces `round(n * ratio)` samples.  This computes the same length
+    for the parameters of `time_stretch`, `timemap_stretch`, and
+    `transform`.  Pitch shifting does not change the length.
+
+    Parameters
+    ----------
+    n : int >= 0
+        Number of input samples
+
+    sr : int > 0
+        Sampling rate
+
+    rate : float > 0 or None
+        Playback rate, as in `time_stretch`
+
+    time_map : list, np.ndarray [shape=(k, 2)], or None
+        A time map, as in `timemap_stretch`.
+        This cannot be combined with `rate`.
+
+    target_length : int > 0 or None
+        A requested output length, as in `time_stretch`.
+        This cannot be combined with `rate`.
+
+    Returns
+    -------
+    n_out : int
+        Number of output samples
+
+    Raises
+    ------
+    ValueError
+        if `rate <= 0`
+        if `rate` is combined with `time_map` or `target_length`
+        if `time_map` is invalid (see `timemap_stretch`)
+        if `target_length` is not a positive integer
+
+    Examples
+    --------
+    >>> pyrb.predict_length(22050, 22050, rate=1.5)
+    14700
+    >>> len(pyrb.time_stretch(y, sr, 1.5)) == pyrb.predict_length(len(y),
+    ...                                                           sr, 1.5)
+    True
+    '''
+    if rate is not None and rate <= 0:
+        raise ValueError('rate must be strictly positive')
+
+    if rate is not None and (time_map is not None or
+                             target_length is not None):
+        raise ValueError('rate cannot be used with time_map '
+                         'or target_length')
+
+    __check_target_length(target_length)
+
+    if target_length is not None:
+        return int(target_length)
+
+    if time_map is not None:
+        time_map = __check_time_map(time_map, n)
+        return int(np.rint(n * (time_map[-1][1] * 1.0 / time_map[-1][0])))
+
+    if rate is None or rate == 1.0:
+        return int(n)
+
+    # The tempo form: the ratio is the reciprocal of the rate
+    return int(np.rint(n * (1.0 / rate)))
+
+
+def __broadcast(values, n, name):
+    '''Expand a scalar parameter to one value per batch item'''
+    if np.isscalar(values):
+        return [values] * n
+
+    values = list(values)
+    if len(values) != n:
+        raise ValueError('{} has {} entries, but there are {} '
+                         'signals'.format(name, len(values), n))
+    return values
+
+
+def __n_jobs(n_jobs):
+    '''Resolve the number of concurrent jobs'''
+    if n_jobs is None or n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be a positive integer or -1')
+
+    return n_jobs
+
+
+def __run_batch(function, ys, sr, params, rbargs, n_jobs, timeout=None):
+    '''Apply `function(y, sr, param, rbargs)` to each signal in a thread pool.
+
+    Results are returned in input order.  If an item fails, its exception
+    is stored in place of its result.
+    '''
+    n_jobs = __n_jobs(n_jobs)
+
+    def __job(y, param):
+        try:
+            return function(y, sr, param, rbargs=rbargs, timeout=timeout)
+        except Exception as exc:
+            return exc
+
+    with ThreadPoolExecutor(max_workers=min(n_jobs, max(len(ys), 1))) as pool:
+        return list(pool.map(__job, ys, params))
+
+
+def batch_time_stretch(ys, sr, rates, rbargs=None, n_jobs=None,
+                       timeout=None):
+    '''Apply `time_stretch` to many signals in parallel.
+
+    Each signal is processed by its own `rubberband` process, and up to
+    `n_jobs` processes run concurrently.
+
+    Parameters
+    ----------
+    ys : iterable of np.ndarray [shape=(n,) or (n, c)]
+        Audio time series.  Signals may differ in length and channels.
+
+    sr : int > 0
+        Sampling rate of all signals in `ys`
+
+    rates : float > 0 or iterable of float > 0
+        Desired playback rate, either shared by all signals or one per signal.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband, shared by all signals.
+        See `time_stretch` for details.
+
+    n_jobs : int > 0, -1, or None
+        Maximum number of concurrent `rubberband` processes.
+        If `None` or `-1`, use the number of available CPUs.
+
+    timeout : float > 0 or None
+        Time limit for each `rubberband` process, in seconds.
+        See `time_stretch`.
+
+    Returns
+    -------
+    y_stretch : list
+        Time-stretched audio, in the same order as `ys`.
+        If a signal could not be processed, the corresponding entry
+        is the exception that was raised.
+
+    Raises
+    ------
+    ValueError
+        if `rates` does not have one entry per signal
+
+    See Also
+    --------
+    time_stretch
+    '''
+    ys = list(ys)
+    rates = __broadcast(rates, len(ys), 'rates')
+    return __run_batch(time_stretch, ys, sr, rates, rbargs, n_jobs, timeout)
+
+
+def batch_pitch_shift(ys, sr, n_steps, rbargs=None, n_jobs=None,
+                      timeout=None):
+    '''Apply `pitch_shift` to many signals in parallel.
+
+    Each signal is processed by its own `rubberband` process, and up to
+    `n_jobs` processes run concurrently.
+
+    Parameters
+    ----------
+    ys : iterable of np.ndarray [shape=(n,) or (n, c)]
+        Audio time series.  Signals may differ in length and channels.
+
+    sr : int > 0
+        Sampling rate of all signals in `ys`
+
+    n_steps : float or iterable of float
+        Shift by `n_steps` semitones, either shared by all signals or
+        one per signal.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband, shared by all signals.
+        See `pitch_shift` for details.
+
+    n_jobs : int > 0, -1, or None
+        Maximum number of concurrent `rubberband` processes.
+        If `None` or `-1`, use the number of available CPUs.
+
+    timeout : float > 0 or None
+        Time limit for each `rubberband` process, in seconds.
+        See `time_stretch`.
+
+    Returns
+    -------
+    y_shift : list
+        Pitch-shifted audio, in the same order as `ys`.
+        If a signal could not be processed, the corresponding entry
+        is the exception that was raised.
+
+    Raises
+    ------
+    ValueError
+        if `n_steps` does not have one entry per signal
+
+    See Also
+    --------
+    pitch_shift
+    '''
+    ys = list(ys)
+    n_steps = __broadcast(n_steps, len(ys), 'n_steps')
+    return __run_batch(pitch_shift, ys, sr, n_steps, rbargs, n_jobs,
+                       timeout)
+
+
+def batch_timemap_stretch(ys, sr, time_maps, rbargs=None, n_jobs=None,
+                          timeout=None):
+    '''Apply `timemap_stretch` to many signals in parallel.
+
+    Each signal is processed by its own `rubberband` process, and up to
+    `n_jobs` processes run concurrently.
+
+    Parameters
+    ----------
+    ys : iterable of np.ndarray [shape=(n,) or (n, c)]
+        Audio time series.  Signals may differ in length and channels.
+
+    sr : int > 0
+        Sampling rate of all signals in `ys`
+
+    time_maps : iterable of list or np.ndarray
+        One time map per signal.  See `timemap_stretch` for details.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband, shared by all signals.
+        See `timemap_stretch` for details.
+
+    n_jobs : int > 0, -1, or None
+        Maximum number of concurrent `rubberband` processes.
+        If `None` or `-1`, use the number of available CPUs.
+
+    timeout : float > 0 or None
+        Time limit for each `rubberband` process, in seconds.
+        See `time_stretch`.
 
-__all__ = ['time_stretch', 'pitch_shift', 'timemap_stretch']
+    Returns
+    -------
+    y_stretch : list
+        Time-stretched audio, in the same order as `ys`.
+        If a signal could not be processed, the corresponding entry
+        is the exception that was raised.
 
-__RUBBERBAND_UTIL = 'rubberband'
-DEVNULL = subprocess.DEVNULL
+    Raises
+    ------
+    ValueError
+        if `time_maps` does not have one entry per signal
+
+    See Also
+    --------
+    timemap_stretch
+    '''
+    ys = list(ys)
+    time_maps = list(time_maps)
+    if len(time_maps) != len(ys):
+        raise ValueError('time_maps has {} entries, but there are {} '
+                         'signals'.format(len(time_maps), len(ys)))
+    return __run_batch(timemap_stretch, ys, sr, time_maps, rbargs, n_jobs,
+                       timeout)
 
 
-def __rubberband(y, sr, **kwargs):
-    '''Execute rubberband
+def __rubberband_many(y, sr, variants, n_jobs, operation, timeout=None):
+    '''Execute rubberband several times on the same input
+
+    The input is encoded once, and shared by concurrent `rubberband`
+    processes, one per entry of `variants`.
 
     Parameters
     ----------
@@ -35,66 +2614,115 @@ def __rubberband(y, sr, **kwargs):
     sr : int > 0
         sampling rate of y
 
-    **kwargs
-        keyword arguments to rubberband
+    variants : list of dict
+        keyword arguments to rubberband for each run
+
+    n_jobs : int > 0, -1, or None
+        Maximum number of concurrent `rubberband` processes
+
+    operation : str
+        Name of the calling function, for instrumentation events
+
+    timeout : float > 0 or None
+        Time limit for each `rubberband` process
 
     Returns
     -------
-    y_mod : np.ndarray [shape=(n,) or (n, c)]
-        `y` after rubberband transformation
-
+    y_mods : list of np.ndarray
+        `y` after each rubberband transformation
     '''
-
     assert sr > 0
 
-    # Get the input and output tempfile
-    fd, infile = tempfile.mkstemp(suffix='.wav')
-    os.close(fd)
-    fd, outfile = tempfile.mkstemp(suffix='.wav')
-    os.close(fd)
-
-    # dump the audio
-    sf.write(infile, y, sr)
+    n_jobs = __n_jobs(n_jobs)
+    workers = min(n_jobs, max(len(variants), 1))
+
+    if __BACKEND in ('library', 'fast'):
+        # Nothing to share: each variant is processed in memory
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(
+                lambda kwargs: __rubberband(y, sr, operation=operation,
+                                            timeout=timeout, **kwargs),
+                variants))
+
+    cache = __CACHE
+    results = [None] * len(variants)
+    keys = [None] * len(variants)
+    if cache is not None:
+        for i, kwargs in enumerate(variants):
+            keys[i] = __cache_key(cache, y, sr, kwargs)
+            results[i] = cache.get(keys[i])
+
+    pending = [i for i, y_out in enumerate(results) if y_out is None]
+    if not pending:
+        return results
+
+    # Room for the input, and the outputs of the running jobs.  If they
+    # fill up the in-memory scratch directory, the rest run on disk.
+    sizes = sorted(__scratch_bytes(y, sr, variants[i]) for i in pending)
+    tempdir = __tempdir(sum(sizes[-workers:]))
+    disk = __tempdir(None)
+
+    def __job(i, tempdir, infile):
+        with __scratch('out.wav', tempdir) as outfile:
+            arguments = ([__executable(), '-q'] +
+                         __rubberband_args(variants[i]))
+
+            with instrument.timed(operation, 'total'):
+                __exec(arguments + [infile, outfile], operation,
+                       timeout=timeout)
+
+                # rubberband may not notice a truncated output
+                if tempdir != disk and __full(tempdir):
+                    raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC),
+                                  outfile)
+
+                with instrument.timed(operation, 'read',
+                                      tempdir=tempdir) as event:
+                    y_out = __read_audio(outfile, y.dtype)
+                    event['nbytes'] = os.path.getsize(outfile)
 
-    try:
-        # Execute rubberband
-        arguments = [__RUBBERBAND_UTIL, '-q']
+        # make sure that output dimensions matches input
+        if y.ndim == 1:
+            y_out = np.squeeze(y_out, axis=1)
 
-        for key, value in kwargs.items():
-            arguments.append(str(key))
-            if len(str(value).strip()):
-                arguments.append(str(value))
+        if cache is not None:
+            cache.put(keys[i], y_out)
 
-        arguments.extend([infile, outfile])
+        results[i] = y_out
 
-        subprocess.check_call(arguments, stdout=DEVNULL, stderr=DEVNULL)
+    def __fan_out(tempdir):
+        with __scratch('in.wav', tempdir) as infile:
+            with instrument.timed(operation, 'write',
+                                  tempdir=tempdir) as event:
+                __write_audio(infile, y, sr)
+                event['nbytes'] = os.path.getsize(infile)
 
-        # Load the processed audio.
-        y_out, _ = sf.read(outfile, always_2d=True, dtype=y.dtype)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(functools.partial(__job, tempdir=tempdir,
+                                                infile=infile),
+                              [i for i in pending if results[i] is None]))
 
-        # make sure that output dimensions matches input
-        if y.ndim == 1:
-            y_out = np.squeeze(y_out)
+    try:
+        try:
+            __fan_out(tempdir)
+        except (OSError, RubberbandError) as exc:
+            if tempdir == disk or not __full(tempdir, exc):
+                raise
+            __fan_out(disk)
 
     except OSError as exc:
         raise RuntimeError('Failed to execute rubberband. '
                            'Please verify that rubberband-cli '
                            'is installed.') from exc
 
-    finally:
-        # Remove temp files
-        os.unlink(infile)
-        os.unlink(outfile)
-
-    return y_out
-
+    return results
 
-def time_stretch(y, sr, rate, rbargs=None):
-    '''Apply a time stretch of `rate` to an audio time series.
 
-    This uses the `tempo` form for rubberband, so the
-    higher the rate, the faster the playback.
+def time_stretch_many(y, sr, rates, rbargs=None, n_jobs=None, timeout=None):
+    '''Apply several time stretches to the same audio.
 
+    This is equivalent to calling `time_stretch` once for each rate, but
+    the input is only encoded once, and the stretches run concurrently.
 
     Parameters
     ----------
@@ -104,48 +2732,65 @@ def time_stretch(y, sr, rate, rbargs=None):
     sr : int > 0
         Sampling rate of `y`
 
-    rate : float > 0
-        Desired playback rate.
+    rates : iterable of float > 0
+        Desired playback rates
 
     rbargs : {key:value, key:value}
-        Additional keyword parameters for rubberband
-        Accepts a dictionary of key:value pairs supported by `rubberband`.
-        type(key and value) == str()
-        For single valued `rbargs`, pass empty string for `value`.
-        See `rubberband -h` for details.
+        Additional keyword parameters for rubberband, shared by all rates.
+        See `time_stretch` for details.
+
+    n_jobs : int > 0, -1, or None
+        Maximum number of concurrent `rubberband` processes.
+        If `None` or `-1`, use the number of available CPUs.
+
+    timeout : float > 0 or None
+        Time limit for each `rubberband` process, in seconds.
+        See `time_stretch`.
 
     Returns
     -------
-    y_stretch : np.ndarray
-        Time-stretched audio
+    y_stretch : list of np.ndarray
+        Time-stretched audio, one for each entry of `rates`
 
     Raises
     ------
     ValueError
-        if `rate <= 0`
-    '''
+        if `rates` is empty, or any `rate <= 0`
 
-    if rate <= 0:
-        raise ValueError('rate must be strictly positive')
+    See Also
+    --------
+    time_stretch
+    batch_time_stretch
 
-    if rate == 1.0:
-        return y
+    Examples
+    --------
+    >>> y_slow, y_fast = pyrb.time_stretch_many(y, sr, [0.8, 1.25])
+    '''
+    rates = list(rates)
+    if not rates:
+        raise ValueError('rates must contain at least one rate')
 
-    if rbargs is None:
-        rbargs = dict()
+    if any(rate <= 0 for rate in rates):
+        raise ValueError('rate must be strictly positive')
 
-    rbargs.setdefault('--tempo', rate)
+    variants = []
+    for rate in rates:
+        if rate != 1.0:
+            variants.append(__rbargs(rbargs))
+            variants[-1].setdefault('--tempo', rate)
 
-    return __rubberband(y, sr, **rbargs)
+    y_mods = iter(__rubberband_many(y, sr, variants, n_jobs,
+                                    'time_stretch_many', timeout))
 
+    return [y if rate == 1.0 else next(y_mods) for rate in rates]
 
-def timemap_stretch(y, sr, time_map, rbargs=None):
-    '''Apply a timemap stretch to an audio time series.
 
-    A timemap stretch allows non-linear time-stretching by mapping source to
-    target sample frame numbers for fixed time points within the audio data.
+def pitch_shift_many(y, sr, n_steps, rbargs=None, n_jobs=None, timeout=None):
+    '''Apply several pitch shifts to the same audio.
 
-    This uses the `time` and `timemap` form for rubberband.
+    This is equivalent to calling `pitch_shift` once for each entry of
+    `n_steps`, but the input is only encoded once, and the shifts run
+    concurrently.
 
     Parameters
     ----------
@@ -155,104 +2800,596 @@ def timemap_stretch(y, sr, time_map, rbargs=None):
     sr : int > 0
         Sampling rate of `y`
 
-    time_map : list
-        Each element is a tuple `t` of length 2 which corresponds to the
-        source sample position and target sample position.
+    n_steps : iterable of float
+        Shifts, in semitones
 
-        If `t[1] < t[0]` the track will be sped up in this area.
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband, shared by all shifts.
+        See `pitch_shift` for details.
 
-        `time_map[-1]` must correspond to the lengths of the source audio and
-        target audio.
+    n_jobs : int > 0, -1, or None
+        Maximum number of concurrent `rubberband` processes.
+        If `None` or `-1`, use the number of available CPUs.
 
-    rbargs : {key:value, key:value}
-        Additional keyword parameters for rubberband
-        Accepts a dictionary of key:value pairs supported by `rubberband`.
-        type(key and value) == str()
-        For single valued `rbargs`, pass empty string for `value`.
-        See `rubberband -h` for details.
+    timeout : float > 0 or None
+        Time limit for each `rubberband` process, in seconds.
+        See `time_stretch`.
 
     Returns
     -------
-    y_stretch : np.ndarray
+    y_shift : np.ndarray [shape=(k, n) or (k, n, c)]
+        Pitch-shifted audio, stacked along the first axis in the order
+        of `n_steps`
+
+    Raises
+    ------
+    ValueError
+        if `n_steps` is empty
+
+    See Also
+    --------
+    pitch_shift
+    batch_pitch_shift
+
+    Examples
+    --------
+    >>> y_shift = pyrb.pitch_shift_many(y, sr, [-2, -1, 1, 2])
+    >>> y_shift.shape
+    (4, 22050)
+    '''
+    n_steps = list(n_steps)
+    if not n_steps:
+        raise ValueError('n_steps must contain at least one shift')
+
+    variants = []
+    for step in n_steps:
+        if step != 0:
+            variants.append(__rbargs(rbargs))
+            variants[-1].setdefault('--pitch', step)
+
+    y_mods = iter(__rubberband_many(y, sr, variants, n_jobs,
+                                    'pitch_shift_many', timeout))
+
+    return np.stack([y if step == 0 else next(y_mods) for step in n_steps])
+
+
+def __segment_bounds(segments, n, sr):
+    '''Resolve `segments` to the boundaries of each segment, in samples'''
+    if np.isscalar(segments):
+        if segments <= 0:
+            raise ValueError('segments must be positive, not '
+                             '{!r}'.format(segments))
+        step = max(1, int(round(segments * sr)))
+        bounds = np.arange(0, n, step)
+        # Fold a short remainder into the last segment
+        if len(bounds) > 1 and n - bounds[-1] < step // 2:
+            bounds = bounds[:-1]
+    else:
+        bounds = np.asarray(segments, dtype=int).reshape(-1)
+        if (np.any(bounds <= 0) or np.any(bounds >= n) or
+                np.any(np.diff(bounds) <= 0)):
+            raise ValueError('segments must be increasing sample indices '
+                             'within the signal')
+        bounds = np.concatenate([[0], bounds])
+
+    return np.append(bounds, max(n, 1))
+
+
+def __align(y_prev, y_next, max_lag):
+    '''Find the shift of `y_next` that best matches `y_prev`.
+
+    Both are views of the same output span, extended by `max_lag` samples
+    on either side in `y_next`.
+    '''
+    if max_lag < 1 or not len(y_prev):
+        return 0
+
+    # Align on the sum of the channels
+    y_prev = y_prev.reshape((len(y_prev), -1)).sum(axis=1)
+    y_next = y_next.reshape((len(y_next), -1)).sum(axis=1)
+
+    scores = np.correlate(y_next, y_prev, mode='valid')
+    best = scores.max()
+    if best <= 0:
+        return 0
+
+    # Periodic signals match almost as well a few periods away:
+    # take the smallest shift among the near-best
+    lags = np.arange(-max_lag, max_lag + 1)
+    near = lags[scores >= best * (1 - 1e-3)]
+    return int(near[np.argmin(np.abs(near))])
+
+
+def time_stretch_parallel(y, sr, rate, segments=30.0, overlap=0.5,
+                          rbargs=None, n_jobs=None, timeout=None):
+    '''Apply a time stretch to a long signal, in parallel segments.
+
+    The signal is split into segments which overlap their neighbours, and
+    each segment is stretched by its own `rubberband` process, to exactly
+    the span a single stretch would give it.  Neighbouring segments are
+    aligned on their overlap, to avoid cancellation between them, and
+    crossfaded together.
+
+    This trades some quality for speed: `rubberband` sees less context at
+    each boundary, and the crossfades can soften transients or blur pitch
+    slightly.  Longer overlaps give smoother boundaries, at the cost of
+    stretching more audio twice.
+
+    Parameters
+    ----------
+    y : np.ndarray [shape=(n,) or (n, c)], str, or soundfile.SoundFile
+        Audio time series, either single or multichannel, or the path of
+        an audio file at sampling rate `sr`, which is mapped into memory
+        rather than loaded.
+
+    sr : int > 0
+        Sampling rate of `y`
+
+    rate : float > 0
+        Desired playback rate.  See `time_stretch`.
+
+    segments : float > 0 or sequence of int
+        Either the length of each segment, in seconds, or the sample
+        indices at which to split `y`, e.g. at silences or onsets.
+
+    overlap : float >= 0
+        Audio shared by neighbouring segments on either side of each
+        boundary, in seconds, up to half the shortest segment.
+        The crossfade between two segments lasts as long as the stretched
+        overlap.
+
+    rbargs : {key:value, key:value} or RubberbandOptions
+        Additional keyword parameters for rubberband, shared by all
+        segments.  See `time_stretch` for details.
+
+    n_jobs : int > 0, -1, or None
+        Maximum number of concurrent `rubberband` processes.
+        If `None` or `-1`, use the number of available CPUs.
+
+    timeout : float > 0 or None
+        Time limit for each `rubberband` process, in seconds.
+        See `time_stretch`.
+
+    Returns
+    -------
+    y_stretch : np.ndarray [shape=(round(n / rate),) or (round(n / rate), c)]
         Time-stretched audio
 
     Raises
     ------
     ValueError
-        if `time_map` is not monotonic
-        if `time_map` is not non-negative
-        if `time_map[-1][0]` is not the input audio length
+        if `rate <= 0`, `overlap < 0`, or `segments` is invalid
+
+    See Also
+    --------
+    time_stretch
+
+    Examples
+    --------
+    Stretch an hour of audio in one-minute segments
+
+    >>> y_slow = pyrb.time_stretch_parallel(y, sr, 0.8, segments=60)
     '''
+    if rate <= 0:
+        raise ValueError('rate must be strictly positive')
 
-    if rbargs is None:
-        rbargs = dict()
+    if overlap < 0:
+        raise ValueError('overlap must be non-negative')
 
-    is_positive = all(time_map[i][0] >= 0 and time_map[i][1] >= 0
-                      for i in range(len(time_map)))
-    is_monotonic = all(time_map[i][0] <= time_map[i+1][0] and
-                       time_map[i][1] <= time_map[i+1][1]
-                       for i in range(len(time_map)-1))
-    if not is_positive:
-        raise ValueError('time_map should be non-negative')
+    y = __as_array(__audio_input(y, sr))
 
-    if not is_monotonic:
-        raise ValueError('time_map is not monotonic')
+    n = len(y)
+    bounds = __segment_bounds(segments, n, sr)
 
-    if time_map[-1][0] != len(y):
-        raise ValueError('time_map[-1] should correspond to the last sample')
+    if rate == 1.0:
+        return y
 
-    time_stretch = time_map[-1][1] * 1.0 / time_map[-1][0]
-    rbargs.setdefault('--time', time_stretch)
+    kwargs = __rbargs(rbargs)
+
+    if len(bounds) <= 2:
+        kwargs.setdefault('--tempo', rate)
+        return __rubberband(y, sr, operation='time_stretch_parallel',
+                            timeout=timeout, **kwargs)
+
+    # Crossfades may not overlap each other
+    pad = min(int(round(overlap * sr)), np.diff(bounds).min() // 2)
+    starts = np.maximum(bounds[:-1] - pad, 0)
+    ends = np.minimum(bounds[1:] + pad, n)
+
+    # Segments are placed where a single stretch would put them, and each
+    # is stretched to exactly that span, so that rounding in the stretch
+    # cannot drift the segments apart at the seams
+    n_out = int(round(n / rate))
+    offsets = np.round(starts / rate).astype(int)
+    lengths = np.round(ends / rate).astype(int) - offsets
+
+    def __job(start, end, length):
+        segment_kwargs = dict(kwargs)
+        segment_kwargs.setdefault('--duration', length / float(sr))
+        y_seg = __rubberband(y[start:end], sr,
+                             operation='time_stretch_parallel',
+                             timeout=timeout, **segment_kwargs)
+        return __fit_length(y_seg, length)
+
+    n_jobs = __n_jobs(n_jobs)
+    with ThreadPoolExecutor(max_workers=min(n_jobs, len(starts))) as pool:
+        y_segments = list(pool.map(__job, starts, ends, lengths))
+
+    # Each boundary is crossfaded over the stretched overlap, centred on
+    # the boundary, which leaves a margin of half the overlap on either
+    # side for rubberband's edge effects and for alignment.
+    fade = int(round(pad / rate))
+    margin = fade // 2
+    max_lag = min(margin // 2, int(round(0.02 * sr)))
+
+    cuts = np.round(bounds / rate).astype(int)
+    cuts[-1] = n_out
+
+    shape = (n_out,) + y.shape[1:]
+    y_out = np.zeros(shape, dtype=y_segments[0].dtype)
+    weights = np.zeros(n_out)
+
+    ramp = (np.arange(fade) + 0.5) / max(fade, 1)
+    previous = None
+
+    for i, y_seg in enumerate(y_segments):
+        offset = offsets[i]
+        lo = 0 if i == 0 else cuts[i] - margin
+        hi = n_out if i == len(y_segments) - 1 else cuts[i + 1] - margin
+
+        if previous is not None:
+            # Match this segment to the previous one on the crossfade
+            y_prev, prev_offset = previous
+            span = slice(lo - prev_offset, lo - prev_offset + fade)
+            start = lo - offset - max_lag
+            if (span.start >= 0 and span.stop <= len(y_prev) and
+                    start >= 0 and start + fade + 2 * max_lag <= len(y_seg)):
+                offset -= __align(y_prev[span],
+                                  y_seg[start:start + fade + 2 * max_lag],
+                                  max_lag)
+
+        # Weights: ramp up at the start, down at the end
+        weight = np.ones(hi - lo + (fade if hi < n_out else 0))
+        if i > 0:
+            weight[:fade] = ramp
+        if hi < n_out:
+            weight[len(weight) - fade:] = ramp[::-1]
+
+        # Clip to the samples this segment actually has
+        first = max(lo, offset)
+        last = min(lo + len(weight), offset + len(y_seg), n_out)
+        if last > first:
+            w = weight[first - lo:last - lo]
+            y_out[first:last] += (w.reshape((-1,) + (1,) * (y.ndim - 1)) *
+                                  y_seg[first - offset:last - offset])
+            weights[first:last] += w
+
+        previous = (y_seg, offset)
+
+    covered = weights > 0
+    y_out[covered] /= weights[covered].reshape((-1,) + (1,) * (y.ndim - 1))
+
+    return y_out
+
+
+def __rubberband_file(infile, outfile, operation=None, timeout=None,
+                      **kwargs):
+    '''Execute rubberband directly on files
+
+    Parameters
+    ----------
+    infile : str
+        Path to the input audio, in any format readable by `rubberband`
+
+    outfile : str
+        Path to the output audio.  The format is inferred by `rubberband`
+        from the extension.
+
+    operation : str or None
+        Name of the calling function, for instrumentation events
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds
+
+    **kwargs
+        keyword arguments to rubberband
+    '''
+    arguments = [__executable(), '-q'] + __rubberband_args(kwargs)
+
+    try:
+        with instrument.timed(operation, 'total'):
+            __exec(arguments + [infile, outfile], operation, timeout=timeout)
+    except OSError as exc:
+        raise RuntimeError('Failed to execute rubberband. '
+                           'Please verify that rubberband-cli '
+                           'is installed.') from exc
+
+
+def __write_blocks(path, blocks, sr):
+    '''Write an iterable of audio blocks to a WAV file.
+
+    Returns the number of dimensions and dtype of the blocks.
+    '''
+    sfo = None
+    try:
+        for block in blocks:
+            block = np.asarray(block)
+            if sfo is None:
+                ndim, dtype = block.ndim, block.dtype
+                channels = 1 if ndim == 1 else block.shape[1]
+                sfo = sf.SoundFile(path, mode='w', samplerate=sr,
+                                   channels=channels, format='WAV',
+                                   subtype=__WIRE_FORMAT)
+            sfo.write(block)
+    finally:
+        if sfo is not None:
+            sfo.close()
+
+    if sfo is None:
+        raise ValueError('No audio blocks were provided')
+
+    return ndim, dtype
+
+
+def __rubberband_stream(source, sr, block_size, operation=None, timeout=None,
+                        **kwargs):
+    '''Execute rubberband on a file or an iterable of blocks,
+    and generate the output in blocks.
+
+    Only one block of audio is held in memory at a time: the input
+    and output are staged through temporary files.
+    '''
+    outfile = __scratch_file('.wav')
+    infile = None
 
-    stretch_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt',
-                                               delete=False)
     try:
-        for t in time_map:
-            stretch_file.write('{:0} {:1}\n'.format(t[0], t[1]))
-        stretch_file.close()
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+            ndim, dtype = 2, np.float64
+        else:
+            infile = __scratch_file('.wav')
+            ndim, dtype = __write_blocks(infile, source, sr)
+            path = infile
+
+        __rubberband_file(path, outfile, operation=operation, timeout=timeout,
+                          **kwargs)
+
+        for block in sf.blocks(outfile, blocksize=block_size, dtype=dtype,
+                               always_2d=True):
+            if ndim == 1:
+                block = block[:, 0]
+            yield block
 
-        rbargs.setdefault('--timemap', stretch_file.name)
-        y_stretch = __rubberband(y, sr, **rbargs)
     finally:
-        # Remove temp file
-        os.unlink(stretch_file.name)
+        os.unlink(outfile)
+        if infile is not None:
+            os.unlink(infile)
 
-    return y_stretch
 
+def __check_source(source, sr):
+    '''Validate the sampling rate of a streaming source'''
+    if isinstance(source, (str, os.PathLike)):
+        file_sr = sf.info(os.fspath(source)).samplerate
+        if sr is not None and sr != file_sr:
+            raise ValueError('sr={} does not match the sampling rate {} '
+                             'of {}'.format(sr, file_sr, source))
+        return file_sr
 
-def pitch_shift(y, sr, n_steps, rbargs=None):
-    '''Apply a pitch shift to an audio time series.
+    if sr is None or sr <= 0:
+        raise ValueError('sr must be provided when streaming from blocks')
+
+    return sr
+
+
+def time_stretch_stream(source, sr, rate, rbargs=None, block_size=BLOCK_SIZE,
+                        timeout=None):
+    '''Apply a time stretch of `rate` to a stream of audio.
+
+    The input and output are staged through temporary files, so that at
+    most `block_size` frames of audio are held in memory at once, no matter
+    how long the signal is.  The whole signal is processed by a single
+    `rubberband` process, so there are no discontinuities at block
+    boundaries.
 
     Parameters
     ----------
-    y : np.ndarray [shape=(n,) or (n, c)]
-        Audio time series, either single or multichannel
+    source : str, os.PathLike, or iterable of np.ndarray
+        Either the path to an audio file, or an iterable of blocks of audio
+        of shape `(n,)` or `(n, c)`.  Blocks may have different lengths,
+        but must all have the same number of channels.
 
-    sr : int > 0
-        Sampling rate of `y`
+    sr : int > 0 or None
+        Sampling rate of `source`.
+        If `source` is a file, this may be `None`.
+
+    rate : float > 0
+        Desired playback rate.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband.
+        See `time_stretch` for details.
+
+    block_size : int > 0
+        Number of frames in each output block (the last may be shorter)
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.
+        See `time_stretch`.
+
+    Yields
+    ------
+    y_stretch : np.ndarray [shape=(block_size,) or (block_size, c)]
+        Consecutive blocks of time-stretched audio.
+        Blocks match the dimensions and dtype of the input blocks.
+        When reading from a file, blocks are 2-dimensional and `float64`.
+
+    Raises
+    ------
+    ValueError
+        if `rate <= 0`
+        if `sr` does not match the sampling rate of the file `source`
+
+    See Also
+    --------
+    time_stretch
+    time_stretch_file
+    '''
+    if rate <= 0:
+        raise ValueError('rate must be strictly positive')
+
+    sr = __check_source(source, sr)
+
+    rbargs = __rbargs(rbargs)
+    rbargs.setdefault('--tempo', rate)
+
+    return __rubberband_stream(source, sr, block_size,
+                               operation='time_stretch_stream',
+                               timeout=timeout, **rbargs)
+
+
+def pitch_shift_stream(source, sr, n_steps, rbargs=None,
+                       block_size=BLOCK_SIZE, timeout=None):
+    '''Apply a pitch shift to a stream of audio.
+
+    The input and output are staged through temporary files, so that at
+    most `block_size` frames of audio are held in memory at once, no matter
+    how long the signal is.  The whole signal is processed by a single
+    `rubberband` process, so there are no discontinuities at block
+    boundaries.
+
+    Parameters
+    ----------
+    source : str, os.PathLike, or iterable of np.ndarray
+        Either the path to an audio file, or an iterable of blocks of audio
+        of shape `(n,)` or `(n, c)`.  Blocks may have different lengths,
+        but must all have the same number of channels.
+
+    sr : int > 0 or None
+        Sampling rate of `source`.
+        If `source` is a file, this may be `None`.
 
     n_steps : float
         Shift by `n_steps` semitones.
 
     rbargs : {key:value, key:value}
-        Additional keyword parameters for rubberband
-        Accepts a dictionary of key:value pairs supported by `rubberband`.
-        type(key and value) == str()
-        For single valued `rbargs`, pass empty string for `value`.
-        See `rubberband -h` for details.
+        Additional keyword parameters for rubberband.
+        See `pitch_shift` for details.
 
-    Returns
-    -------
-    y_shift : np.ndarray
-        Pitch-shifted audio
+    block_size : int > 0
+        Number of frames in each output block (the last may be shorter)
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.
+        See `time_stretch`.
+
+    Yields
+    ------
+    y_shift : np.ndarray [shape=(block_size,) or (block_size, c)]
+        Consecutive blocks of pitch-shifted audio.
+        Blocks match the dimensions and dtype of the input blocks.
+        When reading from a file, blocks are 2-dimensional and `float64`.
+
+    Raises
+    ------
+    ValueError
+        if `sr` does not match the sampling rate of the file `source`
+
+    See Also
+    --------
+    pitch_shift
+    pitch_shift_file
     '''
+    sr = __check_source(source, sr)
 
-    if n_steps == 0:
-        return y
+    rbargs = __rbargs(rbargs)
+    rbargs.setdefault('--pitch', n_steps)
 
-    if rbargs is None:
-        rbargs = dict()
+    return __rubberband_stream(source, sr, block_size,
+                               operation='pitch_shift_stream',
+                               timeout=timeout, **rbargs)
+
+
+def time_stretch_file(in_path, out_path, rate, rbargs=None, timeout=None):
+    '''Apply a time stretch of `rate` to an audio file.
+
+    The audio is never loaded into Python: `rubberband` reads `in_path`
+    and writes `out_path` directly.
+
+    Parameters
+    ----------
+    in_path : str or os.PathLike
+        Path to the input audio, in any format readable by `rubberband`
+
+    out_path : str or os.PathLike
+        Path to the output audio.
+        The output format is determined by the extension.
+
+    rate : float > 0
+        Desired playback rate.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband.
+        See `time_stretch` for details.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.
+        See `time_stretch`.
+
+    Raises
+    ------
+    ValueError
+        if `rate <= 0`
+
+    See Also
+    --------
+    time_stretch
+    time_stretch_stream
+    '''
+    if rate <= 0:
+        raise ValueError('rate must be strictly positive')
+
+    rbargs = __rbargs(rbargs)
+    rbargs.setdefault('--tempo', rate)
 
+    __rubberband_file(os.fspath(in_path), os.fspath(out_path),
+                      operation='time_stretch_file', timeout=timeout,
+                      **rbargs)
+
+
+def pitch_shift_file(in_path, out_path, n_steps, rbargs=None, timeout=None):
+    '''Apply a pitch shift to an audio file.
+
+    The audio is never loaded into Python: `rubberband` reads `in_path`
+    and writes `out_path` directly.
+
+    Parameters
+    ----------
+    in_path : str or os.PathLike
+        Path to the input audio, in any format readable by `rubberband`
+
+    out_path : str or os.PathLike
+        Path to the output audio.
+        The output format is determined by the extension.
+
+    n_steps : float
+        Shift by `n_steps` semitones.
+
+    rbargs : {key:value, key:value}
+        Additional keyword parameters for rubberband.
+        See `pitch_shift` for details.
+
+    timeout : float > 0 or None
+        Time limit for `rubberband`, in seconds.
+        See `time_stretch`.
+
+    See Also
+    --------
+    pitch_shift
+    pitch_shift_stream
+    '''
+    rbargs = __rbargs(rbargs)
     rbargs.setdefault('--pitch', n_steps)
 
-    return __rubberband(y, sr, **rbargs)
+    __rubberband_file(os.fspath(in_path), os.fspath(out_path),
+                      operation='pitch_shift_file', timeout=timeout,
+                      **rbargs)
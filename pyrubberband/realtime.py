@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+'''Real-time processing
+
+The functions of `pyrubberband` process whole signals: each call runs
+`rubberband` once, from the first sample to the last.  A live pipeline
+instead receives audio a few milliseconds at a time, and needs each block
+back as soon as possible.
+
+A `RubberbandStream` keeps one Rubber Band stretcher alive, in real-time
+mode, and feeds it block by block.  The playback rate and pitch can be
+changed between blocks.  It requires the Rubber Band library
+(`librubberband`), located as for `pyrubberband.set_backend('library')`.
+
+.. autosummary::
+    :toctree: generated/
+
+    RubberbandStream
+'''
+
+import threading
+import weakref
+
+import numpy as np
+
+from . import _librubberband
+
+
+__all__ = ['RubberbandStream']
+
+
+class RubberbandStream(object):
+    '''A long-running stretcher for real-time block processing.
+
+    Parameters
+    ----------
+    sr : int > 0
+        Sampling rate of the input
+
+    channels : int > 0
+        Number of channels.  Blocks have shape `(n,)` if `channels` is 1,
+        or `(n, channels)`.
+
+    rate : float > 0
+        Initial playback rate.  See `pyrubberband.time_stretch`.
+
+    n_steps : float
+        Initial pitch shift, in semitones.
+        See `pyrubberband.pitch_shift`.
+
+    block_size : int > 0
+        Largest number of frames passed to the stretcher at once.
+        Longer blocks are split.  For 10-20ms blocks, this is the
+        number of frames in a block.
+
+    rbargs : {key:value, key:value}, RubberbandOptions, or None
+        Processing options, as for `pyrubberband.time_stretch`.
+        Options that set the length or time map of the output
+        (`--duration`, `--timemap`) are not supported, and the stretch
+        and shift are set by `rate` and `n_steps`.
+
+    Attributes
+    ----------
+    latency : int
+        Delay of the output relative to the input, in output frames.
+        This does not include the time taken to fill a block.
+
+    Raises
+    ------
+    RuntimeError
+        if the Rubber Band library is not available
+
+    ValueError
+        if a parameter is invalid, or `rbargs` contains an option that
+        cannot be used in real time
+
+    Examples
+    --------
+    >>> stream = pyrb.RubberbandStream(sr, channels=2, block_size=512)
+    >>> for block in blocks:
+    ...     play(stream.process(block))
+    ...     stream.rate = speed_slider.value
+    >>> play(stream.flush())
+    >>> stream.close()
+    '''
+
+    def __init__(self, sr, channels=1, rate=1.0, n_steps=0, block_size=512,
+                 rbargs=None):
+        if sr <= 0:
+            raise ValueError('sr must be strictly positive')
+
+        if channels < 1:
+            raise ValueError('channels must be a positive integer')
+
+        if block_size < 1:
+            raise ValueError('block_size must be a positive integer')
+
+        if rate <= 0:
+            raise ValueError('rate must be strictly positive')
+
+        kwargs = dict(rbargs.items()) if rbargs is not None else {}
+        for key in kwargs:
+            if key in ('-D', '--duration', '-M', '--timemap'):
+                raise ValueError('{} cannot be used in real time'.format(key))
+            if key in ('-t', '--time', '-T', '--tempo', '-p', '--pitch',
+                       '-f', '--frequency'):
+                raise ValueError('{} cannot be used with RubberbandStream: '
+                                 'set rate or n_steps instead'.format(key))
+
+        try:
+            options, _, _, _ = _librubberband.parse_args(kwargs, sr, 1)
+        except NotImplementedError as exc:
+            raise ValueError(str(exc))
+
+        if not _librubberband.available():
+            raise RuntimeError('RubberbandStream requires the Rubber Band '
+                               'library, which is not available.')
+
+        options &= ~_librubberband.OPTION_STRETCH_PRECISE
+        options |= _librubberband.OPTION_PROCESS_REALTIME
+
+        # Keep pitch changes smooth, unless asked for the best quality
+        if not options & _librubberband.OPTION_PITCH_HIGH_QUALITY:
+            options |= _librubberband.OPTION_PITCH_HIGH_CONSISTENCY
+
+        self.sr = sr
+        self.channels = channels
+        self.block_size = block_size
+        self.finished = False
+
+        # The layout of the input, for the output of `flush`
+        self._ndim = 1 if channels == 1 else 2
+        self._dtype = np.dtype(np.float32)
+
+        self._rate = float(rate)
+        self._n_steps = float(n_steps)
+        self._lock = threading.Lock()
+        self._state = _librubberband.new_stretcher(
+            sr, channels, options, 1.0 / self._rate,
+            2.0 ** (self._n_steps / 12.0), block_size)
+        self._release = weakref.finalize(
+            self, _librubberband.delete_stretcher, self._state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _check_open(self):
+        if not self._release.alive:
+            raise RuntimeError('RubberbandStream is closed')
+
+    @property
+    def rate(self):
+        '''The playback rate, which may change between blocks'''
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        if rate <= 0:
+            raise ValueError('rate must be strictly positive')
+
+        with self._lock:
+            self._check_open()
+            _librubberband.load().rubberband_set_time_ratio(self._state,
+                                                            1.0 / rate)
+            self._rate = float(rate)
+
+    @property
+    def n_steps(self):
+        '''The pitch shift in semitones, which may change between blocks'''
+        return self._n_steps
+
+    @n_steps.setter
+    def n_steps(self, n_steps):
+        with self._lock:
+            self._check_open()
+            _librubberband.load().rubberband_set_pitch_scale(
+                self._state, 2.0 ** (n_steps / 12.0))
+            self._n_steps = float(n_steps)
+
+    @property
+    def latency(self):
+        '''The delay of the output, in frames'''
+        with self._lock:
+            self._check_open()
+            return int(_librubberband.load().rubberband_get_latency(
+                self._state))
+
+    def _frames(self, block):
+        '''Validate a block, as an array of shape (n, channels)'''
+        block = np.asarray(block)
+
+        if block.ndim == 1 and self.channels == 1:
+            return block[:, np.newaxis]
+
+        if block.ndim != 2 or block.shape[1] != self.channels:
+            raise ValueError('block has shape {}, but the stream has {} '
+                             'channels'.format(block.shape, self.channels))
+
+        return block
+
+    def _output(self, y_out, ndim, dtype):
+        if dtype.kind != 'f':
+            dtype = np.dtype(np.float32)
+
+        y_out = y_out.astype(dtype, copy=False)
+        if ndim == 1:
+            return y_out[:, 0]
+        return y_out
+
+    def process(self, block):
+        '''Process the next block of input.
+
+        Parameters
+        ----------
+        block : np.ndarray [shape=(n,) or (n, channels)]
+            The next block of audio
+
+        Returns
+        -------
+        y_out : np.ndarray [shape=(m,) or (m, channels)]
+            The output that became available, which may be empty,
+            especially at the start.  It has the dtype of `block`,
+            if that is a floating point type.
+
+        Raises
+        ------
+        RuntimeError
+            if the stream has been flushed, and not reset since,
+            or is closed
+        '''
+        frames = self._frames(block)
+
+        with self._lock:
+            self._check_open()
+            if self.finished:
+                raise RuntimeError('RubberbandStream has been flushed: '
+                                   'reset it to process more audio')
+
+            chunks = [_librubberband.process_block(
+                self._state, frames[start:start + self.block_size])
+                for start in range(0, len(frames), self.block_size)]
+
+            self._ndim = ndim = np.ndim(block)
+            self._dtype = dtype = frames.dtype
+
+        if not chunks:
+            chunks = [np.empty((0, self.channels), dtype=np.float32)]
+
+        return self._output(np.concatenate(chunks), ndim, dtype)
+
+    def flush(self):
+        '''Finish the stream, and return all of its remaining output.
+
+        After flushing, the stream must be `reset` before it can process
+        more audio.
+
+        Returns
+        -------
+        y_out : np.ndarray [shape=(m,) or (m, channels)]
+            The remaining output, with the layout of the last block
+        '''
+        with self._lock:
+            self._check_open()
+            if self.finished:
+                y_out = np.empty((0, self.channels), dtype=np.float32)
+            else:
+                y_out = _librubberband.process_block(
+                    self._state, np.empty((0, self.channels),
+                                          dtype=np.float32), final=True)
+                self.finished = True
+            ndim, dtype = self._ndim, self._dtype
+
+        return self._output(y_out, ndim, dtype)
+
+    def reset(self):
+        '''Discard all buffered audio, and start a new stream.
+
+        The current `rate` and `n_steps` are kept.
+        '''
+        with self._lock:
+            self._check_open()
+            _librubberband.load().rubberband_reset(self._state)
+            self.finished = False
+
+    def close(self):
+        '''Release the stretcher.
+
+        The stream cannot be used afterwards.
+        '''
+        with self._lock:
+            self._release()
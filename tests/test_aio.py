@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+import pyrubberband
+
+
+@pytest.fixture(params=[None, 2])
+def channels(request):
+    return request.param
+
+
+@pytest.fixture
+def signal(channels):
+    sr = 16000
+    if channels is None:
+        return np.random.randn(sr), sr
+    return np.random.randn(sr, channels), sr
+
+
+@pytest.fixture
+def tempdir(tmp_path):
+    pyrubberband.set_tempdir(tmp_path)
+    yield tmp_path
+    pyrubberband.set_tempdir(None)
+
+
+@pytest.mark.parametrize('rate', [0.5, 1.0, 2.0])
+def test_time_stretch(signal, rate):
+    y, sr = signal
+
+    y_s = asyncio.run(pyrubberband.aio.time_stretch(y, sr, rate))
+
+    assert y_s.ndim == y.ndim
+    assert np.allclose(y_s.shape[0] * rate, y.shape[0])
+
+
+def test_time_stretch_bad_rate(signal):
+    y, sr = signal
+
+    with pytest.raises(ValueError):
+        asyncio.run(pyrubberband.aio.time_stretch(y, sr, 0))
+
+
+def test_pitch_shift(signal):
+    y, sr = signal
+
+    y_s = asyncio.run(pyrubberband.aio.pitch_shift(y, sr, 2,
+                                                   rbargs={'-c': '5'}))
+
+    assert y_s.shape == y.shape
+
+
+def test_timemap_stretch(signal):
+    y, sr = signal
+    n = len(y)
+    time_map = [(0, 0), (n // 2, n // 4), (n, n // 2)]
+
+    y_s = asyncio.run(pyrubberband.aio.timemap_stretch(y, sr, time_map))
+
+    assert np.isclose(len(y_s), n // 2, rtol=1e-3)
+
+
+def test_semaphore(signal):
+    y, sr = signal
+
+    async def __main():
+        semaphore = asyncio.Semaphore(2)
+        return await asyncio.gather(
+            *[pyrubberband.aio.pitch_shift(y, sr, k, semaphore=semaphore)
+              for k in range(1, 6)])
+
+    for y_s in asyncio.run(__main()):
+        assert y_s.shape == y.shape
+
+
+def test_cancel(tempdir):
+    sr = 44100
+    y = np.random.randn(60 * sr)
+
+    async def __main():
+        task = asyncio.ensure_future(
+            pyrubberband.aio.time_stretch(y, sr, 0.5))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(__main())
+
+    # Only the emptied scratch files are left for reuse
+    assert all(path.stat().st_size == 0 for path in tempdir.iterdir())
+
+
+def test_missing_cli(monkeypatch):
+    monkeypatch.setattr(pyrubberband.pyrb, '__RUBBERBAND_UTIL',
+                        'rubberband-missing')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(pyrubberband.aio.pitch_shift(np.random.randn(22050),
+                                                 22050, 1))
+
+
+def test_backend(signal, monkeypatch):
+    y, sr = signal
+    pyrubberband.set_backend('fast')
+    try:
+        y_ref = pyrubberband.pitch_shift(y, sr, 2)
+
+        # Processed in-process, not by rubberband
+        monkeypatch.setattr(asyncio, 'create_subprocess_exec', None)
+        y_s = asyncio.run(pyrubberband.aio.pitch_shift(y, sr, 2))
+    finally:
+        pyrubberband.set_backend('cli')
+
+    assert np.array_equal(y_s, y_ref)
+
+
+def test_pool(signal, monkeypatch):
+    y, sr = signal
+    with pyrubberband.WorkerPool(size=1) as pool:
+        previous = pyrubberband.set_pool(pool)
+
+        # Nothing may be started from this process
+        monkeypatch.setattr(asyncio, 'create_subprocess_exec', None)
+        monkeypatch.setattr(pyrubberband.pyrb.subprocess, 'Popen', None)
+        try:
+            y_s = asyncio.run(pyrubberband.aio.time_stretch(y, sr, 2.0))
+        finally:
+            pyrubberband.set_pool(previous)
+
+    assert y_s.shape[0] == len(y) // 2
+
+
+@pytest.fixture
+def slow_cli(tmp_path, monkeypatch):
+    script = tmp_path / 'rubberband'
+    script.write_text('#!/bin/sh\n'
+                      'case "$1" in --version|-h) echo 3.3.0; exit;; esac\n'
+                      'exec sleep 10\n')
+    script.chmod(0o755)
+    monkeypatch.setattr(pyrubberband.pyrb, '__RUBBERBAND_UTIL', str(script))
+
+
+@pytest.mark.parametrize('transport', ['tempfile', 'pipe'])
+def test_timeout(slow_cli, transport):
+    y = np.random.randn(16000)
+    previous = pyrubberband.pyrb.__TRANSPORT
+    pyrubberband.set_transport(transport)
+    try:
+        with pytest.raises(pyrubberband.RubberbandTimeout) as exc:
+            asyncio.run(pyrubberband.aio.pitch_shift(y, 16000, 1,
+                                                     timeout=0.2))
+        assert exc.value.timeout == 0.2
+
+        pyrubberband.set_limits(timeout=0.3)
+        with pytest.raises(pyrubberband.RubberbandTimeout) as exc:
+            asyncio.run(pyrubberband.aio.pitch_shift(y, 16000, 1))
+        assert exc.value.timeout == 0.3
+    finally:
+        pyrubberband.set_limits()
+        pyrubberband.set_transport(previous)
+
+
+def test_encode_in_thread(signal, monkeypatch):
+    y, sr = signal
+    write = pyrubberband.pyrb.__write_audio
+    threads = []
+
+    def __write_audio(*args):
+        threads.append(threading.current_thread())
+        write(*args)
+
+    monkeypatch.setattr(pyrubberband.pyrb, '__write_audio', __write_audio)
+    previous = pyrubberband.pyrb.__TRANSPORT
+    pyrubberband.set_transport('pipe')
+    try:
+        asyncio.run(pyrubberband.aio.pitch_shift(y, sr, 1))
+    finally:
+        pyrubberband.set_transport(previous)
+
+    # The event loop runs in the main thread
+    assert threads and threading.main_thread() not in threads
+
+
+def test_validate_in_thread(signal, monkeypatch):
+    y, sr = signal
+    probe = pyrubberband.get_backend_info
+    threads = []
+
+    def get_backend_info(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return probe(*args, **kwargs)
+
+    monkeypatch.setattr(pyrubberband.pyrb, 'get_backend_info',
+                        get_backend_info)
+    monkeypatch.setattr(pyrubberband.pyrb, '__VALIDATED', set())
+
+    options = pyrubberband.RubberbandOptions(formant=True)
+    asyncio.run(pyrubberband.aio.pitch_shift(y, sr, 1, rbargs=options))
+
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''Parity tests between the command-line, library and fast backends'''
+
+import numpy as np
+import pytest
+
+import pyrubberband
+from pyrubberband import _librubberband
+from pyrubberband import _vocoder
+
+
+requires_library = pytest.mark.skipif(not _librubberband.available(),
+                                      reason='librubberband is not installed')
+
+
+@pytest.fixture
+def library_backend():
+    pyrubberband.set_backend('library')
+    yield
+    pyrubberband.set_backend('cli')
+
+
+@pytest.fixture
+def fast_backend():
+    pyrubberband.set_backend('fast')
+    yield
+    pyrubberband.set_backend('cli')
+
+
+def run_both(func, *args, backend='library', **kwargs):
+    y_cli = func(*args, **kwargs)
+
+    pyrubberband.set_backend(backend)
+    try:
+        y_lib = func(*args, **kwargs)
+    finally:
+        pyrubberband.set_backend('cli')
+
+    return y_cli, y_lib
+
+
+def spectrum(y):
+    s = np.abs(np.fft.rfft(y, axis=0))
+    return s / s.max(axis=0)
+
+
+@requires_library
+@pytest.mark.parametrize('rate', [0.5, 0.8, 1.5, 2.0])
+@pytest.mark.parametrize('channels', [None, 2])
+def test_parity_time_stretch(rate, channels):
+    sr = 22050
+    t = np.arange(sr) / sr
+    y = np.sin(2 * np.pi * 440 * t)
+    if channels is not None:
+        y = np.tile(y[:, np.newaxis], (1, channels))
+
+    y_cli, y_lib = run_both(pyrubberband.time_stretch, y, sr, rate)
+
+    assert y_cli.shape == y_lib.shape
+    assert y_cli.dtype == y_lib.dtype
+    assert np.array_equal(np.argmax(spectrum(y_cli), axis=0),
+                          np.argmax(spectrum(y_lib), axis=0))
+
+
+@requires_library
+@pytest.mark.parametrize('n_steps', [-2, -0.5, 1, 3])
+def test_parity_pitch_shift(n_steps):
+    sr = 22050
+    t = np.arange(sr) / sr
+    y = np.sin(2 * np.pi * 440 * t)
+
+    y_cli, y_lib = run_both(pyrubberband.pitch_shift, y, sr, n_steps,
+                            rbargs={'-c': '5'})
+
+    assert y_cli.shape == y_lib.shape
+    assert np.allclose(spectrum(y_cli), spectrum(y_lib), atol=5e-2)
+
+
+@requires_library
+def test_parity_timemap_stretch():
+    sr = n = 22050
+    y = np.cos(2 * np.pi * 500 * np.arange(n) / sr)
+    time_map = [(0, 0), (n // 4, n // 4), (3 * n // 4, n // 2),
+                (n, 3 * n // 4)]
+
+    y_cli, y_lib = run_both(pyrubberband.timemap_stretch, y, sr, time_map)
+
+    assert np.isclose(len(y_cli), len(y_lib), rtol=1e-3)
+    assert np.argmax(spectrum(y_cli)) == np.argmax(spectrum(y_lib))
+
+
+def test_fallback(library_backend):
+    # Options the library can't express go through the command line
+    sr = 16000
+    y = np.random.randn(sr)
+    y_s = pyrubberband.time_stretch(y, sr, 2.0, rbargs={'--realtime': ''})
+    assert np.allclose(len(y_s) * 2.0, len(y))
+
+
+def test_bad_backend():
+    with pytest.raises(ValueError):
+        pyrubberband.set_backend('vinyl')
+
+
+@pytest.mark.parametrize(
+    'kwargs,options,time_ratio,pitch_scale',
+    [
+        ({'--tempo': 2.0}, _librubberband.OPTION_STRETCH_PRECISE, 0.5, 1.0),
+        ({'--time': 1.5, '--loose': ''}, 0, 1.5, 1.0),
+        ({'--pitch': 12}, _librubberband.OPTION_STRETCH_PRECISE, 1.0, 2.0),
+        ({'--duration': 2.0}, _librubberband.OPTION_STRETCH_PRECISE, 2.0, 1.0),
+        ({'-c': '0', '--formant': ''},
+         (_librubberband.OPTION_STRETCH_PRECISE |
+          _librubberband.OPTION_TRANSIENTS_SMOOTH |
+          _librubberband.OPTION_PHASE_INDEPENDENT |
+          _librubberband.OPTION_WINDOW_LONG |
+          _librubberband.OPTION_FORMANT_PRESERVED), 1.0, 1.0),
+    ]
+)
+def test_parse_args(kwargs, options, time_ratio, pitch_scale):
+    parsed = _librubberband.parse_args(kwargs, 16000, 16000)
+
+    assert parsed[0] == options
+    assert np.isclose(parsed[1], time_ratio)
+    assert np.isclose(parsed[2], pitch_scale)
+    assert parsed[3] is None
+
+
+def test_parse_args_timemap(tmp_path):
+    stretch_file = tmp_path / 'map.txt'
+    stretch_file.write_text('0 0\n100 50\n200 200\n')
+
+    time_map = _librubberband.parse_args({'--timemap': str(stretch_file)},
+                                         16000, 200)[3]
+
+    assert np.array_equal(time_map, [[0, 0], [100, 50], [200, 200]])
+    assert time_map.dtype == np.int64
+
+    # Fractional maps, as written for float key frames
+    stretch_file.write_text('0 0\n100.25 49.75\n200 200.5\n')
+    time_map = _librubberband.parse_args({'--timemap': str(stretch_file)},
+                                         16000, 200)[3]
+
+    assert np.array_equal(time_map, [[0, 0], [100, 50], [200, 200]])
+
+
+@pytest.mark.parametrize('kwargs', [{'--realtime': ''}, {'-c': '9'},
+                                    {'--pitchmap': 'map.txt'}])
+def test_parse_args_unsupported(kwargs):
+    with pytest.raises(NotImplementedError):
+        _librubberband.parse_args(kwargs, 16000, 16000)
+
+
+@requires_library
+@pytest.mark.parametrize('shape', [(0,), (0, 2)])
+def test_library_empty(library_backend, shape):
+    y = np.zeros(shape)
+
+    assert pyrubberband.time_stretch(y, 22050, 2.0).shape == shape
+    assert pyrubberband.pitch_shift(y, 22050, 1).shape == shape
+
+
+def test_parse_args_empty():
+    parsed = _librubberband.parse_args({'--duration': 1.0}, 22050, 0)
+    assert parsed[1] == 1.0
+
+
+@pytest.mark.parametrize('rate', [0.5, 0.8, 1.5, 2.0])
+@pytest.mark.parametrize('channels', [None, 2])
+def test_fast_time_stretch(rate, channels):
+    sr = 22050
+    t = np.arange(sr) / sr
+    y = np.sin(2 * np.pi * 440 * t)
+    if channels is not None:
+        y = np.tile(y[:, np.newaxis], (1, channels))
+
+    y_cli, y_fast = run_both(pyrubberband.time_stretch, y, sr, rate,
+                             backend='fast')
+
+    assert y_cli.shape == y_fast.shape
+    assert y_cli.dtype == y_fast.dtype
+    peak = np.argmax(spectrum(y_fast), axis=0) * sr / len(y_fast)
+    assert np.allclose(peak, 440, atol=2)
+
+    # A steady tone keeps its level
+    edge = len(y_fast) // 8
+    middle = y_fast[edge:-edge]
+    assert np.allclose(np.sqrt(np.mean(middle**2, axis=0)), np.sqrt(0.5),
+                       rtol=0.05)
+
+
+@pytest.mark.parametrize('n_steps', [-2, 1, 3])
+def test_fast_pitch_shift(fast_backend, n_steps):
+    sr = 22050
+    t = np.arange(sr) / sr
+    y = np.sin(2 * np.pi * 440 * t)
+
+    y_fast = pyrubberband.pitch_shift(y, sr, n_steps)
+
+    assert y_fast.shape == y.shape
+    peak = np.argmax(spectrum(y_fast)) * sr / len(y)
+    assert np.isclose(peak, 440 * 2.0 ** (n_steps / 12.0), atol=2)
+
+
+def test_fast_timemap_stretch(fast_backend):
+    sr = n = 22050
+    y = np.cos(2 * np.pi * 500 * np.arange(n) / sr)
+    time_map = [(0, 0), (n // 4, n // 4), (3 * n // 4, n // 2),
+                (n, 3 * n // 4)]
+
+    y_fast = pyrubberband.timemap_stretch(y, sr, time_map)
+
+    assert len(y_fast) == 3 * n // 4
+    assert np.argmax(spectrum(y_fast)) * sr / len(y_fast) == pytest.approx(
+        500, abs=2)
+
+
+def test_fast_in_process(fast_backend, monkeypatch):
+    monkeypatch.setattr(pyrubberband.pyrb.subprocess, 'Popen', None)
+
+    sr = 16000
+    y = np.random.randn(sr, 3).astype(np.float32)
+    y_s = pyrubberband.transform(y, sr, rate=1.5, n_steps=2,
+                                 rbargs={'--crisp': '6', '--fine': ''})
+
+    assert y_s.shape == (round(sr / 1.5), 3)
+    assert y_s.dtype == np.float32
+
+
+def test_fast_fallback(fast_backend):
+    # Options the phase vocoder can't reproduce go through the command line
+    sr = 16000
+    y = np.random.randn(sr)
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        pyrubberband.pitch_shift(y, sr, 2, rbargs={'--formant': ''})
+
+    assert any(e.phase == 'process' for e in events)
+    assert not any(e.phase == 'fast' for e in events)
+
+
+def test_fast_identity():
+    sr = 22050
+    y = np.random.randn(sr, 2)
+
+    y_s = _vocoder.process(y, sr, 1.0, 1.0,
+                           np.array([[0, 0], [sr // 2, sr // 2]]))
+    assert np.allclose(y_s[2048:-2048], y[2048:-2048], atol=1e-8)
+
+
+@pytest.mark.parametrize(
+    'kwargs,time_ratio,pitch_scale',
+    [({'--tempo': 2.0}, 0.5, 1.0),
+     ({'--time': 1.5, '--crisp': '3'}, 1.5, 1.0),
+     ({'--pitch': 12, '--fine': ''}, 1.0, 2.0),
+     ({'--duration': 2.0}, 2.0, 1.0)]
+)
+def test_fast_parse_args(kwargs, time_ratio, pitch_scale):
+    parsed = _vocoder.parse_args(kwargs, 16000, 16000)
+
+    assert np.isclose(parsed[0], time_ratio)
+    assert np.isclose(parsed[1], pitch_scale)
+    assert parsed[2] is None
+
+
+@pytest.mark.parametrize('kwargs', [{'--formant': ''}, {'--realtime': ''},
+                                    {'--pitchmap': 'map.txt'}])
+def test_fast_parse_args_unsupported(kwargs):
+    with pytest.raises(NotImplementedError):
+        _vocoder.parse_args(kwargs, 16000, 16000)
+
+
+@pytest.mark.parametrize('shape', [(0,), (0, 2)])
+def test_fast_empty(fast_backend, shape):
+    y = np.zeros(shape)
+
+    assert pyrubberband.time_stretch(y, 22050, 2.0).shape == shape
+    assert pyrubberband.pitch_shift(y, 22050, 1).shape == shape
+    assert _vocoder.parse_args({'--duration': 1.0}, 22050, 0)[0] == 1.0
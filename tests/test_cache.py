@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+import pyrubberband
+
+
+@pytest.fixture
+def cache():
+    cache = pyrubberband.ResultCache()
+    previous = pyrubberband.set_cache(cache)
+    yield cache
+    pyrubberband.set_cache(previous)
+
+
+def test_cache_hit(cache, monkeypatch):
+    sr = 16000
+    y = np.random.randn(sr)
+
+    y_1 = pyrubberband.pitch_shift(y, sr, 1)
+
+    # A hit must not run rubberband at all
+    monkeypatch.setattr(pyrubberband.pyrb.subprocess, 'check_call', None)
+    monkeypatch.setattr(pyrubberband.pyrb.subprocess, 'run', None)
+
+    y_2 = pyrubberband.pitch_shift(y, sr, 1)
+
+    assert np.array_equal(y_1, y_2)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+    # Hits are copies: modifying one does not corrupt the cache
+    y_2[:] = 0
+    assert np.array_equal(pyrubberband.pitch_shift(y, sr, 1), y_1)
+
+
+def test_cache_key():
+    y = np.random.randn(100)
+    key = pyrubberband.ResultCache.key
+
+    assert (key(y, 8000, [('--pitch', 1)]) ==
+            key(y.copy(), 8000, [('--pitch', 1)]))
+    # Option order does not matter
+    assert (key(y, 8000, [('--pitch', 1), ('-c', 5)]) ==
+            key(y, 8000, [('-c', 5), ('--pitch', 1)]))
+
+    assert key(y, 8000, [('--pitch', 1)]) != key(y, 16000, [('--pitch', 1)])
+    assert key(y, 8000, [('--pitch', 1)]) != key(y, 8000, [('--pitch', 2)])
+    assert (key(y, 8000, [('--pitch', 1)]) !=
+            key(y.astype(np.float32), 8000, [('--pitch', 1)]))
+    assert (key(y, 8000, [('--pitch', 1)]) !=
+            key(y.reshape((-1, 1)), 8000, [('--pitch', 1)]))
+    assert (key(y, 8000, [('--pitch', 1)]) !=
+            key(y[::-1], 8000, [('--pitch', 1)]))
+
+
+def test_cache_key_timemap(tmp_path):
+    y = np.random.randn(100)
+
+    map_1 = tmp_path / 'map_1.txt'
+    map_2 = tmp_path / 'map_2.txt'
+    map_1.write_text('0 0\n100 50\n')
+    map_2.write_text('0 0\n100 50\n')
+
+    key = pyrubberband.ResultCache.key
+    assert (key(y, 8000, [('--timemap', map_1)]) ==
+            key(y, 8000, [('--timemap', map_2)]))
+
+    map_2.write_text('0 0\n50 10\n100 50\n')
+    assert (key(y, 8000, [('--timemap', map_1)]) !=
+            key(y, 8000, [('--timemap', map_2)]))
+
+
+def test_memory_eviction():
+    cache = pyrubberband.ResultCache(max_bytes=3 * 800)
+
+    for i in range(5):
+        cache.put(str(i), np.zeros(100))
+
+    stats = cache.stats()
+    assert stats['memory_entries'] == 3
+    assert stats['memory_bytes'] == 3 * 800
+    assert stats['evictions'] == 2
+
+    assert cache.get('0') is None
+    assert cache.get('4') is not None
+
+
+def test_disk_tier(tmp_path):
+    y = np.random.randn(1000, 2)
+
+    cache = pyrubberband.ResultCache(max_bytes=0, directory=str(tmp_path))
+    cache.put('a', y)
+    assert cache.stats()['memory_entries'] == 0
+    assert cache.stats()['disk_entries'] == 1
+
+    # A new cache over the same directory picks up existing entries
+    cache = pyrubberband.ResultCache(directory=str(tmp_path))
+    assert np.array_equal(cache.get('a'), y)
+    assert cache.stats()['memory_entries'] == 1
+
+
+def test_disk_eviction(tmp_path):
+    cache = pyrubberband.ResultCache(max_bytes=0, directory=str(tmp_path),
+                                     max_disk_bytes=3000)
+
+    for i in range(5):
+        cache.put(str(i), np.zeros(100))
+
+    assert cache.stats()['disk_bytes'] <= 3000
+    assert cache.stats()['evictions'] > 0
+    assert len(list(tmp_path.glob('*.npy'))) == cache.stats()['disk_entries']
+    assert cache.get('4') is not None
+
+    cache.clear()
+    assert not list(tmp_path.glob('*.npy'))
+
+
+def test_disk_evicted_elsewhere(tmp_path, monkeypatch):
+    y = np.random.randn(100)
+    cache = pyrubberband.ResultCache(max_bytes=0, directory=str(tmp_path))
+    cache.put('a', y)
+
+    # Another process evicts the entry between the read and the touch
+    load = np.load
+
+    def __load(path, **kwargs):
+        y_out = np.array(load(path, **kwargs))
+        os.unlink(path)
+        return y_out
+
+    monkeypatch.setattr(np, 'load', __load)
+    assert np.array_equal(cache.get('a'), y)
+
+
+def test_disk_stale_tmp(tmp_path):
+    stale = tmp_path / 'stale.tmp'
+    fresh = tmp_path / 'fresh.tmp'
+    stale.touch()
+    fresh.touch()
+    old = time.time() - 2 * 3600
+    os.utime(stale, (old, old))
+
+    # Partial writes are swept once they are old enough to be abandoned
+    pyrubberband.ResultCache(directory=str(tmp_path))
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_timemap_cache(cache):
+    sr, n = 16000, 16000
+    y = np.random.randn(n)
+
+    pyrubberband.timemap_stretch(y, sr, [(0, 0), (n // 2, n // 4), (n, n)])
+    pyrubberband.timemap_stretch(y, sr, [(0, 0), (n // 2, n // 4), (n, n)])
+    pyrubberband.timemap_stretch(y, sr, [(0, 0), (n // 2, n // 2), (n, n)])
+
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+
+def test_cache_out(cache):
+    sr = 16000
+    y = np.random.randn(sr).astype(np.float32)
+
+    # The result is decoded into a float64 `out`, but cached as float32
+    out = np.empty(2 * sr, dtype=np.float64)
+    assert pyrubberband.time_stretch(y, sr, 0.5, out=out) is out
+
+    y_hit = pyrubberband.time_stretch(y, sr, 0.5)
+    assert cache.stats()['hits'] == 1
+    assert y_hit.dtype == np.float32
+    assert np.allclose(y_hit, out)
+
+
+@pytest.mark.parametrize('max_bytes,max_disk_bytes',
+                         [(-1, None), (0, -1)])
+def test_bad_budget(max_bytes, max_disk_bytes):
+    with pytest.raises(ValueError):
+        pyrubberband.ResultCache(max_bytes=max_bytes,
+                                 max_disk_bytes=max_disk_bytes)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import csv
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from pyrubberband import cli
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    sr = 16000
+    for name in ['a', 'b', 'c']:
+        sf.write(str(tmp_path / (name + '.wav')), np.random.randn(sr) * 0.1,
+                 sr)
+    return tmp_path
+
+
+def write_csv(path, rows):
+    with open(str(path), 'w', newline='') as fdesc:
+        writer = csv.DictWriter(fdesc, ['input', 'operation', 'params',
+                                        'output'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_cli_csv(corpus, capsys):
+    manifest = corpus / 'jobs.csv'
+    write_csv(manifest, [
+        dict(input='a.wav', operation='time_stretch', params='2.0',
+             output='out/a.wav'),
+        dict(input='b.wav', operation='pitch_shift', params='-3',
+             output='out/b.flac'),
+        dict(input='c.wav', operation='time_stretch',
+             params='{"rate": 0.5, "rbargs": {"--crisp": "6"}}',
+             output='out/c.wav')])
+
+    assert cli.main([str(manifest), '--workers', '2']) == 0
+
+    assert len(sf.read(str(corpus / 'out' / 'a.wav'))[0]) == 8000
+    assert len(sf.read(str(corpus / 'out' / 'b.flac'))[0]) == 16000
+    assert len(sf.read(str(corpus / 'out' / 'c.wav'))[0]) == 32000
+    assert not list((corpus / 'out').glob('.partial-*'))
+
+    err = capsys.readouterr().err
+    assert '3 jobs, 0 already finished' in err
+    assert '3/3 jobs, 0 failed' in err
+    assert 'ETA 0:00:00' in err
+
+
+def test_cli_resume(corpus, capsys):
+    manifest = corpus / 'jobs.jsonl'
+    jobs = [dict(input=name + '.wav', operation='time_stretch', params=2.0,
+                 output=name + '_fast.wav') for name in 'ab']
+    manifest.write_text('\n'.join(json.dumps(job) for job in jobs) + '\n')
+
+    assert cli.main([str(manifest), '-j', '1']) == 0
+    (corpus / 'a_fast.wav').unlink()
+
+    # Finished jobs are skipped, new ones are run
+    jobs.append(dict(input='c.wav', operation='pitch_shift',
+                     params={'n_steps': 1}, output='c_up.wav'))
+    manifest.write_text('\n'.join(json.dumps(job) for job in jobs) + '\n')
+    capsys.readouterr()
+
+    assert cli.main([str(manifest), '-j', '1']) == 0
+    assert '3 jobs, 2 already finished' in capsys.readouterr().err
+    assert not (corpus / 'a_fast.wav').exists()
+    assert (corpus / 'c_up.wav').exists()
+
+    with sqlite3.connect(str(corpus / 'jobs.jsonl.done.sqlite')) as db:
+        assert db.execute('SELECT COUNT(*) FROM done').fetchone() == (3,)
+
+
+def test_cli_failure(corpus, tmp_path, capsys):
+    manifest = corpus / 'jobs.jsonl'
+    log = tmp_path / 'log.sqlite'
+    job = dict(input='missing.wav', operation='time_stretch', params=2.0,
+               output='x.wav')
+    manifest.write_text(json.dumps(job) + '\n')
+
+    assert cli.main([str(manifest), '--log', str(log), '-j', '1']) == 1
+    assert 'failed: ' in capsys.readouterr().err
+    assert not (corpus / 'x.wav').exists()
+
+    with sqlite3.connect(str(log)) as db:
+        assert db.execute('SELECT COUNT(*) FROM done').fetchone() == (0,)
+        assert db.execute('SELECT COUNT(*) FROM failed').fetchone() == (1,)
+
+    # Failed jobs are retried
+    assert cli.main([str(manifest), '--log', str(log), '-j', '1']) == 1
+    assert '1 jobs, 0 already finished' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('row', [
+    dict(input='a.wav', operation='reverse', params='1', output='x.wav'),
+    dict(input='a.wav', operation='time_stretch', params='', output='x.wav'),
+    dict(input='a.wav', operation='time_stretch', params='fast',
+         output='x.wav'),
+    dict(input='a.wav', operation='pitch_shift', params='{"rate": 2}',
+         output='x.wav'),
+    dict(input='a.wav', operation='pitch_shift',
+         params='{"n_steps": 2, "speed": 1}', output='x.wav')])
+def test_cli_bad_manifest(corpus, row):
+    manifest = corpus / 'jobs.csv'
+    write_csv(manifest, [row])
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main([str(manifest)])
+    assert exc.value.code == 2
+
+
+@pytest.mark.parametrize('args', [['--workers', '0'], ['--timeout', '-1']])
+def test_cli_bad_args(corpus, args):
+    manifest = corpus / 'jobs.csv'
+    write_csv(manifest, [])
+
+    with pytest.raises(SystemExit):
+        cli.main([str(manifest)] + args)
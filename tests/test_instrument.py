@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import asyncio
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+import pyrubberband
+from pyrubberband import instrument
+
+
+@pytest.fixture
+def events():
+    events = []
+    with instrument.hooks(events.append):
+        yield events
+
+
+@pytest.mark.parametrize('transport', ['tempfile', 'pipe'])
+def test_phases(events, transport):
+    sr = 16000
+    y = np.random.randn(sr, 2)
+
+    pyrubberband.set_transport(transport)
+    try:
+        pyrubberband.time_stretch(y, sr, 2.0)
+    finally:
+        pyrubberband.set_transport('tempfile')
+
+    phases = [e.phase for e in events]
+    assert phases == ['write', 'spawn', 'process', 'read', 'total']
+    assert all(e.operation == 'time_stretch' for e in events)
+    assert all(e.duration >= 0 for e in events)
+
+    by_phase = {e.phase: e for e in events}
+    assert by_phase['write'].nbytes > 0
+    assert by_phase['read'].nbytes > 0
+    assert by_phase['process'].returncode == 0
+    assert by_phase['process'].command[0] == \
+        shutil.which(pyrubberband.pyrb.__RUBBERBAND_UTIL)
+    assert '--tempo' in by_phase['process'].command
+    assert by_phase['total'].duration >= by_phase['process'].duration
+
+
+def test_operations(events):
+    sr = n = 16000
+    y = np.random.randn(n)
+
+    pyrubberband.pitch_shift(y, sr, 1)
+    pyrubberband.timemap_stretch(y, sr, [(0, 0), (n, n // 2)])
+    asyncio.run(pyrubberband.aio.pitch_shift(y, sr, 1))
+
+    totals = [e.operation for e in events if e.phase == 'total']
+    assert totals == ['pitch_shift', 'timemap_stretch', 'pitch_shift']
+
+
+def test_failed_process(events, monkeypatch):
+    # `false` exits with an error, whatever its arguments
+    monkeypatch.setattr(pyrubberband.pyrb, '__RUBBERBAND_UTIL', 'false')
+
+    with pytest.raises(subprocess.CalledProcessError):
+        pyrubberband.time_stretch(np.random.randn(1000), 16000, 2.0)
+
+    process = [e for e in events if e.phase == 'process']
+    assert process[0].returncode == 1
+    assert events[-1].phase == 'total'
+
+
+def test_hooks_context():
+    events = []
+    with instrument.hooks(events.append):
+        assert instrument.active()
+    assert not instrument.active()
+
+    pyrubberband.pitch_shift(np.random.randn(1000), 16000, 1)
+    assert not events
+
+    with pytest.raises(ValueError):
+        instrument.remove_hook(events.append)
+
+
+def test_histogram():
+    histogram = instrument.PhaseHistogram(bounds=[0.1, 1.0])
+
+    for duration in [0.05, 0.5, 5.0, 0.5]:
+        histogram(instrument.Event('pitch_shift', 'process', duration))
+
+    summary = histogram.summary()
+    stats = summary[('pitch_shift', 'process')]
+    assert stats['count'] == 4
+    assert np.isclose(stats['total'], 6.05)
+    assert np.isclose(stats['mean'], 6.05 / 4)
+    assert stats['buckets'] == [1, 2, 1]
+
+    histogram.reset()
+    assert not histogram.summary()
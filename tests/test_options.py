@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import dataclasses
+import threading
+
+import numpy as np
+import pytest
+
+import pyrubberband
+from pyrubberband import RubberbandOptions
+
+
+def test_argv():
+    options = RubberbandOptions(engine='R3', formant=True, crispness=3,
+                                window='short', threads=False,
+                                extra={'--ignore-clipping': ''})
+
+    assert options.argv == ('--fine', '--crisp', '3', '--window-short',
+                            '--no-threads', '--formant', '--ignore-clipping')
+    assert dict(options.items()) == {'--fine': '', '--crisp': '3',
+                                     '--window-short': '', '--no-threads': '',
+                                     '--formant': '',
+                                     '--ignore-clipping': ''}
+    assert RubberbandOptions().argv == ()
+
+
+def test_immutable_hashable():
+    options = RubberbandOptions(formant=True, extra={'-c': 5})
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        options.formant = False
+
+    same = RubberbandOptions(formant=True, extra=[('-c', '5')])
+    assert options == same
+    assert hash(options) == hash(same)
+    assert len({options, same, RubberbandOptions()}) == 2
+
+    # Replacing a field renders and validates again
+    assert dataclasses.replace(options, formant=False).argv == ('-c', '5')
+    with pytest.raises(ValueError):
+        dataclasses.replace(options, crispness=7)
+
+
+@pytest.mark.parametrize('kwargs', [dict(engine='R4'), dict(crispness=-1),
+                                    dict(crispness=2.5), dict(crispness=2.0),
+                                    dict(crispness=True), dict(window='huge'),
+                                    dict(transients='sharp'),
+                                    dict(detector='fast'), dict(threads=4)])
+def test_bad_options(kwargs):
+    with pytest.raises(ValueError):
+        RubberbandOptions(**kwargs)
+
+
+def test_validate():
+    info = pyrubberband.BackendInfo(path='/usr/bin/rubberband',
+                                    version=(2, 0, 0), version_string='2.0.0',
+                                    flags=frozenset(['--formant', '-c',
+                                                     '--crisp']),
+                                    engines=('R2',), pipes=False)
+
+    RubberbandOptions(formant=True, crispness=5).validate(info)
+
+    with pytest.raises(ValueError, match='R3'):
+        RubberbandOptions(engine='R3').validate(info)
+
+    with pytest.raises(ValueError, match='--pitch-hq'):
+        RubberbandOptions(pitch_hq=True).validate(info)
+
+    # Unparsed usage: only the engine can be checked
+    RubberbandOptions(pitch_hq=True).validate(info._replace(flags=frozenset()))
+
+
+def test_engine_r2():
+    options = RubberbandOptions(engine='R2')
+    assert options.argv == ('--faster',)
+
+    info = pyrubberband.BackendInfo(path='/usr/bin/rubberband',
+                                    version=(3, 3, 0), version_string='3.3.0',
+                                    flags=frozenset(['--faster', '-2',
+                                                     '--fine', '-3']),
+                                    engines=('R2', 'R3'), pipes=True)
+    options.validate(info)
+
+
+def test_options_rbargs():
+    sr = 16000
+    y = np.random.randn(sr)
+    options = RubberbandOptions(engine='R3', formant=True)
+
+    y_opt = pyrubberband.pitch_shift(y, sr, 2, rbargs=options)
+    y_dict = pyrubberband.pitch_shift(y, sr, 2,
+                                      rbargs={'--fine': '', '--formant': ''})
+
+    assert np.array_equal(y_opt, y_dict)
+
+
+def test_options_argv(monkeypatch):
+    # The command line is built from the pre-rendered argv
+    options = RubberbandOptions(engine='R3', extra={'-c': '5'})
+
+    arguments = []
+    run = pyrubberband.pyrb.__exec
+
+    def __exec(args, *rest, **kwargs):
+        arguments.append(args)
+        return run(args, *rest, **kwargs)
+
+    monkeypatch.setattr(pyrubberband.pyrb, '__exec', __exec)
+    pyrubberband.time_stretch(np.random.randn(1000), 16000, 2.0,
+                              rbargs=options)
+
+    assert arguments[0][2:-2] == ['--tempo', '2.0'] + list(options.argv)
+
+
+def test_options_shared():
+    # One options object, used by concurrent calls
+    sr = 16000
+    options = RubberbandOptions(formant=True)
+    results = pyrubberband.batch_time_stretch([np.random.randn(sr)] * 4, sr,
+                                              [0.5, 1.5, 2.0, 0.8],
+                                              rbargs=options, n_jobs=4)
+    assert all(isinstance(y, np.ndarray) for y in results)
+
+    threads = [threading.Thread(target=pyrubberband.pitch_shift,
+                                args=(np.random.randn(sr), sr, 1, options))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.parametrize('function,param', [
+    (pyrubberband.time_stretch, 2.0), (pyrubberband.pitch_shift, 1),
+    (pyrubberband.timemap_stretch, [(0, 0), (1000, 500)])])
+def test_rbargs_unchanged(function, param):
+    rbargs = {'-c': '5'}
+    function(np.random.randn(1000), 16000, param, rbargs=rbargs)
+    assert rbargs == {'-c': '5'}
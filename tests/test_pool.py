@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import os
+import queue
+import subprocess
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import pyrubberband
+from pyrubberband import _worker
+
+
+@pytest.fixture
+def pool():
+    pool = pyrubberband.WorkerPool(size=2, health_timeout=1.0)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def installed(pool):
+    previous = pyrubberband.set_pool(pool)
+    yield pool
+    pyrubberband.set_pool(previous)
+
+
+def test_pool_transparent(installed, monkeypatch):
+    sr = 16000
+    y = np.random.randn(sr, 2)
+
+    pyrubberband.set_pool(None)
+    y_ref = pyrubberband.pitch_shift(y, sr, 1)
+    pyrubberband.set_pool(installed)
+
+    # Nothing may be started from this process
+    monkeypatch.setattr(pyrubberband.pyrb.subprocess, 'Popen', None)
+
+    assert np.array_equal(pyrubberband.pitch_shift(y, sr, 1), y_ref)
+
+
+def test_pool_returncode(pool):
+    assert pool.run(['true'])[0] == 0
+    assert pool.run(['false'])[0] == 1
+
+    returncode, _, stderr = pool.run(['sh', '-c', 'echo oops >&2; exit 3'])
+    assert returncode == 3
+    assert stderr == b'oops\n'
+
+
+def test_pool_missing(pool, installed):
+    with pytest.raises(FileNotFoundError):
+        pool.run(['/nonexistent/rubberband'])
+
+    pyrubberband.pyrb.__RUBBERBAND_UTIL = '/nonexistent/rubberband'
+    try:
+        with pytest.raises(RuntimeError):
+            pyrubberband.pitch_shift(np.random.randn(1000), 16000, 1)
+    finally:
+        pyrubberband.pyrb.__RUBBERBAND_UTIL = 'rubberband'
+
+
+def test_pool_timeout(pool):
+    start = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        pool.run(['sleep', '10'], timeout=0.2)
+    assert time.perf_counter() - start < 5
+
+    # The worker survives
+    assert pool.run(['true'])[0] == 0
+    assert pool.stats()['restarts'] == 0
+
+
+def test_pool_restart(pool):
+    for worker in pool._workers:
+        worker.proc.kill()
+        worker.proc.wait()
+
+    assert pool.run(['true'])[0] == 0
+    assert pool.stats()['restarts'] == 1
+
+
+def test_pool_check(pool):
+    pool._workers[0].proc.kill()
+    pool._workers[0].proc.wait()
+
+    assert pool.check() == 1
+    assert pool.check() == 0
+    assert pool.stats() == dict(size=2, idle=2, restarts=1)
+
+
+def test_pool_backpressure():
+    with pyrubberband.WorkerPool(size=1, max_pending=0) as pool:
+        job = threading.Thread(target=pool.run, args=(['sleep', '0.5'],))
+        job.start()
+        time.sleep(0.1)
+
+        with pytest.raises(queue.Full):
+            pool.run(['true'], block=False)
+
+        # Blocking callers wait their turn
+        assert pool.run(['true'])[0] == 0
+        job.join()
+
+
+def test_pool_closed(pool):
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.run(['true'])
+
+
+def test_pool_closed_waiting():
+    pool = pyrubberband.WorkerPool(size=1)
+    errors = []
+
+    def __run(arguments):
+        try:
+            pool.run(arguments)
+        except Exception as exc:
+            errors.append(exc)
+
+    # One job running, one waiting for its worker
+    jobs = [threading.Thread(target=__run, args=(['sleep', '10'],)),
+            threading.Thread(target=__run, args=(['true'],))]
+    for job in jobs:
+        job.start()
+        time.sleep(0.2)
+
+    pool.close()
+    for job in jobs:
+        job.join()
+
+    assert len(errors) == 2
+    assert all(type(exc) is RuntimeError for exc in errors)
+    assert all('closed' in str(exc) for exc in errors)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self'), reason='requires /proc')
+def test_pool_kill_group(tmp_path):
+    pidfile = tmp_path / 'pid'
+    pool = pyrubberband.WorkerPool(size=1)
+
+    def __run():
+        with pytest.raises(RuntimeError):
+            pool.run(['sh', '-c',
+                      'echo $$ > {}; exec sleep 30'.format(pidfile)])
+
+    job = threading.Thread(target=__run)
+    job.start()
+    while not pidfile.exists() or not pidfile.read_text():
+        time.sleep(0.05)
+
+    # Killing the worker also kills the command it is running
+    pool.close()
+    job.join()
+
+    stat = '/proc/{}/stat'.format(int(pidfile.read_text()))
+    for _ in range(100):
+        if not os.path.exists(stat) or open(stat).read().split()[2] == 'Z':
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail('the command outlived its worker')
+
+
+@pytest.mark.parametrize('kwargs', [dict(size=0), dict(max_pending=-1),
+                                    dict(timeout=0), dict(health_timeout=0)])
+def test_pool_bad_params(kwargs):
+    with pytest.raises(ValueError):
+        pyrubberband.WorkerPool(**kwargs)
+
+
+def test_pool_limits(installed, tmp_path, monkeypatch):
+    script = tmp_path / 'rubberband'
+    script.write_text('#!/bin/sh\nnice >&2\n'
+                      '[ -e "$0.slow" ] && sleep 10\nexit 1\n')
+    script.chmod(0o755)
+    monkeypatch.setattr(pyrubberband.pyrb, '__RUBBERBAND_UTIL', str(script))
+    y = np.random.randn(1000)
+
+    pyrubberband.set_limits(nice=3)
+    try:
+        with pytest.raises(pyrubberband.RubberbandError) as exc:
+            pyrubberband.pitch_shift(y, 16000, 1)
+        assert int(exc.value.stderr) == min(os.nice(0) + 3, 19)
+
+        (tmp_path / 'rubberband.slow').touch()
+        with pytest.raises(pyrubberband.RubberbandTimeout) as exc:
+            pyrubberband.pitch_shift(y, 16000, 1, timeout=0.2)
+        assert exc.value.timeout == 0.2
+        assert int(exc.value.stderr) == min(os.nice(0) + 3, 19)
+    finally:
+        pyrubberband.set_limits()
+
+
+@pytest.mark.parametrize('waitid', [True, False])
+def test_worker_wait(waitid, monkeypatch):
+    if not waitid:
+        # As on macOS before Python 3.13
+        monkeypatch.delattr(os, 'waitid', raising=False)
+
+    reply = _worker.run(['sh', '-c', 'echo oops >&2; exit 3'])
+    assert reply['returncode'] == 3
+    assert reply['stderr'] == 'oops\n'
+
+    assert _worker.run(['sleep', '10'], timeout=0.2)['timeout']
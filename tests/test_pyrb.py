@@ -1,8 +1,16 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
+import errno
+import gc
+import os
+import subprocess
+import tempfile
+import threading
+
 import numpy as np
 import pytest
+import soundfile as sf
 
 from contextlib import nullcontext as dnr
 
@@ -184,3 +192,1030 @@ def test_missing_cli(cli, ctx):
     with ctx:
         pyrubberband.pyrb.__RUBBERBAND_UTIL = cli
         pyrubberband.pitch_shift(np.random.randn(22050), 22050, 1)
+
+
+@pytest.mark.parametrize('transport', ['tempfile', 'pipe'])
+def test_transport(transport, channels):
+    sr = 22050
+    if channels is not None:
+        y = np.random.randn(sr, channels)
+    else:
+        y = np.random.randn(sr)
+
+    y_s = pyrubberband.pyrb.__rubberband(y, sr, transport=transport,
+                                         **{'--pitch': 1})
+
+    assert y_s.shape == y.shape
+
+
+def test_bad_transport():
+    with pytest.raises(ValueError):
+        pyrubberband.set_transport('carrier-pigeon')
+
+
+@pytest.mark.parametrize('n_jobs', [None, 1, 3])
+def test_batch_time_stretch(n_jobs):
+    sr = 16000
+    ys = [np.random.randn(sr * (i + 1)) for i in range(4)]
+    rates = [0.5, 1.0, 2.0, -1]
+
+    y_s = pyrubberband.batch_time_stretch(ys, sr, rates, n_jobs=n_jobs)
+
+    assert len(y_s) == len(ys)
+    for y, rate, y_out in zip(ys[:3], rates[:3], y_s[:3]):
+        assert np.allclose(y_out.shape[0] * rate, y.shape[0])
+
+    # The bad rate is reported in place, and does not abort the batch
+    assert isinstance(y_s[3], ValueError)
+
+
+def test_batch_pitch_shift():
+    sr = 16000
+    ys = [np.random.randn(sr), np.random.randn(sr, 2)]
+
+    y_s = pyrubberband.batch_pitch_shift(ys, sr, 1, rbargs={'-c': '5'})
+
+    for y, y_out in zip(ys, y_s):
+        assert y.shape == y_out.shape
+
+
+def test_batch_timemap_stretch(sr, time_map, num_samples):
+    ys = [np.random.randn(num_samples)] * 2
+
+    y_s = pyrubberband.batch_timemap_stretch(ys, sr, [time_map] * 2)
+
+    for y_out in y_s:
+        assert np.isclose(len(y_out), time_map[-1][1], rtol=1e-3)
+
+
+@pytest.mark.parametrize(
+    'batch',
+    [pyrubberband.batch_time_stretch, pyrubberband.batch_pitch_shift,
+     pyrubberband.batch_timemap_stretch])
+def test_batch_bad_params(batch):
+    with pytest.raises(ValueError):
+        batch([np.zeros(100)] * 3, 16000, [1.0, 1.0])
+
+
+@pytest.mark.parametrize('block_size', [1000, 4096])
+@pytest.mark.parametrize('rate', [0.5, 2.0])
+def test_time_stretch_stream(channels, block_size, rate):
+    sr = 16000
+    if channels is not None:
+        y = np.random.randn(2 * sr, channels).astype(np.float32)
+    else:
+        y = np.random.randn(2 * sr).astype(np.float32)
+
+    # Irregular input blocks
+    blocks = (y[i:i + 3000] for i in range(0, len(y), 3000))
+
+    out = list(pyrubberband.time_stretch_stream(blocks, sr, rate,
+                                                block_size=block_size))
+
+    assert all(len(block) == block_size for block in out[:-1])
+    assert all(block.ndim == y.ndim for block in out)
+    assert all(block.dtype == y.dtype for block in out)
+
+    # Streaming matches the whole-signal result
+    y_s = np.concatenate(out)
+    assert np.allclose(y_s, pyrubberband.time_stretch(y, sr, rate))
+
+
+def test_pitch_shift_stream_file(tmp_path):
+    sr = 16000
+    y = np.random.randn(sr, 2)
+    in_path = tmp_path / 'in.wav'
+    sf.write(str(in_path), y, sr)
+
+    out = list(pyrubberband.pitch_shift_stream(in_path, None, 2,
+                                               block_size=1024))
+
+    assert np.concatenate(out).shape == y.shape
+
+
+@pytest.mark.parametrize('source,sr', [([], 16000),
+                                       ([np.zeros(100)], None)])
+def test_stream_bad_input(source, sr):
+    with pytest.raises(ValueError):
+        list(pyrubberband.time_stretch_stream(source, sr, 2.0))
+
+
+def test_stream_bad_rate():
+    # Errors are raised on the call, not when the output is consumed
+    with pytest.raises(ValueError):
+        pyrubberband.time_stretch_stream([np.zeros(100)], 16000, 0)
+
+
+def test_stretch_file(tmp_path):
+    sr = 16000
+    y = np.random.randn(sr)
+    in_path = tmp_path / 'in.wav'
+    out_path = tmp_path / 'out.wav'
+    sf.write(str(in_path), y, sr)
+
+    pyrubberband.time_stretch_file(in_path, out_path, 2.0)
+    assert sf.info(str(out_path)).frames == sr // 2
+
+    pyrubberband.pitch_shift_file(in_path, out_path, -1)
+    assert sf.info(str(out_path)).frames == sr
+
+    with pytest.raises(ValueError):
+        pyrubberband.time_stretch_file(in_path, out_path, -1)
+
+
+@pytest.mark.parametrize('rate', [None, 0.5, 1.0, 2.0])
+@pytest.mark.parametrize('n_steps', [None, 0, -2, 1.5])
+def test_transform(channels, rate, n_steps):
+    sr = 16000
+    if channels is not None:
+        y = np.random.randn(sr, channels)
+    else:
+        y = np.random.randn(sr)
+
+    y_s = pyrubberband.transform(y, sr, rate=rate, n_steps=n_steps)
+
+    assert y_s.ndim == y.ndim
+    assert np.allclose(y_s.shape[0] * (rate or 1.0), y.shape[0])
+    if y.ndim > 1:
+        assert y_s.shape[1] == y.shape[1]
+
+
+def test_transform_timemap(sr, num_samples, time_map):
+    y = np.random.randn(num_samples)
+
+    y_s = pyrubberband.transform(y, sr, n_steps=2, time_map=time_map)
+
+    assert np.isclose(len(y_s), time_map[-1][1], rtol=1e-3)
+
+
+def test_transform_single_pass(monkeypatch):
+    calls = []
+    rubberband = pyrubberband.pyrb.__rubberband
+
+    def __count(*args, **kwargs):
+        calls.append(kwargs)
+        return rubberband(*args, **kwargs)
+
+    monkeypatch.setattr(pyrubberband.pyrb, '__rubberband', __count)
+
+    pyrubberband.transform(np.random.randn(16000), 16000, rate=2.0,
+                           n_steps=3)
+
+    assert len(calls) == 1
+    assert calls[0]['--tempo'] == 2.0
+    assert calls[0]['--pitch'] == 3
+
+
+@pytest.mark.parametrize('rate,time_map', [(0, None), (-1, None),
+                                           (2.0, [(0, 0), (100, 50)]),
+                                           (None, [(0, 0), (50, 50)])])
+def test_transform_bad_params(rate, time_map):
+    with pytest.raises(ValueError):
+        pyrubberband.transform(np.zeros(100), 16000, rate=rate,
+                               time_map=time_map)
+
+
+def test_transform_rbargs_unchanged():
+    rbargs = {'-c': '5'}
+    pyrubberband.transform(np.random.randn(1000), 16000, rate=2.0,
+                           rbargs=rbargs)
+    assert rbargs == {'-c': '5'}
+
+
+def test_pitch_shift_many(channels):
+    sr = 16000
+    if channels is not None:
+        y = np.random.randn(sr, channels)
+    else:
+        y = np.random.randn(sr)
+
+    n_steps = [-2, 0, 1, 2.5]
+    y_s = pyrubberband.pitch_shift_many(y, sr, n_steps, n_jobs=2)
+
+    assert y_s.shape == (len(n_steps),) + y.shape
+    for step, y_out in zip(n_steps, y_s):
+        assert np.allclose(y_out, pyrubberband.pitch_shift(y, sr, step))
+
+
+def test_time_stretch_many(channels):
+    sr = 16000
+    if channels is not None:
+        y = np.random.randn(sr, channels)
+    else:
+        y = np.random.randn(sr)
+
+    rates = [0.5, 1.0, 2.0]
+    y_s = pyrubberband.time_stretch_many(y, sr, rates)
+
+    assert len(y_s) == len(rates)
+    for rate, y_out in zip(rates, y_s):
+        assert y_out.ndim == y.ndim
+        assert np.allclose(y_out.shape[0] * rate, y.shape[0])
+
+    with pytest.raises(ValueError):
+        pyrubberband.time_stretch_many(y, sr, [2.0, 0])
+
+
+@pytest.mark.parametrize('function', [pyrubberband.time_stretch_many,
+                                      pyrubberband.pitch_shift_many])
+def test_many_empty(function):
+    with pytest.raises(ValueError, match='at least one'):
+        function(np.random.randn(1000), 16000, [])
+
+
+def test_many_encodes_once(monkeypatch):
+    writes = []
+    write = pyrubberband.pyrb.__write_audio
+
+    def __write(*args, **kwargs):
+        writes.append(args[0])
+        return write(*args, **kwargs)
+
+    monkeypatch.setattr(pyrubberband.pyrb, '__write_audio', __write)
+
+    pyrubberband.pitch_shift_many(np.random.randn(16000), 16000, [1, 2, 3])
+
+    assert len(writes) == 1
+
+
+@pytest.mark.parametrize(
+    "time_map,match",
+    [
+        (np.array([(0, 0), (8000, 4000), (12000, -1), (16000, 8000)]),
+         r'time_map\[2\]'),
+        (np.array([(0, 0), (8000, 6000), (4000, 7000), (16000, 12000)]),
+         r'time_map\[1\]'),
+        (np.array([(0, 0), (8000, 6000), (12000, 5000), (16000, 12000)]),
+         r'time_map\[1\]'),
+        (np.array([0, 16000]), r'shape'),
+        (np.zeros((0, 2)), r'shape'),
+    ]
+)
+def test_timemap_error_index(time_map, match):
+    y = np.zeros(16000)
+
+    with pytest.raises(ValueError, match=match):
+        pyrubberband.timemap_stretch(y, 16000, time_map)
+
+
+@pytest.mark.parametrize('dtype', [np.int64, np.int32, np.float64])
+def test_timemap_ndarray(num_samples, sr, time_map, dtype):
+    y = np.cos(2 * np.pi * 440 * np.arange(num_samples) / sr)
+
+    y_s = pyrubberband.timemap_stretch(y, sr,
+                                       np.asarray(time_map, dtype=dtype))
+
+    assert np.isclose(len(y_s), time_map[-1][1], rtol=1e-3)
+
+
+@pytest.mark.parametrize('time_map,expected',
+                         [([(0, 0), (100, 50)], '0 0\n100 50\n'),
+                          (np.array([[0, 0], [100, 50]]), '0 0\n100 50\n'),
+                          (np.array([[0., 0.], [100., 50.5]]),
+                           '0 0\n100 50.5\n')])
+def test_write_timemap(time_map, expected):
+    with pyrubberband.pyrb.__time_map_file(time_map) as path:
+        with open(path) as fdesc:
+            assert fdesc.read() == expected
+
+
+@pytest.fixture
+def wire_format(request):
+    pyrubberband.set_wire_format(request.param)
+    yield request.param
+    pyrubberband.set_wire_format('FLOAT')
+
+
+@pytest.mark.parametrize('wire_format,dtype,atol,clips',
+                         [('FLOAT', np.float32, 1e-7, False),
+                          ('DOUBLE', np.float64, 1e-12, False),
+                          ('PCM_16', np.float64, 2**-15, True)],
+                         indirect=['wire_format'])
+def test_wire_format(wire_format, dtype, atol, clips, monkeypatch):
+    sr = 16000
+    y = (0.5 * np.random.randn(sr, 2)).astype(dtype)
+    y[0] = 1.5
+
+    # An identity transformation isolates the encoding error
+    monkeypatch.setattr(pyrubberband.pyrb, '__rubberband_args',
+                        lambda kwargs: [])
+    y_out = pyrubberband.pyrb.__rubberband(y, sr, **{'--pitch': 1})
+
+    if clips:
+        y = np.clip(y, -1, 1)
+
+    assert y_out.dtype == dtype
+    assert np.allclose(y_out, y, rtol=0, atol=atol)
+
+
+def test_bad_wire_format():
+    with pytest.raises(ValueError):
+        pyrubberband.set_wire_format('MP3')
+
+
+@pytest.mark.parametrize('transport', ['tempfile', 'pipe'])
+def test_out(channels, transport):
+    sr = 16000
+    shape = (sr,) if channels is None else (sr, channels)
+    y = np.random.randn(*shape).astype(np.float32)
+    out = np.empty(shape, dtype=np.float64)
+
+    y_s = pyrubberband.pyrb.__rubberband(y, sr, transport=transport,
+                                         out=out, **{'--pitch': 1})
+
+    assert y_s is out
+    assert np.allclose(out, pyrubberband.pitch_shift(y, sr, 1), atol=1e-6)
+
+    # The buffer can be reused, including for identity transforms
+    assert pyrubberband.pitch_shift(y, sr, 0, out=out) is out
+    assert np.array_equal(out, y)
+
+
+@pytest.mark.parametrize('out', [np.empty(8000), np.empty((16000, 2)),
+                                 np.empty(16000, dtype=np.int16),
+                                 np.empty(32000)[::2]])
+def test_bad_out(out):
+    with pytest.raises(ValueError):
+        pyrubberband.pitch_shift(np.random.randn(16000), 16000, 1, out=out)
+
+
+def test_layout():
+    sr = 16000
+    y = np.random.randn(3 * sr, 2)
+
+    y_c = pyrubberband.pitch_shift(y, sr, 1)
+    y_f = pyrubberband.pitch_shift(np.asfortranarray(y), sr, 1)
+    y_t = pyrubberband.pitch_shift(np.ascontiguousarray(y.T).T, sr, 1)
+
+    assert np.array_equal(y_c, y_f)
+    assert np.array_equal(y_c, y_t)
+
+
+@pytest.mark.parametrize('function,param', [(pyrubberband.time_stretch, 1.5),
+                                            (pyrubberband.pitch_shift, 2)])
+@pytest.mark.parametrize('channel_groups,groups', [
+    (1, [[0], [1], [2], [3], [4], [5]]),
+    (4, [[0, 1, 2, 3], [4, 5]]),
+    ([[0, 5], [1, 2, 3], [4]], [[0, 5], [1, 2, 3], [4]])])
+def test_channel_groups(function, param, channel_groups, groups):
+    sr = 16000
+    y = np.random.randn(sr, 6)
+
+    y_g = function(y, sr, param, channel_groups=channel_groups)
+
+    assert y_g.shape[1] == y.shape[1]
+    for group in groups:
+        y_ref = function(np.ascontiguousarray(y[:, group]), sr, param)
+        assert len(y_g) <= len(y_ref)
+        assert np.array_equal(y_g[:, group], y_ref[:len(y_g)])
+
+    # Mono input has nothing to split
+    assert np.array_equal(function(y[:, 0], sr, param, channel_groups=1),
+                          function(y[:, 0], sr, param))
+
+
+def test_channel_groups_linked():
+    sr = 16000
+    y = np.random.randn(sr, 3)
+    link = pyrubberband.pyrb.__link_flag()
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        pyrubberband.pitch_shift(y, sr, 1, channel_groups=[[0, 2], [1]],
+                                 linked=True)
+        pyrubberband.pitch_shift(y, sr, 1, linked=True)
+
+    commands = sorted((e.command for e in events if e.phase == 'process'),
+                      key=len)
+    assert [link in command for command in commands] == [False, True, True]
+
+
+def test_channel_groups_out():
+    sr = 16000
+    y = np.random.randn(sr, 4)
+    y_g = pyrubberband.pitch_shift(y, sr, 1, channel_groups=2)
+
+    out = np.empty_like(y_g)
+    assert pyrubberband.pitch_shift(y, sr, 1, channel_groups=2,
+                                    out=out) is out
+    assert np.array_equal(out, y_g)
+
+    with pytest.raises(ValueError):
+        pyrubberband.pitch_shift(y, sr, 1, channel_groups=2,
+                                 out=np.empty((len(y_g) + 1, 4)))
+
+
+@pytest.mark.parametrize('channel_groups', [0, 1.5, [[0, 1]], [],
+                                            [[0, 1], [1, 2, 3]]])
+def test_bad_channel_groups(channel_groups):
+    with pytest.raises(ValueError):
+        pyrubberband.time_stretch(np.random.randn(1000, 4), 16000, 2.0,
+                                  channel_groups=channel_groups)
+
+
+@pytest.mark.parametrize('rate', [0.6, 1.5])
+@pytest.mark.parametrize('segments', [1.0, [5000, 20000, 21000, 60000]])
+@pytest.mark.parametrize('overlap', [0, 0.25])
+@pytest.mark.parametrize('channels', [None, 2])
+def test_time_stretch_parallel(channels, rate, segments, overlap):
+    sr = 16000
+    y = sum(synth(sr, 6 * sr, freq) / k
+            for k, freq in enumerate([220, 330, 440, 1000], 1))
+    if channels is not None:
+        y = np.repeat(y[:, np.newaxis], channels, axis=1)
+
+    y_ref = pyrubberband.time_stretch(y, sr, rate)
+    y_par = pyrubberband.time_stretch_parallel(y, sr, rate, segments=segments,
+                                               overlap=overlap, n_jobs=4)
+
+    assert y_par.shape == y_ref.shape
+    assert len(y_par) == round(len(y) / rate)
+
+    # Same spectral content
+    s_ref = np.abs(np.fft.rfft(y_ref, axis=0)).ravel()
+    s_par = np.abs(np.fft.rfft(y_par, axis=0)).ravel()
+    assert np.corrcoef(s_ref, s_par)[0, 1] > 0.95
+
+    if overlap:
+        # No dropouts at the boundaries, away from the edges
+        frames = slice(4, len(y_ref) // 1024 - 4)
+        rms_ref = np.sqrt((y_ref[:len(y_ref) // 1024 * 1024]**2).reshape(
+            (-1, 1024) + y.shape[1:]).mean(axis=1))[frames]
+        rms_par = np.sqrt((y_par[:len(y_par) // 1024 * 1024]**2).reshape(
+            (-1, 1024) + y.shape[1:]).mean(axis=1))[frames]
+        assert np.allclose(rms_par, rms_ref, rtol=0.2)
+
+
+def test_time_stretch_parallel_spans(monkeypatch):
+    sr = 16000
+    y = np.random.randn(3 * sr)
+    rate = 0.7
+    rubberband = pyrubberband.pyrb.__rubberband
+    durations = []
+
+    def __rubberband(y, sr, **kwargs):
+        durations.append(kwargs['--duration'])
+        assert '--tempo' not in kwargs
+        return rubberband(y, sr, **kwargs)
+
+    monkeypatch.setattr(pyrubberband.pyrb, '__rubberband', __rubberband)
+    pyrubberband.time_stretch_parallel(y, sr, rate, segments=[10001, 30001],
+                                       overlap=0.1)
+
+    # Each segment is stretched to exactly its span of the output
+    starts = np.array([0, 10001 - 1600, 30001 - 1600])
+    ends = np.array([10001 + 1600, 30001 + 1600, 3 * sr])
+    spans = np.round(ends / rate) - np.round(starts / rate)
+    assert np.allclose(np.array(sorted(durations)) * sr, sorted(spans))
+
+
+def test_time_stretch_parallel_short():
+    # A single segment is just a time stretch
+    sr = 16000
+    y = np.random.randn(sr)
+
+    assert np.array_equal(
+        pyrubberband.time_stretch_parallel(y, sr, 1.5, segments=2.0),
+        pyrubberband.time_stretch(y, sr, 1.5))
+    assert pyrubberband.time_stretch_parallel(y, sr, 1.0) is y
+
+
+@pytest.mark.parametrize('kwargs', [dict(rate=0), dict(overlap=-1),
+                                    dict(segments=0), dict(segments=[0]),
+                                    dict(segments=[16000]),
+                                    dict(segments=[8000, 4000])])
+def test_time_stretch_parallel_bad_params(kwargs):
+    params = dict(rate=2.0)
+    params.update(kwargs)
+    with pytest.raises(ValueError):
+        pyrubberband.time_stretch_parallel(np.random.randn(16000), 16000,
+                                           **params)
+
+
+@pytest.fixture
+def wav_file(tmp_path):
+    def __write(subtype, channels=2, sr=16000):
+        y = 0.1 * np.random.randn(sr, channels).squeeze()
+        path = tmp_path / 'input_{}.wav'.format(subtype)
+        sf.write(path, y, sr, subtype=subtype)
+        return path
+    return __write
+
+
+@pytest.mark.parametrize('subtype', ['FLOAT', 'PCM_16', 'PCM_24'])
+@pytest.mark.parametrize('kind', [str, os.fsencode, lambda path: path,
+                                  sf.SoundFile])
+@pytest.mark.parametrize('channels', [1, 2])
+def test_file_input(wav_file, subtype, kind, channels):
+    sr = 16000
+    path = wav_file(subtype, channels)
+    y, _ = sf.read(path, dtype='float32')
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        y_s = pyrubberband.pitch_shift(kind(path), sr, 2)
+
+    # Read by rubberband directly, and mapped rather than loaded
+    assert 'write' not in [e.phase for e in events]
+    assert isinstance(y_s, np.memmap)
+    assert y_s.shape == y.shape
+    assert np.allclose(y_s, pyrubberband.pitch_shift(y, sr, 2), atol=1e-4)
+
+    filename = y_s.filename
+    del y_s
+    gc.collect()
+    assert not os.path.exists(filename)
+
+
+def test_memmap_input(wav_file):
+    sr = 16000
+    y_s = pyrubberband.time_stretch(str(wav_file('FLOAT')), sr, 2.0)
+
+    # Results can be passed on without encoding them again
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        y_p = pyrubberband.pitch_shift(y_s, sr, 1)
+    assert 'write' not in [e.phase for e in events]
+    assert np.allclose(y_p, pyrubberband.pitch_shift(np.array(y_s), sr, 1))
+
+    # Views of the samples are just arrays
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        pyrubberband.pitch_shift(y_s[100:], sr, 1)
+    assert 'write' in [e.phase for e in events]
+
+
+def test_file_input_identity(wav_file):
+    path = wav_file('FLOAT')
+    y, sr = sf.read(path)
+
+    y_s = pyrubberband.time_stretch(path, sr, 1.0)
+    assert isinstance(y_s, np.memmap)
+    assert not y_s.flags.writeable
+    assert np.array_equal(y_s, y)
+
+
+def test_file_input_out(wav_file):
+    path = wav_file('PCM_16')
+    y, sr = sf.read(path)
+
+    out = np.empty((len(y) // 2, 2))
+    assert pyrubberband.time_stretch(path, sr, 2.0, out=out) is out
+    assert np.allclose(out, pyrubberband.time_stretch(y, sr, 2.0), atol=1e-4)
+
+
+def test_file_input_bad_sr(wav_file):
+    with pytest.raises(ValueError):
+        pyrubberband.time_stretch(wav_file('FLOAT'), 22050, 2.0)
+
+
+@pytest.mark.parametrize('function,param', [
+    (pyrubberband.time_stretch, 1.5), (pyrubberband.pitch_shift, 2),
+    (pyrubberband.timemap_stretch, [(0, 0), (8000, 4000), (16000, 12000)])])
+@pytest.mark.parametrize('shape', [(5, 16000), (3, 16000, 2)])
+def test_batch_axis(function, param, shape):
+    sr = 16000
+    y = np.random.randn(*shape)
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        y_b = function(y, sr, param, batch=True)
+
+    # One process for the whole batch
+    assert sum(e.phase == 'process' for e in events) == 1
+
+    for y_i, y_bi in zip(y, y_b):
+        y_ref = function(y_i, sr, param)
+        assert y_bi.shape == y_ref.shape
+        assert np.allclose(y_bi, y_ref, atol=1e-6)
+
+
+def test_batch_axis_split(monkeypatch):
+    monkeypatch.setattr(pyrubberband.pyrb, '__BATCH_CHANNELS', 5)
+    sr = 16000
+    y = np.random.randn(4, sr, 2)
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        y_b = pyrubberband.transform(y, sr, rate=2.0, n_steps=1, batch=True)
+
+    # Two signals per process, with their channels kept together
+    commands = [e.command for e in events if e.phase == 'process']
+    assert len(commands) == 2
+    assert y_b.shape == (4, sr // 2, 2)
+    for y_i, y_bi in zip(y, y_b):
+        assert np.allclose(y_bi, pyrubberband.transform(y_i, sr, rate=2.0,
+                                                        n_steps=1))
+
+
+@pytest.mark.parametrize('y,kwargs', [
+    (np.random.randn(1000), dict()), (np.empty((0, 1000)), dict()),
+    (np.random.randn(2, 1000), dict(channel_groups=1)),
+    (np.random.randn(2, 1000, 2), dict(linked=True))])
+def test_batch_axis_bad(y, kwargs):
+    with pytest.raises(ValueError):
+        pyrubberband.pitch_shift(y, 16000, 1, batch=True, **kwargs)
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(rate=1.5), dict(rate=0.7), dict(rate=1.0), dict(rate=3.0),
+    dict(time_map=[(0, 0), (4000, 6000), (16001, 20000)]),
+    dict(target_length=12345)])
+@pytest.mark.parametrize('n', [16001, 22050])
+def test_predict_length(kwargs, n):
+    sr = 16000
+    y = np.random.randn(n)
+    if 'time_map' in kwargs:
+        if n != 16001:
+            pytest.skip('time map is for 16001 samples')
+        y_s = pyrubberband.timemap_stretch(y, sr, kwargs['time_map'])
+    else:
+        y_s = pyrubberband.time_stretch(y, sr, **kwargs)
+
+    assert pyrubberband.predict_length(n, sr, **kwargs) == len(y_s)
+
+
+@pytest.mark.parametrize('kwargs', [dict(rate=0), dict(target_length=0),
+                                    dict(rate=2.0, target_length=100),
+                                    dict(target_length=100.0),
+                                    dict(time_map=[(0, 0), (999, 10)])])
+def test_predict_length_bad(kwargs):
+    with pytest.raises(ValueError):
+        pyrubberband.predict_length(1000, 16000, **kwargs)
+
+
+@pytest.mark.parametrize('target_length', [1, 9999, 16000, 23456])
+def test_target_length(channels, target_length):
+    sr = 16000
+    shape = (sr,) if channels is None else (sr, channels)
+    y = np.random.randn(*shape)
+    time_map = [(0, 0), (sr // 2, sr // 4), (sr, sr // 2)]
+
+    for y_s in [pyrubberband.time_stretch(y, sr,
+                                          target_length=target_length),
+                pyrubberband.timemap_stretch(y, sr, time_map,
+                                             target_length=target_length),
+                pyrubberband.transform(y, sr, n_steps=1,
+                                       target_length=target_length),
+                pyrubberband.transform(y, sr, time_map=time_map,
+                                       target_length=target_length)]:
+        assert y_s.shape == (target_length,) + y.shape[1:]
+
+    out = np.empty((target_length,) + y.shape[1:])
+    assert pyrubberband.time_stretch(y, sr, target_length=target_length,
+                                     out=out) is out
+
+
+def test_target_length_batch():
+    sr = 16000
+    y = np.random.randn(3, sr, 2)
+
+    y_b = pyrubberband.time_stretch(y, sr, target_length=12345, batch=True)
+    assert y_b.shape == (3, 12345, 2)
+    assert np.allclose(y_b[1], pyrubberband.time_stretch(
+        y[1], sr, target_length=12345))
+
+
+def test_target_length_fit(monkeypatch):
+    # rubberband may miss the requested duration by a few samples
+    sr = 16000
+    y = np.random.randn(sr)
+    rubberband = pyrubberband.pyrb.__rubberband
+
+    for error in [-3, 3]:
+        def missed(*args, **kwargs):
+            y_out = rubberband(*args, **kwargs)
+            if error < 0:
+                return y_out[:error]
+            return np.pad(y_out, (0, error), mode='constant')
+
+        monkeypatch.setattr(pyrubberband.pyrb, '__rubberband', missed)
+        y_s = pyrubberband.time_stretch(y, sr, target_length=8000)
+        assert len(y_s) == 8000
+
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(rate=2.0, target_length=100),
+                                    dict(target_length=0),
+                                    dict(target_length=1.5),
+                                    dict(target_length=True)])
+def test_target_length_bad(kwargs):
+    with pytest.raises(ValueError):
+        pyrubberband.time_stretch(np.random.randn(1000), 16000, **kwargs)
+
+    with pytest.raises(ValueError):
+        pyrubberband.timemap_stretch(np.random.randn(1000), 16000,
+                                     [(0, 0), (1000, 0)], target_length=100)
+
+
+@pytest.fixture
+def fake_cli(tmp_path, monkeypatch):
+    '''Install a shell script in place of rubberband'''
+    def __install(body):
+        path = tmp_path / 'rubberband'
+        path.write_text('#!/bin/sh\n'
+                        'case "$1" in --version|-h) echo 3.3.0; exit;; esac\n'
+                        + body + '\n')
+        path.chmod(0o755)
+        monkeypatch.setattr(pyrubberband.pyrb, '__RUBBERBAND_UTIL', str(path))
+    return __install
+
+
+@pytest.fixture
+def limits():
+    yield pyrubberband.set_limits
+    pyrubberband.set_limits()
+
+
+@pytest.mark.parametrize('transport', ['tempfile', 'pipe'])
+def test_error_stderr(fake_cli, transport):
+    fake_cli('echo "cannot stretch this" >&2; exit 3')
+
+    with pytest.raises(pyrubberband.RubberbandError) as exc:
+        pyrubberband.pyrb.__rubberband(np.random.randn(1000), 16000,
+                                       transport=transport, **{'--pitch': 1})
+
+    assert isinstance(exc.value, subprocess.CalledProcessError)
+    assert exc.value.returncode == 3
+    assert exc.value.stderr == b'cannot stretch this\n'
+    assert 'cannot stretch this' in str(exc.value)
+
+
+@pytest.mark.parametrize('transport', ['tempfile', 'pipe'])
+def test_timeout(fake_cli, limits, transport):
+    fake_cli('echo "still going" >&2; sleep 10')
+    pyrubberband.set_transport(transport)
+
+    try:
+        with pytest.raises(pyrubberband.RubberbandTimeout) as exc:
+            pyrubberband.pitch_shift(np.random.randn(1000), 16000, 1,
+                                     timeout=0.5)
+        assert exc.value.timeout == 0.5
+        assert exc.value.stderr == b'still going\n'
+
+        # The global limit applies when there is no per-call limit
+        limits(timeout=0.2)
+        with pytest.raises(subprocess.TimeoutExpired):
+            pyrubberband.time_stretch(np.random.randn(1000), 16000, 2.0)
+    finally:
+        pyrubberband.set_transport('tempfile')
+
+
+def test_batch_timeout(fake_cli):
+    fake_cli('sleep 10')
+
+    y_s = pyrubberband.batch_time_stretch([np.random.randn(1000)] * 2,
+                                          16000, 2.0, timeout=0.2)
+
+    assert all(isinstance(exc, pyrubberband.RubberbandTimeout)
+               for exc in y_s)
+
+
+def test_timeout_no_waitid(fake_cli, monkeypatch):
+    # As on macOS before Python 3.13
+    monkeypatch.delattr(os, 'waitid', raising=False)
+
+    y = np.random.randn(1000)
+    assert len(pyrubberband.time_stretch(y, 16000, 2.0, timeout=30)) == 500
+
+    fake_cli('sleep 10')
+    with pytest.raises(pyrubberband.RubberbandTimeout):
+        pyrubberband.time_stretch(y, 16000, 2.0, timeout=0.2)
+
+
+def test_limits(fake_cli, limits):
+    # `nice` reports the niceness it runs with
+    fake_cli('nice >&2; exit 1')
+    base = os.nice(0)
+
+    limits(nice=5)
+    with pytest.raises(pyrubberband.RubberbandError) as exc:
+        pyrubberband.pitch_shift(np.random.randn(1000), 16000, 1)
+    assert int(exc.value.stderr) == min(base + 5, 19)
+
+    fake_cli('while :; do :; done')
+    limits(cpu_time=1)
+    with pytest.raises(pyrubberband.RubberbandError) as exc:
+        pyrubberband.pitch_shift(np.random.randn(1000), 16000, 1)
+    assert exc.value.returncode < 0
+
+
+@pytest.mark.parametrize('kwargs', [dict(timeout=0), dict(cpu_time=-1),
+                                    dict(memory=0)])
+def test_bad_limits(kwargs):
+    with pytest.raises(ValueError):
+        pyrubberband.set_limits(**kwargs)
+
+
+def test_backend_info(monkeypatch):
+    info = pyrubberband.get_backend_info(refresh=True)
+
+    assert os.path.isabs(info.path)
+    assert info.version >= (1,)
+    assert info.version_string
+    assert '--formant' in info.flags
+    assert 'R2' in info.engines
+
+    # Probed once, then cached
+    monkeypatch.setattr(pyrubberband.pyrb.subprocess, 'run', None)
+    assert pyrubberband.get_backend_info() is info
+
+
+def test_backend_info_parse(fake_cli):
+    fake_cli('exit 1')
+
+    info = pyrubberband.get_backend_info()
+    assert info.version == (3, 3, 0)
+    assert info.pipes
+    assert info.engines == ('R2', 'R3')
+
+    # Pipe support is taken from the probe, not found by trial
+    assert pyrubberband.pyrb.__pipes_supported()
+
+
+def test_set_executable(tmp_path):
+    try:
+        pyrubberband.set_executable(tmp_path / 'missing')
+        with pytest.raises(RuntimeError):
+            pyrubberband.get_backend_info()
+        with pytest.raises(RuntimeError):
+            pyrubberband.pitch_shift(np.random.randn(1000), 16000, 1)
+    finally:
+        pyrubberband.set_executable('rubberband')
+
+
+def test_set_executable_reprobe(tmp_path):
+    script = tmp_path / 'rubberband'
+    try:
+        for version in ['2.0.0', '3.3.0']:
+            script.write_text('#!/bin/sh\necho {}\n'.format(version))
+            script.chmod(0o755)
+
+            # Selecting the same path again discards what was cached
+            pyrubberband.set_executable(script)
+            assert pyrubberband.get_backend_info().version_string == version
+    finally:
+        pyrubberband.set_executable('rubberband')
+
+
+@pytest.fixture
+def tempdir(tmp_path):
+    pyrubberband.set_tempdir(tmp_path)
+    yield tmp_path
+    pyrubberband.set_tempdir(None)
+
+
+def test_tempdir(tempdir):
+    sr = 16000
+    y = np.random.randn(sr)
+    n = len(y)
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        pyrubberband.timemap_stretch(y, sr, [(0, 0), (n, n // 2)])
+    files = sorted(tempdir.iterdir())
+
+    # The scratch files are reused, and emptied between calls
+    pyrubberband.timemap_stretch(y, sr, [(0, 0), (n, 2 * n)])
+    assert sorted(tempdir.iterdir()) == files
+    assert len(files) == 3
+    prefix = 'pyrb-{}-{}-'.format(pyrubberband.pyrb.__host(), os.getpid())
+    assert all(path.name.startswith(prefix) for path in files)
+    assert all(path.stat().st_size == 0 for path in files)
+
+    tempdirs = {e.phase: e.tempdir for e in events}
+    assert tempdirs['write'] == tempdirs['read'] == str(tempdir)
+    assert tempdirs['process'] is None
+
+
+def test_tempdir_threads(tempdir):
+    sr = 16000
+    job = threading.Thread(target=pyrubberband.pitch_shift,
+                           args=(np.random.randn(sr), sr, 1))
+    job.start()
+    job.join()
+    del job
+    gc.collect()
+
+    # Removed with their thread
+    assert not list(tempdir.iterdir())
+
+
+def test_tempdir_sweep(tempdir):
+    proc = subprocess.Popen(['true'])
+    proc.wait()
+
+    host = pyrubberband.pyrb.__host()
+    leaked = tempdir / 'pyrb-{}-{}-abc-in.wav'.format(host, proc.pid)
+    ours = tempdir / 'pyrb-{}-{}-def-in.wav'.format(host, os.getpid())
+
+    # The same pid may be alive on another host, or in another container
+    foreign = tempdir / 'pyrb-{:08x}-{}-ghi-in.wav'.format(
+        int(host, 16) ^ 1, proc.pid)
+    other = tempdir / 'other.wav'
+    for path in [leaked, ours, foreign, other]:
+        path.touch()
+
+    pyrubberband.pitch_shift(np.random.randn(16000), 16000, 1)
+
+    assert not leaked.exists()
+    assert ours.exists() and foreign.exists() and other.exists()
+
+
+def test_tempdir_default(tmp_path):
+    pyrubberband.set_tempdir(None)
+    if os.access('/dev/shm', os.W_OK):
+        assert pyrubberband.pyrb.__tempdir() == '/dev/shm'
+
+    with pytest.raises(ValueError):
+        pyrubberband.set_tempdir(tmp_path / 'missing')
+
+
+@pytest.fixture
+def memory_tempdir(tmp_path, monkeypatch):
+    '''Stand-ins for /dev/shm and the default temporary directory'''
+    memory, disk = tmp_path / 'memory', tmp_path / 'disk'
+    memory.mkdir()
+    disk.mkdir()
+    monkeypatch.setattr(pyrubberband.pyrb, '__MEMORY_TEMPDIR', str(memory))
+    monkeypatch.setattr(tempfile, 'tempdir', str(disk))
+    pyrubberband.set_tempdir(None)
+    return memory, disk
+
+
+def scratch_dirs(events):
+    return {e.phase: e.tempdir for e in events if e.tempdir is not None}
+
+
+def test_tempdir_memory(memory_tempdir, monkeypatch):
+    memory, disk = memory_tempdir
+    sr = 16000
+    y = np.random.randn(sr)
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        pyrubberband.time_stretch(y, sr, 0.5)
+    assert scratch_dirs(events) == {'write': str(memory), 'read': str(memory)}
+
+    # Too large for the memory
+    monkeypatch.setattr(pyrubberband.pyrb, '__free', lambda directory: 0)
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        pyrubberband.time_stretch(y, sr, 0.5)
+    assert scratch_dirs(events) == {'write': str(disk), 'read': str(disk)}
+
+
+def test_tempdir_memory_full(memory_tempdir, monkeypatch):
+    memory, disk = memory_tempdir
+    sr = 16000
+    y = np.random.randn(sr)
+
+    # The memory fills up while writing
+    write = pyrubberband.pyrb.__write_audio
+
+    def __write_audio(file, y, sr):
+        if str(file).startswith(str(memory)):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), file)
+        write(file, y, sr)
+
+    monkeypatch.setattr(pyrubberband.pyrb, '__write_audio', __write_audio)
+
+    events = []
+    with pyrubberband.instrument.hooks(events.append):
+        y_out = pyrubberband.time_stretch(y, sr, 0.5)
+
+    assert len(y_out) == 2 * sr
+    assert scratch_dirs(events)['read'] == str(disk)
+
+
+def test_tempdir_memory_full_many(memory_tempdir, monkeypatch):
+    memory, disk = memory_tempdir
+    sr = 16000
+    y = np.random.randn(sr)
+
+    # The memory fills up after the first result
+    read = pyrubberband.pyrb.__read_audio
+    reads = []
+
+    def __read_audio(file, dtype, out=None):
+        reads.append(file)
+        if str(file).startswith(str(memory)) and len(reads) > 1:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), file)
+        return read(file, dtype, out)
+
+    monkeypatch.setattr(pyrubberband.pyrb, '__read_audio', __read_audio)
+
+    y_s = pyrubberband.time_stretch_many(y, sr, [0.5, 1.0, 2.0], n_jobs=1)
+
+    assert [len(y_out) for y_out in y_s] == [2 * sr, sr, sr // 2]
+    assert str(reads[0]).startswith(str(memory))
+    assert str(reads[-1]).startswith(str(disk))
+
+
+def test_tempdir_memmap(memory_tempdir, wav_file):
+    memory, disk = memory_tempdir
+    path = wav_file('FLOAT', channels=1)
+
+    # Results that may be larger than memory stay on disk
+    y_out = pyrubberband.time_stretch(path, 16000, 0.5)
+    assert isinstance(y_out, np.memmap)
+    assert os.path.dirname(y_out.filename) == str(disk)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import pyrubberband
+from pyrubberband import _librubberband
+
+
+requires_library = pytest.mark.skipif(not _librubberband.available(),
+                                      reason='librubberband is not installed')
+
+
+def blocks(y, block_size):
+    for start in range(0, len(y), block_size):
+        yield y[start:start + block_size]
+
+
+def spectrum(y):
+    s = np.abs(np.fft.rfft(y, axis=0))
+    return s / s.max(axis=0)
+
+
+@requires_library
+@pytest.mark.parametrize('rate', [0.5, 1.0, 1.5])
+@pytest.mark.parametrize('channels', [1, 2])
+def test_stream(rate, channels):
+    sr = 22050
+    y = np.sin(2 * np.pi * 440 * np.arange(2 * sr) / sr).astype(np.float32)
+    if channels > 1:
+        y = np.tile(y[:, np.newaxis], (1, channels))
+
+    with pyrubberband.RubberbandStream(sr, channels=channels, rate=rate,
+                                       block_size=441) as stream:
+        assert stream.latency >= 0
+        out = [stream.process(block) for block in blocks(y, 441)]
+        out.append(stream.flush())
+
+    y_s = np.concatenate(out)
+    assert y_s.dtype == np.float32
+    assert y_s.shape[1:] == y.shape[1:]
+    assert np.isclose(len(y_s), len(y) / rate, rtol=0.05)
+
+    # The pitch is unchanged
+    tail = y_s[len(y_s) // 4:]
+    peak = np.argmax(spectrum(tail), axis=0) * sr / len(tail)
+    assert np.allclose(peak, 440, atol=5)
+
+
+@requires_library
+def test_stream_change():
+    sr = 22050
+    y = np.random.randn(4 * sr).astype(np.float32)
+
+    stream = pyrubberband.RubberbandStream(sr, block_size=256)
+    produced = [len(stream.process(block))
+                for block in blocks(y[:2 * sr], 256)]
+
+    # Faster playback without starting over
+    stream.rate = 2.0
+    stream.n_steps = 3
+    produced += [len(stream.process(block))
+                 for block in blocks(y[2 * sr:], 256)]
+    produced.append(len(stream.flush()))
+
+    assert stream.rate == 2.0
+    assert stream.n_steps == 3
+    assert np.isclose(sum(produced), 2 * sr + sr, rtol=0.05)
+
+    with pytest.raises(RuntimeError):
+        stream.process(y[:256])
+
+    stream.reset()
+    assert not stream.finished
+    stream.process(y[:256])
+    stream.close()
+
+    with pytest.raises(RuntimeError):
+        stream.process(y[:256])
+
+
+@requires_library
+def test_stream_split():
+    # Blocks longer than block_size are split
+    sr = 22050
+    y = np.random.randn(sr, 2)
+
+    with pyrubberband.RubberbandStream(sr, channels=2,
+                                       block_size=128) as stream:
+        y_s = np.concatenate([stream.process(y), stream.flush()])
+
+    assert y_s.dtype == y.dtype
+    assert np.isclose(len(y_s), sr, rtol=0.05)
+
+    with pytest.raises(ValueError):
+        stream.process(np.zeros((128, 3)))
+
+
+def test_stream_unavailable(monkeypatch):
+    monkeypatch.setattr(_librubberband, 'available', lambda: False)
+
+    with pytest.raises(RuntimeError):
+        pyrubberband.RubberbandStream(22050)
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(sr=0), dict(channels=0), dict(block_size=0), dict(rate=0),
+    dict(rbargs={'--duration': '2'}), dict(rbargs={'--tempo': '2'}),
+    dict(rbargs={'--realtime': ''})])
+def test_stream_bad_params(kwargs):
+    kwargs.setdefault('sr', 22050)
+    with pytest.raises(ValueError):
+        pyrubberband.RubberbandStream(**kwargs)